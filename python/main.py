@@ -21,10 +21,13 @@ from bokeh.io import curdoc
 from racepi_bokehapp.racepi_analysis import RacePiAnalysis
 
 DEFAULT_SQLITE_FILE = '/external/racepi_data/test.db'
+DEFAULT_CACHE_DIR = '/external/racepi_data/session_cache'
+# DBC file to decode CAN channels with, e.g. dbc/evora.dbc, None for the Focus RS converters
+DEFAULT_DBC_FILE = None
 
 if not os.path.exists(DEFAULT_SQLITE_FILE):
     raise IOError("Missing DB file: " + DEFAULT_SQLITE_FILE)
 
-curdoc().add_root(RacePiAnalysis(DEFAULT_SQLITE_FILE).widgets)
+curdoc().add_root(RacePiAnalysis(DEFAULT_SQLITE_FILE, DEFAULT_CACHE_DIR, DEFAULT_DBC_FILE).widgets)
 curdoc().title = "RacePI :: Analysis"
 
@@ -15,6 +15,7 @@
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
 
 from racepi.can.data import CanFrameValueExtractor, CanFrame
+from racepi.can.decode_plan import CanDecodePlan
 from math import pi
 
 # Focus RS Mk3 CAN converters
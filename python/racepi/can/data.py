@@ -17,6 +17,90 @@
 Decoding and transform tools for CAN frames.
 """
 
+import numpy as np
+
+CAN_PAYLOAD_WIDTH = 8
+# largest payload of a CAN FD frame
+CANFD_PAYLOAD_WIDTH = 64
+
+
+def can_payload_bytes(payload):
+    """
+    Get the raw bytes of a CAN payload. Payloads are stored as bytes, but
+    older databases contain strings of hexadecimal bytes.
+
+    :param payload: bytes or hex string
+    :return: payload as bytes
+    """
+    if isinstance(payload, str):
+        return bytes.fromhex(payload)
+    return bytes(payload)
+
+
+def can_payloads_to_array(payloads, width=CAN_PAYLOAD_WIDTH):
+    """
+    Pack a sequence of CAN payloads, e.g. the msg column of a session,
+    into an (N, width) uint8 array. Short payloads are zero padded at the
+    end, longer payloads are cut to the width.
+
+    :param payloads: sequence of bytes or hex strings
+    :param width: bytes per payload, CANFD_PAYLOAD_WIDTH keeps CAN FD payloads whole
+    :return: numpy array of shape (N, width)
+    """
+    packed = b"".join([can_payload_bytes(p)[:width].ljust(width, b'\x00') for p in payloads])
+    return np.frombuffer(packed, dtype=np.uint8).reshape(-1, width)
+
+
+class CanSample:
+    """
+    Raw CAN frame as received by a sensor handler. This is the value
+    half of a (timestamp, value) CAN sample and flows unchanged from the
+    handlers to the database and the DL1 writer.
+    """
+    __slots__ = ('timestamp', 'arbitration_id', 'dlc', 'payload', 'extended')
+
+    def __init__(self, timestamp, arbitration_id, dlc, payload, extended=False):
+        """
+        :param timestamp: receive time in seconds
+        :param arbitration_id: arbitration id as integer, without flag bits
+        :param dlc: data length code
+        :param payload: data bytes
+        :param extended: the frame has a 29-bit extended id
+        """
+        self.timestamp = timestamp
+        self.arbitration_id = arbitration_id
+        self.dlc = dlc
+        self.payload = payload
+        self.extended = extended
+
+    @staticmethod
+    def from_hex_string(timestamp, data):
+        """
+        Create sample from an ELM/STN style message: a 3 digit
+        hexadecimal 11-bit id followed by hexadecimal data bytes
+
+        :param timestamp: receive time in seconds
+        :param data: message string, e.g. "0850000ffff"
+        :raises: ValueError if the message cannot be parsed
+        """
+        if not data or len(data) < 5:
+            raise ValueError("Invalid can data: %s" % data)
+        payload = bytes.fromhex(data[3:])
+        return CanSample(timestamp, int(data[:3], 16), len(payload), payload)
+
+    def __reduce__(self):
+        # compact pickling for the handler pipe
+        return CanSample, (self.timestamp, self.arbitration_id, self.dlc, self.payload, self.extended)
+
+    def __eq__(self, other):
+        return isinstance(other, CanSample) and \
+            self.__reduce__()[1] == other.__reduce__()[1]
+
+    def __repr__(self):
+        return "CanSample(%r, %s, %d, %s)" % \
+            (self.timestamp, ("0x%08x" if self.extended else "0x%03x") % self.arbitration_id,
+             self.dlc, self.payload.hex())
+
 
 class CanFrameValueExtractor:
     """
@@ -80,6 +164,34 @@ class CanFrameValueExtractor:
             return self.transform(field)
         return self.a*(field+self.b) + self.c
 
+    def convert_frames(self, frames):
+        """
+        Convert many data frames at once. This is much faster than
+        calling convert_frame() per frame for whole sessions.
+
+        :param frames: (N, 8) uint8 array, or sequence of payloads as bytes or hex strings
+        :return: numpy array of N translated values
+        """
+        if not isinstance(frames, np.ndarray):
+            frames = can_payloads_to_array(frames)
+        if frames.ndim != 2 or frames.shape[1] < CAN_PAYLOAD_WIDTH:
+            raise ValueError("Frames must have shape (N, %d)" % CAN_PAYLOAD_WIDTH)
+        if self.start + self.len > CAN_PAYLOAD_WIDTH * 8:
+            raise ValueError("Field extends past the end of the frame")
+
+        # read each frame as one big endian 64-bit word, matching __get_field
+        words = np.ascontiguousarray(frames[:, :CAN_PAYLOAD_WIDTH], dtype=np.uint8)\
+            .view('>u8').ravel().astype(np.uint64)
+        shift = np.uint64(CAN_PAYLOAD_WIDTH * 8 - self.start - self.len)
+        mask = np.uint64((1 << self.len) - 1)
+        field = (words >> shift) & mask
+
+        if self.transform:
+            return np.array([self.transform(int(v)) for v in field])
+        if self.a == 1 and self.b == 0 and self.c == 0:
+            return field
+        return self.a*(field.astype(np.float64)+self.b) + self.c
+
 
 class CanFrame:
     """
@@ -90,7 +202,7 @@ class CanFrame:
     def __init__(self, arbitration_id, payload):
         """
         :param arbitration_id: hex string of arbId
-        :param payload: hex string of data payload
+        :param payload: hex string or bytes of data payload
         """
         self.arbId, self.payload = self.__from_message_strings(arbitration_id, payload)
 
@@ -102,7 +214,10 @@ class CanFrame:
 
         try:
             cid = bytearray.fromhex(arbitration_id)
-            data = bytearray.fromhex(str(payload))
+            if isinstance(payload, (bytes, bytearray, memoryview)):
+                data = bytearray(payload)
+            else:
+                data = bytearray.fromhex(str(payload))
             return cid, data
         except ValueError as ve:
             raise ValueError("(%s:%s)" % (arbitration_id, payload)) from ve
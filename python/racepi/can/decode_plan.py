@@ -0,0 +1,259 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Precompiled DBC decoding. A CanDecodePlan is built once from a DBC file
+and keeps, per arbitration id, only the signals that are actually used,
+with bit positions, scales and byte order worked out in advance.
+
+The same plan serves the DL1 feed, session exports and the analysis
+apps, which use get_channels() in place of the hand written Focus RS
+converters of racepi.can.
+
+Decoded values are always scaled numbers. Unlike cantools
+decode_message(), signals with a DBC value table (VAL_) are not mapped
+to their choice names, e.g. a gear signal decodes to 3 rather than
+'Third'. Look up choices in the cantools database when names are needed.
+"""
+
+import numpy as np
+
+from racepi.can.data import CAN_PAYLOAD_WIDTH, can_payloads_to_array
+
+
+class CanSignalDecoder:
+    """
+    Decoder for a single signal. Bit positions are precomputed relative
+    to a little endian or big endian integer read of the whole frame.
+    """
+
+    def __init__(self, name, start, length, byte_order, is_signed, scale, offset, frame_length):
+        """
+        :param name: signal name
+        :param start: DBC start bit
+        :param length: signal length in bits
+        :param byte_order: 'little_endian' or 'big_endian'
+        :param is_signed: true for two's complement signals
+        :param scale: physical value scale
+        :param offset: physical value offset
+        :param frame_length: message length in bytes
+        """
+        self.name = name
+        self.length = length
+        self.little_endian = byte_order == 'little_endian'
+        self.is_signed = is_signed
+        self.scale = scale
+        self.offset = offset
+        self.mask = (1 << length) - 1
+        self.sign_bit = 1 << (length - 1)
+        self.frame_length = max(CAN_PAYLOAD_WIDTH, frame_length)
+
+        if self.little_endian:
+            # start is the least significant bit
+            self.shift = start
+        else:
+            # start is the most significant bit, in DBC sawtooth numbering
+            msb = (start // 8) * 8 + (7 - start % 8)
+            self.shift = self.frame_length * 8 - msb - length
+        if self.shift < 0 or self.shift + length > self.frame_length * 8:
+            raise ValueError("Signal %s does not fit in frame" % name)
+
+    def decode_raw(self, little_word, big_word):
+        """
+        :param little_word: frame read as a little endian integer
+        :param big_word: frame read as a big endian integer
+        :return: physical signal value
+        """
+        field = ((little_word if self.little_endian else big_word) >> self.shift) & self.mask
+        if self.is_signed and field & self.sign_bit:
+            field -= self.mask + 1
+        return field * self.scale + self.offset
+
+    def decode_words(self, little_words, big_words):
+        """
+        Vectorised decode over 64-bit frame words
+        :return: numpy array of physical values
+        """
+        field = ((little_words if self.little_endian else big_words) >> np.uint64(self.shift)) & \
+            np.uint64(self.mask)
+        if self.is_signed:
+            field = field.astype(np.int64)
+            field[field >= self.sign_bit] -= self.mask + 1
+        return field * self.scale + self.offset
+
+
+class CanMessageDecoder:
+    """
+    Decodes the consumed signals of one arbitration id
+    """
+
+    def __init__(self, arbitration_id, frame_length, signals):
+        """
+        :param arbitration_id: arbitration id as integer
+        :param frame_length: message length in bytes
+        :param signals: list of CanSignalDecoder
+        """
+        self.arbitration_id = arbitration_id
+        self.frame_length = max(CAN_PAYLOAD_WIDTH, frame_length)
+        self.signals = signals
+
+    def decode(self, payload):
+        """
+        Decode a single frame
+
+        :param payload: data bytes
+        :return: dict of signal name to physical value
+        """
+        return dict(zip(self.signal_names(), self.decode_values(payload)))
+
+    def decode_values(self, payload):
+        """
+        Decode a single frame without building a dict
+
+        :param payload: data bytes
+        :return: list of physical values, in the order of self.signals
+        """
+        if len(payload) != self.frame_length:
+            payload = bytes(payload[:self.frame_length]).ljust(self.frame_length, b'\x00')
+        little_word = int.from_bytes(payload, 'little')
+        big_word = int.from_bytes(payload, 'big')
+        return [s.decode_raw(little_word, big_word) for s in self.signals]
+
+    def signal_names(self):
+        return [s.name for s in self.signals]
+
+    def decode_frames(self, frames, signal_names=None):
+        """
+        Decode many frames at once
+
+        :param frames: (N, 8) uint8 array, or sequence of payloads
+        :param signal_names: names of signals to decode, None for all signals
+        :return: dict of signal name to numpy array of physical values
+        """
+        if self.frame_length > CAN_PAYLOAD_WIDTH:
+            raise ValueError("Vectorised decoding supports classic CAN frames only")
+        if not isinstance(frames, np.ndarray):
+            frames = can_payloads_to_array(frames)
+        frames = np.ascontiguousarray(frames[:, :CAN_PAYLOAD_WIDTH], dtype=np.uint8)
+        little_words = frames.view('<u8').ravel().astype(np.uint64)
+        big_words = frames.view('>u8').ravel().astype(np.uint64)
+        return {s.name: s.decode_words(little_words, big_words) for s in self.signals
+                if signal_names is None or s.name in signal_names}
+
+
+class CanSignalConverter:
+    """
+    Decodes one signal of stored frames, with the convert_frames()
+    interface of CanFrameValueExtractor
+    """
+
+    def __init__(self, message_decoder, signal_name):
+        """
+        :param message_decoder: CanMessageDecoder of the signal's arbitration id
+        :param signal_name: DBC signal name
+        """
+        self.message_decoder = message_decoder
+        self.signal_name = signal_name
+
+    def convert_frames(self, frames):
+        """
+        :param frames: (N, 8) uint8 array, or sequence of payloads
+        :return: numpy array of physical values
+        """
+        return self.message_decoder.decode_frames(frames, (self.signal_name,))[self.signal_name]
+
+
+class CanDecodePlan:
+    """
+    Decoders for the consumed signals of each arbitration id. Frames
+    with no consumed signals are rejected with a single dict lookup.
+    """
+
+    def __init__(self, message_decoders):
+        """
+        :param message_decoders: list of CanMessageDecoder
+        """
+        self.decoders = {d.arbitration_id: d for d in message_decoders}
+
+    @staticmethod
+    def from_database(candb, signal_names=None):
+        """
+        Build plan from a loaded cantools database
+
+        :param candb: cantools database
+        :param signal_names: names of consumed signals, None for all signals
+        :return: CanDecodePlan
+        """
+        decoders = []
+        for m in candb.messages:
+            signals = [CanSignalDecoder(s.name, s.start, s.length, s.byte_order, s.is_signed,
+                                        s.scale, s.offset, m.length)
+                       for s in m.signals
+                       if (signal_names is None or s.name in signal_names)
+                       and not s.is_multiplexer and not s.multiplexer_ids]
+            if signals:
+                decoders.append(CanMessageDecoder(m.frame_id, m.length, signals))
+        return CanDecodePlan(decoders)
+
+    @staticmethod
+    def from_dbc_file(dbc_filename, signal_names=None):
+        """
+        Build plan from a DBC file
+
+        :param dbc_filename: path to DBC file
+        :param signal_names: names of consumed signals, None for all signals
+        :return: CanDecodePlan
+        """
+        import cantools
+        return CanDecodePlan.from_database(cantools.database.load_file(dbc_filename), signal_names)
+
+    def get(self, arbitration_id):
+        """
+        :param arbitration_id: arbitration id as integer
+        :return: CanMessageDecoder, or None if the id carries no consumed signals
+        """
+        return self.decoders.get(arbitration_id)
+
+    def decode(self, arbitration_id, payload):
+        """
+        Decode a single frame
+
+        :param arbitration_id: arbitration id as integer
+        :param payload: data bytes
+        :return: dict of signal name to physical value, None if no signals are consumed
+        """
+        d = self.decoders.get(arbitration_id)
+        if d is None:
+            return None
+        return d.decode(payload)
+
+    def arbitration_ids(self):
+        return list(self.decoders.keys())
+
+    def get_channels(self, channel_signals):
+        """
+        CAN channels of the analysis apps decoded by this plan. Channels
+        whose signal is not in the plan are left out.
+
+        :param channel_signals: dict of channel name to DBC signal name
+        :return: dict of channel name to (arbitration id, CanSignalConverter)
+        """
+        channels = {}
+        for arbitration_id, d in self.decoders.items():
+            names = d.signal_names()
+            for channel, signal_name in channel_signals.items():
+                if signal_name in names:
+                    channels[channel] = (arbitration_id, CanSignalConverter(d, signal_name))
+        return channels
@@ -0,0 +1,402 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Column store backend for the sensor logger, an alternative to the
+sqlite row tables with the same interface as DbHandler.
+
+Each session is a directory with one append-only file per sensor
+column. Samples are buffered and written as zlib compressed chunks, so
+the SD card sees a few large sequential writes instead of one btree
+update per row, and a single channel is read back without touching
+the others. A JSON catalog lists the sessions and their session_info.
+
+Layout:
+    <store>/catalog.json
+    <store>/<session id>/<sensor>.<column>.col
+
+A column file is a sequence of chunks, each a CHUNK_HEADER of sample
+count and compressed size followed by the compressed little endian
+values. A chunk cut short by a crash is ignored when reading.
+"""
+
+import json
+import os
+import struct
+import time
+import zlib
+from uuid import uuid1
+
+import numpy as np
+
+from racepi.can.data import CANFD_PAYLOAD_WIDTH, can_payloads_to_array
+from racepi.database.db_handler import gps_rows, imu_rows
+from racepi.database.session_statistics import SessionStatistics
+from racepi.sensor.data_utilities import uptime_helper
+
+COLUMN_STORE_VERSION = 2
+CATALOG_FILE = "catalog.json"
+CHUNK_HEADER = struct.Struct("<II")
+
+# a chunk is written once a sensor has buffered this many samples or seconds
+DEFAULT_CHUNK_SAMPLES = 8192
+DEFAULT_CHUNK_SECONDS = 5.0
+# zlib level, 1 is fast enough for the Pi at full CAN rate
+DEFAULT_COMPRESSION_LEVEL = 1
+
+# sensor: list of (column, dtype, values per sample)
+# CAN payloads are stored at the CAN FD width, the zero padding of
+# classic frames compresses to almost nothing
+SENSOR_COLUMNS = {
+    'gps': [(c, '<f8', 1) for c in
+            ('timestamp', 'lat', 'lon', 'alt', 'speed', 'track', 'epv', 'epx', 'epy')],
+    'imu': [(c, '<f8', 1) for c in
+            ('timestamp', 'r', 'p', 'y', 'x_accel', 'y_accel', 'z_accel', 'x_gyro', 'y_gyro', 'z_gyro')],
+    'can': [('timestamp', '<f8', 1), ('arbitration_id', '<u4', 1), ('extended', 'u1', 1), ('dlc', 'u1', 1),
+            ('payload', 'u1', CANFD_PAYLOAD_WIDTH)],
+}
+
+
+def gps_columns(gps_data):
+    """
+    :param gps_data: list of (time, gpsd TPV dict) samples
+    :return: list of column arrays in SENSOR_COLUMNS['gps'] order
+    """
+    # skip session id and the gpsd time string
+    rows = [r[1:2] + r[3:] for r in gps_rows(gps_data, None)]
+    return list(np.array(rows, dtype=np.float64).reshape(-1, len(SENSOR_COLUMNS['gps'])).T)
+
+
+def imu_columns(imu_data):
+    """
+    :param imu_data: list of (time, IMU dict) samples
+    :return: list of column arrays in SENSOR_COLUMNS['imu'] order
+    """
+    rows = [r[1:] for r in imu_rows(imu_data, None)]
+    return list(np.array(rows, dtype=np.float64).reshape(-1, len(SENSOR_COLUMNS['imu'])).T)
+
+
+def can_columns(can_data):
+    """
+    :param can_data: list of (time, CanSample) samples, frames without payload are skipped
+    :return: list of column arrays in SENSOR_COLUMNS['can'] order
+    """
+    samples = [(t, frame) for t, frame in can_data if frame.payload]
+    return [np.array([t for t, _ in samples], dtype=np.float64),
+            np.array([f.arbitration_id for _, f in samples], dtype=np.uint32),
+            np.array([f.extended for _, f in samples], dtype=np.uint8),
+            np.array([len(f.payload) for _, f in samples], dtype=np.uint8),
+            can_payloads_to_array([f.payload for _, f in samples], CANFD_PAYLOAD_WIDTH)]
+
+
+COLUMN_BUILDERS = {
+    'gps': gps_columns,
+    'imu': imu_columns,
+    'can': can_columns,
+}
+
+
+def column_file_name(sensor, column):
+    return "%s.%s.col" % (sensor, column)
+
+
+def write_chunk(f, values, compression_level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Append one chunk to an open column file
+
+    :param f: file opened for binary append
+    :param values: numpy array of the column dtype
+    :return: bytes written
+    """
+    data = zlib.compress(np.ascontiguousarray(values).tobytes(), compression_level)
+    f.write(CHUNK_HEADER.pack(len(values), len(data)))
+    f.write(data)
+    return CHUNK_HEADER.size + len(data)
+
+
+def read_column_file(path, dtype, width=1):
+    """
+    Read all complete chunks of a column file
+
+    :param path: column file
+    :param dtype: numpy dtype of the column
+    :param width: values per sample
+    :return: numpy array, of shape (N, width) if width > 1
+    """
+    chunks = []
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                break
+            count, size = CHUNK_HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                break  # incomplete chunk at the end of an interrupted session
+            values = np.frombuffer(zlib.decompress(data), dtype=dtype)
+            if len(values) != count * width:
+                raise ValueError("Corrupt chunk in %s" % path)
+            chunks.append(values)
+    values = np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype)
+    return values.reshape(-1, width) if width > 1 else values
+
+
+class ColumnSessionWriter:
+    """
+    Buffers the columns of one session and appends them to the column
+    files in chunks
+    """
+
+    def __init__(self, path, chunk_samples=DEFAULT_CHUNK_SAMPLES, chunk_seconds=DEFAULT_CHUNK_SECONDS,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL):
+        """
+        :param path: session directory
+        :param chunk_samples: buffered samples of a sensor that trigger a chunk write
+        :param chunk_seconds: buffered time of a sensor that triggers a chunk write
+        :param compression_level: zlib compression level
+        """
+        self.path = path
+        self.chunk_samples = chunk_samples
+        self.chunk_seconds = chunk_seconds
+        self.compression_level = compression_level
+        self.pending = {}
+        self.pending_samples = {}
+        self.pending_since = {}
+        self.files = {}
+        self.bytes_written = 0
+
+    def append(self, sensor, columns):
+        """
+        :param sensor: sensor name in SENSOR_COLUMNS
+        :param columns: list of column arrays, in SENSOR_COLUMNS order
+        """
+        count = len(columns[0])
+        if not count:
+            return
+        if sensor not in self.pending:
+            self.pending[sensor] = []
+            self.pending_samples[sensor] = 0
+            self.pending_since[sensor] = time.time()
+        self.pending[sensor].append(columns)
+        self.pending_samples[sensor] += count
+        if self.pending_samples[sensor] >= self.chunk_samples or \
+                time.time() - self.pending_since[sensor] >= self.chunk_seconds:
+            self.flush_sensor(sensor)
+
+    def flush_sensor(self, sensor):
+        batches = self.pending.pop(sensor, None)
+        self.pending_samples.pop(sensor, None)
+        self.pending_since.pop(sensor, None)
+        if not batches:
+            return
+        for i, (column, dtype, _) in enumerate(SENSOR_COLUMNS[sensor]):
+            f = self.files.get((sensor, column))
+            if f is None:
+                f = self.files[(sensor, column)] = open(os.path.join(self.path, column_file_name(sensor, column)), "ab")
+            values = np.concatenate([b[i] for b in batches]).astype(dtype, copy=False)
+            self.bytes_written += write_chunk(f, values, self.compression_level)
+            f.flush()
+
+    def flush(self):
+        for sensor in list(self.pending.keys()):
+            self.flush_sensor(sensor)
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            os.fsync(f.fileno())
+            f.close()
+        self.files.clear()
+
+
+class ColumnStoreHandler:
+    """
+    Class for handling RacePi access to a column store. This has the
+    interface of DbHandler, so it can be used by the SensorLogger and
+    BackgroundDbWriter in its place.
+    """
+
+    def __init__(self, store_path, chunk_samples=DEFAULT_CHUNK_SAMPLES, chunk_seconds=DEFAULT_CHUNK_SECONDS,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL):
+        """
+        :param store_path: store directory, created on connect if missing
+        :param chunk_samples: buffered samples of a sensor that trigger a chunk write
+        :param chunk_seconds: buffered time of a sensor that triggers a chunk write
+        :param compression_level: zlib compression level
+        """
+        self.store_path = store_path
+        self.chunk_samples = chunk_samples
+        self.chunk_seconds = chunk_seconds
+        self.compression_level = compression_level
+        self.catalog = None
+        self.writers = {}
+        # running statistics of sessions logged through this handler
+        self.session_statistics = {}
+
+    def connect(self):
+        os.makedirs(self.store_path, exist_ok=True)
+        self.catalog = read_catalog(self.store_path)
+
+    def __save_catalog(self):
+        path = os.path.join(self.store_path, CATALOG_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.catalog, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def get_new_session(self, session_id=None):
+        """
+        Create new session entry in the catalog
+        The session name includes the current system uptime.
+
+        :param session_id: id for the new session, a new UUID if not given
+        :return: session id as UUID
+        """
+        if self.catalog is None:
+            raise RuntimeError("Column store not connected")
+        session_id = session_id if session_id else str(uuid1())
+        os.makedirs(os.path.join(self.store_path, session_id), exist_ok=True)
+        self.catalog["sessions"][session_id] = {
+            "description": "Created by RacePi (uptime: %.0fs)" % uptime_helper(),
+            "session_info": None,
+        }
+        self.__save_catalog()
+        return session_id
+
+    def get_session_statistics(self, session_id):
+        """
+        :param session_id: id of current session
+        :return: SessionStatistics of data logged for the session
+        """
+        if session_id not in self.session_statistics:
+            self.session_statistics[session_id] = SessionStatistics(session_id)
+        return self.session_statistics[session_id]
+
+    def __get_writer(self, session_id):
+        writer = self.writers.get(session_id)
+        if writer is None:
+            if session_id not in self.catalog["sessions"]:
+                raise ValueError("Unknown session: %s" % session_id)
+            writer = self.writers[session_id] = ColumnSessionWriter(
+                os.path.join(self.store_path, session_id),
+                self.chunk_samples, self.chunk_seconds, self.compression_level)
+        return writer
+
+    def log_data_from_active_session(self, data, session_id):
+        """
+        Buffer recorded data and write full chunks to the column files
+
+        :param data: DataBuffer of recorded data
+        :param session_id: id of current session
+        """
+        if self.catalog is None:
+            raise RuntimeWarning("No column store connected")
+
+        writer = self.__get_writer(session_id)
+        statistics = self.get_session_statistics(session_id)
+        sources = data.get_available_sources()
+        for sensor, builder in COLUMN_BUILDERS.items():
+            if sensor in sources:
+                columns = builder(data.get_sensor_data(sensor))
+                writer.append(sensor, columns)
+                statistics.add_samples(sensor, len(columns[0]))
+                if sensor == 'gps':
+                    for t, speed in zip(columns[0].tolist(), columns[4].tolist()):
+                        statistics.add_gps_fix(t, speed)
+
+    def populate_session_info(self, session_id):
+        """
+        Write out buffered data of the session and record its statistics
+        in the catalog
+
+        :param session_id: The ID of the session
+        """
+        if not session_id:
+            return
+        if self.catalog is None:
+            raise RuntimeWarning("No column store connected")
+
+        writer = self.writers.pop(session_id, None)
+        if writer:
+            writer.close()
+        statistics = self.session_statistics.pop(session_id, None)
+        if statistics and statistics.is_complete() and session_id in self.catalog["sessions"]:
+            self.catalog["sessions"][session_id]["session_info"] = statistics.as_dict()
+            self.__save_catalog()
+
+    def close(self):
+        """
+        Write out buffered data of all sessions
+        """
+        for session_id in list(self.writers.keys()):
+            self.populate_session_info(session_id)
+
+
+def read_catalog(store_path):
+    """
+    :param store_path: store directory
+    :return: catalog dict, empty if the store has no catalog yet
+    """
+    try:
+        with open(os.path.join(store_path, CATALOG_FILE)) as f:
+            catalog = json.load(f)
+    except FileNotFoundError:
+        return {"version": COLUMN_STORE_VERSION, "sessions": {}}
+    if catalog.get("version") != COLUMN_STORE_VERSION:
+        raise ValueError("Column store version %s, expected %d" % (catalog.get("version"), COLUMN_STORE_VERSION))
+    return catalog
+
+
+class ColumnStoreReader:
+    """
+    Read access to sessions in a column store
+    """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.catalog = read_catalog(store_path)
+
+    def get_sessions(self):
+        """
+        :return: dict of session id to catalog entry
+        """
+        return self.catalog["sessions"]
+
+    def read_column(self, session_id, sensor, column):
+        """
+        :param session_id: session to read
+        :param sensor: sensor name in SENSOR_COLUMNS
+        :param column: column name
+        :return: numpy array, empty if the session has no data for the sensor
+        """
+        for name, dtype, width in SENSOR_COLUMNS[sensor]:
+            if name == column:
+                path = os.path.join(self.store_path, session_id, column_file_name(sensor, column))
+                if not os.path.exists(path):
+                    return np.zeros((0, width) if width > 1 else 0, dtype=dtype)
+                return read_column_file(path, dtype, width)
+        raise KeyError("%s has no column %s" % (sensor, column))
+
+    def read_sensor(self, session_id, sensor, columns=None):
+        """
+        :param session_id: session to read
+        :param sensor: sensor name in SENSOR_COLUMNS
+        :param columns: column names, all columns if None
+        :return: dict of column name to numpy array
+        """
+        if columns is None:
+            columns = [c[0] for c in SENSOR_COLUMNS[sensor]]
+        return {c: self.read_column(session_id, sensor, c) for c in columns}
@@ -0,0 +1,224 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Cache of derived session data, e.g. query results and downsampled plot
+series, for the analysis web apps.
+
+Entries are keyed by (session id, channel, params). Memory use is
+bounded in bytes, the least recently used entries are evicted first.
+Each session has a fingerprint of its data, e.g. the newest sample
+time; when it changes, all entries of the session are dropped. Entries
+can also be written to a directory so they survive restarts.
+"""
+
+import hashlib
+import os
+import pickle
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def estimate_size(value):
+    """
+    Estimate the memory held by a cached value. Arrays count their
+    buffers, containers are counted recursively.
+
+    :param value: cached value
+    :return: size in bytes
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes + sys.getsizeof(np.zeros(0))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _digest(value):
+    return hashlib.sha1(repr(value).encode()).hexdigest()
+
+
+class SessionDataCache:
+    """
+    Thread safe, byte bounded LRU cache of session data
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, persist_dir=None):
+        """
+        :param max_bytes: memory bound of cached values
+        :param persist_dir: directory to keep entries across restarts, None for memory only
+        """
+        self.max_bytes = max_bytes
+        self.persist_dir = persist_dir
+        self.entries = OrderedDict()
+        self.fingerprints = {}
+        self.lock = threading.Lock()
+
+        self.current_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(session_id, channel, params=()):
+        """
+        :param params: query parameters, a dict or sequence of values
+        :return: cache key
+        """
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        return str(session_id), channel, tuple(params)
+
+    def __disk_path(self, key):
+        return os.path.join(self.persist_dir, _digest(key[0]), _digest(key) + ".pickle")
+
+    def __insert(self, key, value):
+        # call with the lock held
+        size = estimate_size(value)
+        if key in self.entries:
+            self.current_bytes -= self.entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def __read_disk(self, key):
+        if not self.persist_dir:
+            return None
+        try:
+            with open(self.__disk_path(key), "rb") as f:
+                fingerprint, stored_key, value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        if stored_key != key or fingerprint != self.fingerprints.get(key[0]):
+            return None
+        return value,
+
+    def __write_disk(self, key, value):
+        if not self.persist_dir:
+            return
+        path = self.__disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "%s.tmp%d.%d" % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            pickle.dump((self.fingerprints.get(key[0]), key, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def get(self, session_id, channel, params=(), compute=None):
+        """
+        Look up an entry, computing and caching it on a miss. The value is
+        computed without holding the lock, so concurrent misses of the same
+        key may compute it twice.
+
+        :param session_id: session of the data
+        :param channel: name of the data, e.g. 'gps' or 'imu.x_accel'
+        :param params: query parameters the data depends on
+        :param compute: function returning the value, None to only look up
+        :return: cached or computed value, None on a miss without compute
+        """
+        key = self.make_key(session_id, channel, params)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        stored = self.__read_disk(key)
+        if stored is not None:
+            with self.lock:
+                self.disk_hits += 1
+                self.__insert(key, stored[0])
+            return stored[0]
+
+        with self.lock:
+            self.misses += 1
+        if compute is None:
+            return None
+        value = compute()
+        with self.lock:
+            self.__insert(key, value)
+        self.__write_disk(key, value)
+        return value
+
+    def validate(self, session_id, fingerprint):
+        """
+        Record the current fingerprint of a session's data, dropping its
+        entries if the data changed since they were cached
+
+        :param session_id: session to check
+        :param fingerprint: picklable value that changes with the data, e.g. the newest timestamp
+        :return: true if cached entries are still valid
+        """
+        session_id = str(session_id)
+        with self.lock:
+            if session_id not in self.fingerprints:
+                # entries on disk are checked against the fingerprint when read
+                self.fingerprints[session_id] = fingerprint
+                return True
+            if self.fingerprints[session_id] == fingerprint:
+                return True
+        self.invalidate(session_id)
+        with self.lock:
+            self.fingerprints[session_id] = fingerprint
+        return False
+
+    def invalidate(self, session_id):
+        """
+        Drop all entries of a session, in memory and on disk
+        """
+        session_id = str(session_id)
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == session_id]:
+                self.current_bytes -= self.entries.pop(key)[1]
+            self.fingerprints.pop(session_id, None)
+        if self.persist_dir:
+            shutil.rmtree(os.path.join(self.persist_dir, _digest(session_id)), ignore_errors=True)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.fingerprints.clear()
+            self.current_bytes = 0
+        if self.persist_dir:
+            shutil.rmtree(self.persist_dir, ignore_errors=True)
+
+    def get_metrics(self):
+        """
+        :return: dictionary of cache statistics
+        """
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
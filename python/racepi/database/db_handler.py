@@ -19,40 +19,111 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 
+from racepi.database.migrations import SCHEMA_VERSION
 from racepi.database.objects import *
+from racepi.database.session_statistics import SessionStatistics
 from racepi.sensor.data_utilities import uptime_helper
 
+# samples repeating the key of a logged sample are dropped, not failed
+GPS_INSERT = "INSERT OR IGNORE INTO gps_data (session_id, timestamp, time, lat, lon, alt, speed, track, epv, epx, epy) " \
+             "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+IMU_INSERT = "INSERT OR IGNORE INTO imu_data (session_id, timestamp, r, p, y, x_accel, y_accel, z_accel, " \
+             "x_gyro, y_gyro, z_gyro) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+CAN_INSERT = "INSERT OR IGNORE INTO can_data (session_id, timestamp, arbitration_id, rtr, msg) VALUES (?, ?, ?, ?, ?)"
+
+
+def gps_rows(gps_data, session_id):
+    """
+    Build gps_data rows, skipping samples with missing or invalid fields
+
+    :param gps_data: list of (time, gpsd TPV dict) samples
+    :param session_id: id of current session
+    :return: generator of row tuples matching GPS_INSERT
+    """
+    for t, data in gps_data:
+        try:
+            yield (session_id, t, data.get("time"),
+                   float(data.get("lat")), float(data.get("lon")), float(data.get("alt")),
+                   float(data.get("speed")), float(data.get("track")),
+                   data.get("epv"), data.get("epx"), data.get("epy"))
+        except (TypeError, ValueError):
+            pass  # skip invalid data
+
+
+def imu_rows(imu_data, session_id):
+    """
+    Build imu_data rows, skipping samples with missing or invalid fields
+
+    :param imu_data: list of (time, IMU dict) samples
+    :param session_id: id of current session
+    :return: generator of row tuples matching IMU_INSERT
+    """
+    for sample in imu_data:
+        try:
+            t, data = sample
+            row = (session_id, t) + tuple(map(float, data.get('fusionPose'))) + \
+                tuple(map(float, data.get('accel'))) + tuple(map(float, data.get('gyro')))
+        except (TypeError, ValueError):
+            continue  # skip invalid data
+        if len(row) == 11:
+            yield row
+
+
+def can_rows(can_data, session_id):
+    """
+    :param can_data: list of (time, CanSample) samples, frames without payload are skipped
+    :param session_id: id of current session
+    :return: generator of row tuples matching CAN_INSERT
+    """
+    for t, frame in can_data:
+        if frame.payload:
+            yield session_id, t, frame.arbitration_id, 0, bytes(frame.payload)
+
 
 class DbHandler:
     """
     Class for handling RacePi access to sqlite
     """
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, bulk_insert=True):
+        """
+        :param db_path: path to sqlite database file
+        :param bulk_insert: write logged data with executemany instead of ORM objects
+        """
         self.db_path = db_path
+        self.bulk_insert = bulk_insert
         self.db_session = None
+        # running statistics of sessions logged through this handler
+        self.session_statistics = {}
 
     def connect(self):
-        engine = create_engine('sqlite:///' + self.db_path)
+        # the session may be used from a single background writer thread
+        engine = create_engine('sqlite:///' + self.db_path,
+                               connect_args={'check_same_thread': False})
         Base.metadata.bind = engine
         sm = sessionmaker(bind=engine)
         self.db_session = sm()
         self.db_session.execute("PRAGMA foreign_keys = ON;")
         self.db_session.execute("PRAGMA journal_mode = WAL;")
+        version = self.db_session.execute("PRAGMA user_version;").scalar()
+        if version < SCHEMA_VERSION:
+            print("Warning: database schema version %d is older than %d, "
+                  "run utilities/upgrade_database.py" % (version, SCHEMA_VERSION))
         # TODO: ensure that the requested file exists and that
         # the required tables are here
 
-    def get_new_session(self):
+    def get_new_session(self, session_id=None):
         """
         Create new session entry in database
         The session name includes the current system uptime.
 
+        :param session_id: id for the new session, a new UUID if not given
         :return: session id as UUID
         """
         if not self.db_session:
             raise RuntimeError("Database not connected")
         s = Session()
-        s.id = str(uuid1())
+        s.id = session_id if session_id else str(uuid1())
         s.description = "Created by RacePi (uptime: %.0fs)" % uptime_helper()
         self.db_session.add(s)
         self.db_session.commit()
@@ -119,18 +190,16 @@ class DbHandler:
             raise RuntimeWarning("No database connected")
 
         for sample in can_data:
-            t, raw = sample
-            if len(raw) < 5:
-                raise RuntimeWarning("Invalid can data: ", raw)
+            t, frame = sample
+            if not frame.payload:
+                raise RuntimeWarning("Invalid can data: ", frame)
             else:
-                arb_id = raw[:3]
-                payload = raw[3:]
                 v = CANData()
                 v.timestamp = t
                 v.session_id = session_id
-                v.arbitration_id = int(arb_id, 16)
+                v.arbitration_id = frame.arbitration_id
                 v.rtr = 0
-                v.msg = payload
+                v.msg = frame.payload
                 self.db_session.add(v)
 
         self.db_session.commit()
@@ -180,6 +249,62 @@ class DbHandler:
 
         self.db_session.commit()
 
+    def get_session_statistics(self, session_id):
+        """
+        :param session_id: id of current session
+        :return: SessionStatistics of data logged for the session
+        """
+        if session_id not in self.session_statistics:
+            self.session_statistics[session_id] = SessionStatistics(session_id)
+        return self.session_statistics[session_id]
+
+    def insert_all_updates(self, data, session_id, statistics=None):
+        """
+        Write GPS, IMU and CAN data in a single transaction, with one
+        executemany per table over prebuilt row tuples. This skips the
+        ORM entirely.
+
+        :param data: DataBuffer of recorded data
+        :param session_id: id of current session
+        :param statistics: SessionStatistics to update once the data is committed
+        :return: number of rows written
+        """
+        if not self.db_session:
+            raise RuntimeWarning("No database connected")
+
+        sources = data.get_available_sources()
+        inserts = [
+            (GPS_INSERT, gps_rows, 'gps'),
+            (IMU_INSERT, imu_rows, 'imu'),
+            (CAN_INSERT, can_rows, 'can'),
+        ]
+        written = {}
+        gps_data = []
+        # the raw connection takes part in the session transaction
+        cursor = self.db_session.connection().connection.cursor()
+        try:
+            for statement, row_builder, source in inserts:
+                if source in sources:
+                    rows = list(row_builder(data.get_sensor_data(source), session_id))
+                    if rows:
+                        cursor.executemany(statement, rows)
+                        written[source] = cursor.rowcount
+                        if source == 'gps':
+                            gps_data = rows
+            cursor.close()
+            self.db_session.commit()
+        except Exception:
+            cursor.close()
+            self.db_session.rollback()
+            raise
+
+        if statistics:
+            for source, count in written.items():
+                statistics.add_samples(source, count)
+            for row in gps_data:
+                statistics.add_gps_fix(row[1], row[6])
+        return sum(written.values())
+
     def populate_session_info(self, session_id):
         """
         Populate the session info data with metadata from the
@@ -194,6 +319,18 @@ class DbHandler:
         if not self.db_session:
             raise RuntimeWarning("No database connected")
 
+        statistics = self.session_statistics.pop(session_id, None)
+        if statistics:
+            # the session was logged through this handler, no need to read it back
+            if statistics.is_complete():
+                si = self.db_session.query(SessionInfo).get(session_id)
+                if not si:
+                    si = SessionInfo()
+                    self.db_session.add(si)
+                statistics.populate(si)
+                self.db_session.commit()
+            return
+
         gps_data = self.db_session.query(GPSData).filter(GPSData.session_id == session_id).\
             order_by(GPSData.timestamp).all()
         imu_data_count = self.db_session.query(IMUData).filter(IMUData.session_id == session_id).\
@@ -216,7 +353,7 @@ class DbHandler:
             si.session_id = session_id
             si.num_data_samples = len(gps_data) + imu_data_count + can_data_count + tire_data_count
             si.start_time_utc = gps_data[0].timestamp
-            si.duration = gps_data[1].timestamp - gps_data[0].timestamp
+            si.duration = gps_data[-1].timestamp - gps_data[0].timestamp
             si.max_speed = max([x.speed for x in gps_data])
 
         self.db_session.commit()
@@ -228,8 +365,11 @@ class DbHandler:
         :param data: DataBuffer of recorded data
         :param session_id: id of current sessions
         """
-        # TODO: change do a single insert/transaction
-        # TODO: change this to a background thread
+        statistics = self.get_session_statistics(session_id)
+        if self.bulk_insert:
+            self.insert_all_updates(data, session_id, statistics)
+            return
+
         try:
             self.insert_gps_updates(data.get_sensor_data('gps'), session_id)
             self.insert_imu_updates(data.get_sensor_data('imu'), session_id)
@@ -238,3 +378,11 @@ class DbHandler:
             # self.db_handler.insert_tpms_updates(self.data.get_sensor_data('tpms'), self.session_id)
         except TypeError as te:
             print("Failed to insert data: %s" % te)
+            return
+
+        gps_data = list(gps_rows(data.get_sensor_data('gps'), session_id))
+        statistics.add_samples('gps', len(gps_data))
+        statistics.add_samples('imu', len(data.get_sensor_data('imu')))
+        statistics.add_samples('can', len(data.get_sensor_data('can')))
+        for row in gps_data:
+            statistics.add_gps_fix(row[1], row[6])
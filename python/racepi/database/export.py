@@ -0,0 +1,221 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Streaming export of a recorded session to CSV or Parquet.
+
+Each sensor table is read for one session in primary key order, CAN
+data once per arbitration id, and the cursors are merged by timestamp.
+Rows are written in chunks, so memory use does not depend on the
+session length. Decoded CAN signals are added as columns when a
+CanDecodePlan is given.
+"""
+
+import csv
+import io
+
+from racepi.can.data import can_payload_bytes
+from racepi.sensor.data_utilities import iter_ordered_log
+
+DEFAULT_CHUNK_ROWS = 5000
+
+# (column, type) of each exported table, type is one of float, int, str, bytes
+GPS_EXPORT_COLUMNS = [('time', 'str')] + [(c, 'float') for c in
+                                           ('lat', 'lon', 'alt', 'speed', 'track', 'epx', 'epy', 'epv')]
+IMU_EXPORT_COLUMNS = [(c, 'float') for c in
+                      ('r', 'p', 'y', 'x_accel', 'y_accel', 'z_accel', 'x_gyro', 'y_gyro', 'z_gyro')]
+CAN_EXPORT_COLUMNS = [('arbitration_id', 'int'), ('msg', 'bytes')]
+
+
+def _query(db, query, params):
+    cursor = db.cursor()
+    cursor.execute(query, params)
+    return cursor
+
+
+def _timestamped(cursor):
+    for row in cursor:
+        yield row[0], row[1:]
+
+
+def session_exists(db, session_id):
+    """
+    :param db: sqlite3 connection
+    :return: true if the session is in the sessions table
+    """
+    return _query(db, "SELECT 1 FROM sessions WHERE id=?", (session_id,)).fetchone() is not None
+
+
+def iter_session_samples(db, session_id):
+    """
+    Read all GPS, IMU and CAN samples of a session in time order
+
+    :param db: sqlite3 connection
+    :param session_id: session to read
+    :return: generator of (table, timestamp, values), values in the *_EXPORT_COLUMNS order
+    """
+    sources = {}
+    for table, columns in [('gps', GPS_EXPORT_COLUMNS), ('imu', IMU_EXPORT_COLUMNS)]:
+        sources[table] = _timestamped(_query(
+            db, "SELECT timestamp, %s FROM %s_data WHERE session_id=? ORDER BY timestamp" %
+                (", ".join(c[0] for c in columns), table), (session_id,)))
+
+    # each arbitration id is a range of the can_data key, merge them instead of sorting
+    arbitration_ids = [r[0] for r in _query(db, "SELECT DISTINCT arbitration_id FROM can_data WHERE session_id=?",
+                                            (session_id,))]
+    can_sources = {}
+    for arbitration_id in arbitration_ids:
+        can_sources[arbitration_id] = _timestamped(_query(
+            db, "SELECT timestamp, arbitration_id, msg FROM can_data WHERE session_id=? AND arbitration_id=? "
+                "ORDER BY timestamp", (session_id, arbitration_id)))
+    sources['can'] = ((t, values) for _, t, values in iter_ordered_log(can_sources))
+
+    return iter_ordered_log(sources)
+
+
+class SessionExporter:
+    """
+    Converts the samples of a session into flat export rows with one
+    column set for all tables. Columns of other tables are None.
+    """
+
+    def __init__(self, decode_plan=None):
+        """
+        :param decode_plan: CanDecodePlan for signal columns, None for raw CAN data only
+        """
+        self.decode_plan = decode_plan
+        self.signal_columns = []
+        # arbitration id: list of (signal index, export column)
+        self.__signal_index = {}
+        if decode_plan:
+            for arbitration_id in sorted(decode_plan.arbitration_ids()):
+                indices = []
+                for i, name in enumerate(decode_plan.get(arbitration_id).signal_names()):
+                    if name not in self.signal_columns:
+                        self.signal_columns.append(name)
+                    indices.append((i, self.signal_columns.index(name)))
+                self.__signal_index[arbitration_id] = indices
+
+        self.columns = [('timestamp', 'float'), ('type', 'str')] + GPS_EXPORT_COLUMNS + IMU_EXPORT_COLUMNS + \
+            CAN_EXPORT_COLUMNS + [(s, 'float') for s in self.signal_columns]
+        self.__offsets = {
+            'gps': 2,
+            'imu': 2 + len(GPS_EXPORT_COLUMNS),
+            'can': 2 + len(GPS_EXPORT_COLUMNS) + len(IMU_EXPORT_COLUMNS),
+        }
+        self.__signal_offset = self.__offsets['can'] + len(CAN_EXPORT_COLUMNS)
+
+    def column_names(self):
+        return [c[0] for c in self.columns]
+
+    def to_row(self, table, timestamp, values):
+        """
+        :param table: 'gps', 'imu' or 'can'
+        :param timestamp: sample timestamp
+        :param values: sample values in the *_EXPORT_COLUMNS order of the table
+        :return: list of export column values
+        """
+        row = [None] * len(self.columns)
+        row[0] = timestamp
+        row[1] = table.upper()
+        offset = self.__offsets[table]
+        row[offset:offset + len(values)] = values
+        if table == 'can':
+            payload = can_payload_bytes(values[1])
+            row[offset + 1] = payload
+            indices = self.__signal_index.get(values[0])
+            if indices:
+                decoded = self.decode_plan.get(values[0]).decode_values(payload)
+                for i, column in indices:
+                    row[self.__signal_offset + column] = decoded[i]
+        return row
+
+    def iter_rows(self, db, session_id):
+        """
+        :return: generator of export rows of a session, in time order
+        """
+        for table, timestamp, values in iter_session_samples(db, session_id):
+            yield self.to_row(table, timestamp, values)
+
+    def iter_csv(self, db, session_id, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Generate the CSV text of a session in chunks, e.g. for a
+        streamed HTTP response. Payloads are written as hex strings.
+
+        :param db: sqlite3 connection
+        :param session_id: session to export
+        :param chunk_rows: rows per chunk
+        :return: generator of CSV text chunks
+        """
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        header = self.column_names()
+        header[0] = '#' + header[0]
+        writer.writerow(header)
+        count = 0
+        for row in self.iter_rows(db, session_id):
+            writer.writerow([v.hex() if isinstance(v, bytes) else v for v in row])
+            count += 1
+            if count % chunk_rows == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    def write_csv(self, db, session_id, f, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        :param f: text file to write to
+        :return: number of chunks written
+        """
+        chunks = 0
+        for text in self.iter_csv(db, session_id, chunk_rows):
+            f.write(text)
+            chunks += 1
+        return chunks
+
+    def write_parquet(self, db, session_id, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Write a session to a Parquet file, one row group per chunk.
+        Requires pyarrow.
+
+        :param path: output file
+        :return: number of rows written
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export requires pyarrow") from e
+
+        types = {'float': pa.float64(), 'int': pa.int64(), 'str': pa.string(), 'bytes': pa.binary()}
+        schema = pa.schema([(name, types[t]) for name, t in self.columns])
+
+        def write_chunk(writer, rows):
+            arrays = [pa.array([r[i] for r in rows], type=schema.field(i).type) for i in range(len(self.columns))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+        count = 0
+        rows = []
+        with pq.ParquetWriter(path, schema) as writer:
+            for row in self.iter_rows(db, session_id):
+                rows.append(row)
+                if len(rows) == chunk_rows:
+                    write_chunk(writer, rows)
+                    count += len(rows)
+                    rows = []
+            if rows or not count:
+                write_chunk(writer, rows)
+                count += len(rows)
+        return count
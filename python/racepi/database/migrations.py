@@ -0,0 +1,163 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+In place schema upgrades for RacePi sqlite files. The schema version is
+kept in PRAGMA user_version; files created before versioning are
+version 0. The table definitions here match sql/schema.
+
+Version 1: all tables and columns of the current sensor set exist
+Version 2: telemetry tables keyed by (session_id, [arbitration_id,] timestamp)
+Version 3: session_info.distance
+"""
+
+import sqlite3
+
+SESSION_TABLES = [
+    ("sessions", "id BLOB UNIQUE PRIMARY KEY NOT NULL, description TEXT"),
+    ("session_info", "session_id BLOB UNIQUE PRIMARY KEY NOT NULL, start_time_utc DATETIME NOT NULL, "
+                     "duration DOUBLE, max_speed DOUBLE, num_data_samples INTEGER, distance DOUBLE, "
+                     "FOREIGN KEY(session_id) REFERENCES sessions(id)"),
+]
+
+# table name, columns, primary key
+TELEMETRY_TABLES = [
+    ("gps_data",
+     [("session_id", "BLOB NOT NULL"), ("timestamp", "DATETIME NOT NULL"), ("time", "VARCHAR"),
+      ("lat", "DOUBLE"), ("lon", "DOUBLE"), ("speed", "DOUBLE"), ("track", "DOUBLE"),
+      ("epx", "DOUBLE"), ("epy", "DOUBLE"), ("epv", "DOUBLE"), ("alt", "DOUBLE")],
+     ("session_id", "timestamp")),
+    ("imu_data",
+     [("session_id", "BLOB NOT NULL"), ("timestamp", "DATETIME NOT NULL"),
+      ("r", "DOUBLE"), ("p", "DOUBLE"), ("y", "DOUBLE"),
+      ("x_accel", "DOUBLE"), ("y_accel", "DOUBLE"), ("z_accel", "DOUBLE"),
+      ("x_gyro", "DOUBLE"), ("y_gyro", "DOUBLE"), ("z_gyro", "DOUBLE")],
+     ("session_id", "timestamp")),
+    ("can_data",
+     [("session_id", "BLOB NOT NULL"), ("timestamp", "DATETIME NOT NULL"),
+      ("arbitration_id", "integer NOT NULL"), ("rtr", "integer NOT NULL"), ("msg", "BLOB NOT NULL")],
+     ("session_id", "arbitration_id", "timestamp")),
+    ("tire_data",
+     [("session_id", "BLOB NOT NULL"), ("timestamp", "DATETIME NOT NULL"),
+      ("lf_pressure", "DOUBLE"), ("rf_pressure", "DOUBLE"), ("lr_pressure", "DOUBLE"), ("rr_pressure", "DOUBLE"),
+      ("lf_temp", "DOUBLE"), ("rf_temp", "DOUBLE"), ("lr_temp", "DOUBLE"), ("rr_temp", "DOUBLE"),
+      ("lf_sensor_battery", "integer"), ("rf_sensor_battery", "integer"),
+      ("lr_sensor_battery", "integer"), ("rr_sensor_battery", "integer")],
+     ("session_id", "timestamp")),
+]
+
+
+def get_schema_version(connection):
+    """
+    :param connection: sqlite3 connection
+    :return: schema version of the database file
+    """
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def get_table_columns(connection, table):
+    """
+    :return: list of column names, empty if the table does not exist
+    """
+    return [r[1] for r in connection.execute("PRAGMA table_info(%s)" % table)]
+
+
+def create_telemetry_table_sql(name, columns, key=None, without_rowid=False):
+    """
+    :param name: table name
+    :param columns: list of (column name, type) pairs
+    :param key: primary key column names, None for no primary key
+    :param without_rowid: store rows clustered by the primary key
+    :return: CREATE TABLE statement
+    """
+    definitions = ["%s %s" % c for c in columns]
+    if key:
+        definitions.append("PRIMARY KEY (%s)" % ", ".join(key))
+    definitions.append("FOREIGN KEY(session_id) REFERENCES sessions(id)")
+    sql = "CREATE TABLE %s (%s)" % (name, ", ".join(definitions))
+    if key and without_rowid:
+        sql += " WITHOUT ROWID"
+    return sql
+
+
+def _create_missing_tables(connection, without_rowid):
+    for name, columns in SESSION_TABLES:
+        connection.execute("CREATE TABLE IF NOT EXISTS %s (%s)" % (name, columns))
+    for name, columns, _ in TELEMETRY_TABLES:
+        existing = get_table_columns(connection, name)
+        if not existing:
+            connection.execute(create_telemetry_table_sql(name, columns))
+            continue
+        for column, column_type in columns:
+            if column not in existing:
+                connection.execute("ALTER TABLE %s ADD COLUMN %s %s" %
+                                   (name, column, column_type.replace(" NOT NULL", "")))
+
+
+def _add_telemetry_keys(connection, without_rowid):
+    for name, columns, key in TELEMETRY_TABLES:
+        names = ", ".join(c[0] for c in columns)
+        connection.execute(create_telemetry_table_sql(name + "_upgrade", columns, key, without_rowid))
+        # rows that share a key are repeated samples, keep the first
+        cursor = connection.execute("INSERT OR IGNORE INTO %s_upgrade (%s) SELECT %s FROM %s ORDER BY rowid" %
+                                    (name, names, names, name))
+        dropped = connection.execute("SELECT COUNT(*) FROM %s" % name).fetchone()[0] - cursor.rowcount
+        if dropped:
+            print("%s: dropped %d duplicate samples" % (name, dropped))
+        connection.execute("DROP TABLE %s" % name)
+        connection.execute("ALTER TABLE %s_upgrade RENAME TO %s" % (name, name))
+
+
+def _add_session_distance(connection, without_rowid):
+    if "distance" not in get_table_columns(connection, "session_info"):
+        connection.execute("ALTER TABLE session_info ADD COLUMN distance DOUBLE")
+
+
+# migration to each version, in order
+MIGRATIONS = [
+    _create_missing_tables,
+    _add_telemetry_keys,
+    _add_session_distance,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def upgrade_database(connection, without_rowid=True):
+    """
+    Bring a database up to SCHEMA_VERSION. Each version is applied in
+    its own transaction, so an interrupted upgrade leaves the file at
+    the last completed version.
+
+    :param connection: sqlite3 connection, not in a transaction
+    :param without_rowid: create keyed telemetry tables WITHOUT ROWID
+    :return: list of versions applied
+    """
+    applied = []
+    isolation_level = connection.isolation_level
+    connection.isolation_level = None  # explicit transactions only
+    try:
+        for version in range(get_schema_version(connection), SCHEMA_VERSION):
+            connection.execute("BEGIN")
+            try:
+                MIGRATIONS[version](connection, without_rowid)
+                connection.execute("PRAGMA user_version = %d" % (version + 1))
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+            applied.append(version + 1)
+    finally:
+        connection.isolation_level = isolation_level
+    return applied
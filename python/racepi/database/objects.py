@@ -18,10 +18,28 @@
 
 from sqlalchemy import Column, ForeignKey, Integer, String, Binary, BLOB, TEXT, DATETIME, REAL, VARCHAR
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
+
+from racepi.can.data import can_payload_bytes
 
 Base = declarative_base()
 
 
+class CanPayload(TypeDecorator):
+    """
+    CAN payload stored as a BLOB. Older databases stored the payload as a
+    string of hexadecimal bytes; those rows are converted when loaded.
+    """
+    impl = BLOB
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else can_payload_bytes(value)
+
+    def result_processor(self, dialect, coltype):
+        # the BLOB result processor rejects legacy text values, so skip it
+        return lambda value: None if value is None else can_payload_bytes(value)
+
+
 class Session(Base):
     __tablename__ = "sessions"
     id = Column(TEXT, primary_key=True, unique=True, nullable=False)
@@ -35,11 +53,13 @@ class SessionInfo(Base):
     duration = Column(REAL)
     max_speed = Column(REAL)
     num_data_samples = Column(Integer)
+    distance = Column(REAL)
 
 
 class IMUData(Base):
     __tablename__ = "imu_data"
-    session_id = Column(TEXT, ForeignKey("sessions.id"), nullable=False)
+    __table_args__ = {'sqlite_with_rowid': False}
+    session_id = Column(TEXT, ForeignKey("sessions.id"), nullable=False, primary_key=True)
     timestamp = Column(REAL, nullable=False, primary_key=True)
     r = Column(REAL)
     p = Column(REAL)
@@ -54,7 +74,8 @@ class IMUData(Base):
 
 class GPSData(Base):
     __tablename__ = "gps_data"
-    session_id = Column(TEXT, ForeignKey("sessions.id"), nullable=False)
+    __table_args__ = {'sqlite_with_rowid': False}
+    session_id = Column(TEXT, ForeignKey("sessions.id"), nullable=False, primary_key=True)
     timestamp = Column(REAL, primary_key=True, nullable=False)
     time = Column(VARCHAR)
     lat = Column(REAL)
@@ -69,16 +90,18 @@ class GPSData(Base):
 
 class CANData(Base):
     __tablename__ = "can_data"
-    session_id = Column(TEXT, ForeignKey("sessions.id"), nullable=False)
+    __table_args__ = {'sqlite_with_rowid': False}
+    session_id = Column(TEXT, ForeignKey("sessions.id"), nullable=False, primary_key=True)
+    arbitration_id = Column(Integer, nullable=False, primary_key=True)  # base (11bit) or extended (29bit)
     timestamp = Column(REAL, primary_key=True, nullable=False)
-    arbitration_id = Column(Integer, nullable=False)  # base (11bit) or extended (29bit)
     rtr = Column(Integer, nullable=False)  # 0 for data frames, 1 for data requests
-    msg = Column(TEXT, nullable=False)  # data payload, string of 8 hexidecimal bytes
+    msg = Column(CanPayload, nullable=False)  # data payload, raw bytes
 
 
 class TireData(Base):
     __tablename__ = "tire_data"
-    session_id = Column(TEXT, ForeignKey("sessions.id"), nullable=False)
+    __table_args__ = {'sqlite_with_rowid': False}
+    session_id = Column(TEXT, ForeignKey("sessions.id"), nullable=False, primary_key=True)
     timestamp = Column(REAL, primary_key=True, nullable=False)
     lf_pressure = Column(REAL)
     rf_pressure = Column(REAL)
@@ -0,0 +1,423 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Columnar cache of recorded sessions for the analysis apps. Each session
+is materialised once into a directory of .npy files, one per channel
+column, with a JSON manifest. Opening a cached session memory-maps the
+files, so it does not depend on the size of the sqlite database.
+
+Layout:
+    <cache dir>/<session id>/manifest.json
+    <cache dir>/<session id>/<channel>.<column>.npy
+
+Channels are 'gps', 'imu' and 'can.<name>' for each decoded CAN
+channel. Every channel has 'timestamp' and 'distance' columns, CAN
+channels have their decoded value in 'value'.
+
+Each channel is also stored at lower resolutions (PYRAMID_LEVELS), as
+<channel>@<factor>.<column>.npy files. A level of factor f has one
+sample per f samples of the channel: 'timestamp' is the time of the
+first sample of the bucket, and every other column is replaced by
+'<column>_min', '<column>_max' and '<column>_mean'. Plots of a long
+session start from a coarse level and only read full rate data when
+zoomed in.
+
+The manifest holds a fingerprint of the session's rows in the database.
+A session that is opened while it is still being recorded is rebuilt
+once its fingerprint no longer matches.
+"""
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from racepi.can import focus_rs_tps_converter, focus_rs_brake_pressure_converter, focus_rs_rpm_converter, \
+    focus_rs_steering_angle_converter, focus_rs_wheelspeed1_converter, focus_rs_wheelspeed2_converter, \
+    focus_rs_wheelspeed3_converter, focus_rs_wheelspeed4_converter
+from racepi.can.data import can_payloads_to_array
+from racepi.sensor.data_utilities import TimeToDistanceConverter
+
+CACHE_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+
+# telemetry tables whose rows make up the fingerprint of a session
+FINGERPRINT_TABLES = ("gps_data", "imu_data", "can_data")
+
+# samples per bucket of each pyramid level below full rate
+PYRAMID_LEVELS = (8, 64, 512)
+
+GPS_COLUMNS = ("speed", "track", "lat", "lon", "alt")
+IMU_COLUMNS = ("x_accel", "y_accel", "z_accel", "x_gyro", "y_gyro", "z_gyro")
+
+# channel name: (arbitration id, value converter)
+DEFAULT_CAN_CHANNELS = {
+    'tps': (128, focus_rs_tps_converter),
+    'b_pres': (531, focus_rs_brake_pressure_converter),
+    'rpm': (144, focus_rs_rpm_converter),
+    'steering': (16, focus_rs_steering_angle_converter),
+    'wheelspeed1': (400, focus_rs_wheelspeed1_converter),
+    'wheelspeed2': (400, focus_rs_wheelspeed2_converter),
+    'wheelspeed3': (400, focus_rs_wheelspeed3_converter),
+    'wheelspeed4': (400, focus_rs_wheelspeed4_converter),
+}
+
+# channel name: DBC signal name, for channels decoded by a CanDecodePlan
+DBC_CAN_CHANNELS = {
+    'tps': 'AcceleratorPosition',
+    'b_pres': 'BrakePedal',
+    'rpm': 'EngineSpeed',
+    'steering': 'SteeringAngle',
+}
+
+
+def session_cache_path(cache_dir, session_id):
+    """
+    :return: directory holding the cache of a session
+    """
+    return os.path.join(cache_dir, str(session_id))
+
+
+def session_fingerprint(db, session_id):
+    """
+    Fingerprint of the recorded data of a session, which changes while
+    the session is still being recorded
+
+    :param db: sqlite3 connection
+    :param session_id: session to fingerprint
+    :return: dict of table name to [row count, newest timestamp]
+    """
+    fingerprint = {}
+    for table in FINGERPRINT_TABLES:
+        count, newest = db.execute("SELECT COUNT(*), MAX(timestamp) FROM %s WHERE session_id=?" % table,
+                                   (session_id,)).fetchone()
+        fingerprint[table] = [count, newest]
+    return fingerprint
+
+
+def can_channel_ids(can_channels):
+    """
+    :param can_channels: dict of channel name to (arbitration id, converter)
+    :return: dict of channel name to arbitration id, as stored in the manifest
+    """
+    return {name: arbitration_id for name, (arbitration_id, _) in can_channels.items()}
+
+
+def is_session_cached(cache_dir, session_id, fingerprint=None, can_channels=None):
+    """
+    :param fingerprint: session_fingerprint() of the database, None to skip the check
+    :param can_channels: CAN channels the cache must have been built with, None to skip the check
+    :return: true if a complete cache of the current version exists for the session and matches the fingerprint
+    """
+    try:
+        with open(os.path.join(session_cache_path(cache_dir, session_id), MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if manifest.get("version") != CACHE_VERSION:
+        return False
+    if can_channels is not None and manifest.get("can_channels") != can_channel_ids(can_channels):
+        return False
+    return fingerprint is None or manifest.get("fingerprint") == fingerprint
+
+
+def _query_columns(db, query, params, num_columns):
+    rows = db.execute(query, params).fetchall()
+    return np.array(rows, dtype=np.float64).reshape(-1, num_columns)
+
+
+def read_session_channels(db, session_id, can_channels=None):
+    """
+    Read and decode all channels of a session from a RacePi database
+
+    :param db: sqlite3 connection
+    :param session_id: session to read
+    :param can_channels: dict of channel name to (arbitration id, converter), DEFAULT_CAN_CHANNELS if None
+    :return: dict of channel name to dict of column name to numpy array
+    """
+    if can_channels is None:
+        can_channels = DEFAULT_CAN_CHANNELS
+    channels = {}
+
+    gps = _query_columns(db, "SELECT timestamp, %s FROM gps_data WHERE session_id=? ORDER BY timestamp" %
+                         ", ".join(GPS_COLUMNS), (session_id,), len(GPS_COLUMNS) + 1)
+    channels['gps'] = dict(zip(("timestamp",) + GPS_COLUMNS, gps.T))
+
+    imu = _query_columns(db, "SELECT timestamp, %s FROM imu_data WHERE session_id=? ORDER BY timestamp" %
+                         ", ".join(IMU_COLUMNS), (session_id,), len(IMU_COLUMNS) + 1)
+    channels['imu'] = dict(zip(("timestamp",) + IMU_COLUMNS, imu.T))
+
+    # query each arbitration id once, several channels may share it
+    frames = {}
+    for name, (arbitration_id, converter) in sorted(can_channels.items()):
+        if arbitration_id not in frames:
+            rows = db.execute("SELECT timestamp, msg FROM can_data WHERE session_id=? AND arbitration_id=? "
+                              "ORDER BY timestamp", (session_id, arbitration_id)).fetchall()
+            timestamps = np.array([r[0] for r in rows], dtype=np.float64)
+            frames[arbitration_id] = timestamps, can_payloads_to_array([r[1] for r in rows])
+        timestamps, payloads = frames[arbitration_id]
+        values = converter.convert_frames(payloads) if len(payloads) else np.zeros(0)
+        channels['can.' + name] = {'timestamp': timestamps, 'value': np.asarray(values, dtype=np.float64)}
+
+    # distance along the session, from GPS speed
+    gps_times = channels['gps']['timestamp']
+    tdc = None
+    if len(gps_times) >= 2:
+        tdc = TimeToDistanceConverter.from_arrays(gps_times, channels['gps']['speed'])
+    for columns in channels.values():
+        if tdc:
+            columns['distance'] = tdc.generate_distance_trace(columns['timestamp'])
+        else:
+            columns['distance'] = np.full(len(columns['timestamp']), np.nan)
+    return channels
+
+
+def aggregate_level(columns, factor):
+    """
+    Aggregate channel columns into buckets of factor samples. The last
+    bucket may be partial.
+
+    :param columns: dict of column name to numpy array, with a 'timestamp' column
+    :param factor: samples per bucket
+    :return: dict of level column name to numpy array
+    """
+    n = len(columns['timestamp'])
+    starts = np.arange(0, n, factor)
+    counts = np.diff(np.append(starts, n))
+    level = {'timestamp': columns['timestamp'][starts]}
+    for column, values in columns.items():
+        if column == 'timestamp':
+            continue
+        level[column + "_min"] = np.minimum.reduceat(values, starts)
+        level[column + "_max"] = np.maximum.reduceat(values, starts)
+        level[column + "_mean"] = np.add.reduceat(values, starts) / counts
+    return level
+
+
+def write_session_cache(db, session_id, cache_dir, can_channels=None):
+    """
+    Materialise a session into cache_dir, replacing any existing cache
+    of the session. Files are written to a temporary directory that is
+    renamed into place, so readers never see a partial cache.
+
+    :param db: sqlite3 connection
+    :param session_id: session to cache
+    :param cache_dir: cache root directory, created if missing
+    :param can_channels: dict of channel name to (arbitration id, converter), DEFAULT_CAN_CHANNELS if None
+    :return: path of the session cache
+    """
+    if can_channels is None:
+        can_channels = DEFAULT_CAN_CHANNELS
+    # taken before reading, rows added meanwhile cause a rebuild on the next open
+    fingerprint = session_fingerprint(db, session_id)
+    channels = read_session_channels(db, session_id, can_channels)
+
+    path = session_cache_path(cache_dir, session_id)
+    tmp_path = "%s.tmp%d" % (path, os.getpid())
+    os.makedirs(tmp_path)
+    try:
+        manifest = {"version": CACHE_VERSION, "session_id": str(session_id), "created": time.time(),
+                    "fingerprint": fingerprint, "can_channels": can_channel_ids(can_channels), "channels": {}}
+        for name, columns in channels.items():
+            for column, values in columns.items():
+                np.save(os.path.join(tmp_path, "%s.%s.npy" % (name, column)), values)
+            manifest["channels"][name] = {"length": len(columns['timestamp']), "columns": list(columns.keys()),
+                                          "levels": {}}
+            for factor in PYRAMID_LEVELS:
+                level = aggregate_level(columns, factor)
+                for column, values in level.items():
+                    np.save(os.path.join(tmp_path, "%s@%d.%s.npy" % (name, factor, column)), values)
+                manifest["channels"][name]["levels"][str(factor)] = {"length": len(level['timestamp']),
+                                                                     "columns": list(level.keys())}
+        with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=1)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return path
+
+
+class SessionCache:
+    """
+    Read access to a cached session. Columns are memory-mapped read-only
+    and only touched pages are read from disk.
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+        """
+        :param path: session cache directory
+        :param mmap_mode: numpy mmap mode, None to read columns into memory
+        :raises: ValueError if the cache is missing or of another version
+        """
+        self.path = path
+        self.mmap_mode = mmap_mode
+        try:
+            with open(os.path.join(path, MANIFEST_FILE)) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError("No session cache in %s" % path) from e
+        if self.manifest.get("version") != CACHE_VERSION:
+            raise ValueError("Session cache version %s, expected %d" % (self.manifest.get("version"), CACHE_VERSION))
+
+    @staticmethod
+    def open(cache_dir, session_id, mmap_mode='r'):
+        return SessionCache(session_cache_path(cache_dir, session_id), mmap_mode)
+
+    @property
+    def session_id(self):
+        return self.manifest["session_id"]
+
+    def channels(self):
+        """
+        :return: list of channel names
+        """
+        return list(self.manifest["channels"].keys())
+
+    def columns(self, channel, level=1):
+        """
+        :param channel: channel name
+        :param level: pyramid level factor, 1 for full rate
+        :return: list of column names of a channel
+        """
+        return list(self.__level_info(channel, level)["columns"])
+
+    def levels(self, channel):
+        """
+        :return: pyramid level factors of a channel, 1 for full rate first
+        """
+        return [1] + sorted(int(f) for f in self.manifest["channels"][channel].get("levels", {}))
+
+    def length(self, channel, level=1):
+        """
+        :return: number of samples of a channel at a pyramid level
+        """
+        return self.__level_info(channel, level)["length"]
+
+    def __level_info(self, channel, level):
+        info = self.manifest["channels"][channel]
+        if level == 1:
+            return info
+        try:
+            return info["levels"][str(level)]
+        except KeyError:
+            raise KeyError("%s has no level %s" % (channel, level))
+
+    def get_column(self, channel, column, level=1):
+        """
+        :param channel: channel name
+        :param column: column name, e.g. 'speed' or at a pyramid level 'speed_max'
+        :param level: pyramid level factor, 1 for full rate
+        :return: numpy array, memory-mapped unless mmap_mode is None
+        :raises: KeyError for unknown channels, columns or levels
+        """
+        if column not in self.__level_info(channel, level)["columns"]:
+            raise KeyError("%s has no column %s" % (channel, column))
+        name = channel if level == 1 else "%s@%d" % (channel, level)
+        return np.load(os.path.join(self.path, "%s.%s.npy" % (name, column)), mmap_mode=self.mmap_mode)
+
+    def get(self, channel, columns=None, level=1):
+        """
+        :param channel: channel name
+        :param columns: column names, all columns if None
+        :param level: pyramid level factor, 1 for full rate
+        :return: dict of column name to numpy array
+        """
+        if columns is None:
+            columns = self.columns(channel, level)
+        return {c: self.get_column(channel, c, level) for c in columns}
+
+    def select_level(self, channel, start=None, stop=None, max_points=None):
+        """
+        Find the finest pyramid level that shows a time range of a
+        channel in at most max_points samples. Only the timestamps of the
+        coarsest level are read to count the samples in range.
+
+        :param channel: channel name
+        :param start: start time, None for the start of the session
+        :param stop: stop time, None for the end of the session
+        :param max_points: sample budget, None for full rate
+        :return: pyramid level factor
+        """
+        levels = self.levels(channel)
+        if not max_points:
+            return 1
+        coarsest = levels[-1]
+        timestamps = self.get_column(channel, 'timestamp', coarsest)
+        first = np.searchsorted(timestamps, start, side='right') - 1 if start is not None else 0
+        last = np.searchsorted(timestamps, stop, side='right') if stop is not None else len(timestamps)
+        # upper bound of full rate samples in range
+        samples = max(0, last - max(first, 0)) * coarsest
+        for level in levels:
+            if samples / level <= max_points:
+                return level
+        return coarsest
+
+    def get_range(self, channel, start=None, stop=None, max_points=None, columns=None):
+        """
+        Read a time range of a channel at the finest level that fits in
+        max_points samples
+
+        :param channel: channel name
+        :param start: start time, None for the start of the session
+        :param stop: stop time, None for the end of the session
+        :param max_points: sample budget, None for full rate
+        :param columns: column names at the selected level, all if None
+        :return: (level factor, dict of column name to numpy array)
+        """
+        level = self.select_level(channel, start, stop, max_points)
+        timestamps = self.get_column(channel, 'timestamp', level)
+        # include the bucket that contains start
+        first = max(0, np.searchsorted(timestamps, start, side='right') - 1) if start is not None else 0
+        last = np.searchsorted(timestamps, stop, side='right') if stop is not None else len(timestamps)
+        data = self.get(channel, columns, level)
+        return level, {c: v[first:last] for c, v in data.items()}
+
+    def to_dataframe(self, channel, columns=None, level=1):
+        """
+        :param channel: channel name
+        :param columns: column names besides timestamp, all columns if None
+        :param level: pyramid level factor, 1 for full rate
+        :return: pandas DataFrame indexed by timestamp
+        """
+        import pandas as pd
+        data = self.get(channel, columns if columns is None else ['timestamp'] + list(columns), level)
+        timestamps = data.pop('timestamp')
+        return pd.DataFrame(data, index=pd.Index(timestamps, name='timestamp'))
+
+
+def get_session_cache(db, session_id, cache_dir, can_channels=None):
+    """
+    Open the cache of a session, building it first if it is missing,
+    was built with other CAN channels, or the session's data changed
+    since it was built
+
+    :param db: sqlite3 connection
+    :param session_id: session to open
+    :param cache_dir: cache root directory
+    :param can_channels: dict of channel name to (arbitration id, converter), DEFAULT_CAN_CHANNELS if None
+    :return: SessionCache
+    """
+    if can_channels is None:
+        can_channels = DEFAULT_CAN_CHANNELS
+    if not is_session_cached(cache_dir, session_id, session_fingerprint(db, session_id), can_channels):
+        write_session_cache(db, session_id, cache_dir, can_channels)
+    return SessionCache.open(cache_dir, session_id)
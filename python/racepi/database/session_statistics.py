@@ -0,0 +1,99 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Running statistics of a recording session, updated as data is logged so
+that session_info can be written without reading the session back.
+"""
+
+from collections import defaultdict
+
+# sessions need more GPS fixes than this for their statistics to be useful
+MIN_GPS_FIXES = 2
+
+
+class SessionStatistics:
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.sample_counts = defaultdict(int)
+        self.gps_fixes = 0
+        self.start_time = None
+        self.stop_time = None
+        self.max_speed = None
+        self.distance = 0.0
+
+    def add_samples(self, source, count):
+        """
+        :param source: sensor source name, e.g. 'can'
+        :param count: number of samples written for the source
+        """
+        self.sample_counts[source] += count
+
+    def add_gps_fix(self, timestamp, speed):
+        """
+        Update time range, speed and distance with a GPS fix. Distance is
+        integrated from speed, the same way as TimeToDistanceConverter.
+        Fixes must be added in time order.
+
+        :param timestamp: fix timestamp
+        :param speed: speed in m/s
+        """
+        if self.start_time is None:
+            self.start_time = timestamp
+        elif timestamp > self.stop_time:
+            self.distance += (timestamp - self.stop_time) * speed
+        else:
+            return  # repeated or out of order fix
+        self.stop_time = timestamp
+        self.gps_fixes += 1
+        if self.max_speed is None or speed > self.max_speed:
+            self.max_speed = speed
+
+    @property
+    def num_data_samples(self):
+        return sum(self.sample_counts.values())
+
+    @property
+    def duration(self):
+        return self.stop_time - self.start_time if self.start_time is not None else 0.0
+
+    def is_complete(self):
+        """
+        :return: true if there is enough data for a session_info entry
+        """
+        return self.gps_fixes > MIN_GPS_FIXES
+
+    def as_dict(self):
+        """
+        :return: dict of session_info column to value
+        """
+        return {
+            'session_id': self.session_id,
+            'num_data_samples': self.num_data_samples,
+            'start_time_utc': self.start_time,
+            'duration': self.duration,
+            'max_speed': self.max_speed,
+            'distance': self.distance,
+        }
+
+    def populate(self, session_info):
+        """
+        Copy statistics to a SessionInfo object
+
+        :param session_info: SessionInfo
+        """
+        for column, value in self.as_dict().items():
+            setattr(session_info, column, value)
@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
 
+import sqlite3
 from datetime import datetime
 from sqlalchemy import create_engine
 
@@ -25,15 +26,29 @@ from bokeh.palettes import Blues4, Reds4
 from bokeh.plotting import figure
 from scipy.signal import savgol_filter
 
-from racepi_can_decoder import *
+from racepi.can import *
+from racepi.database.session_cache import get_session_cache, DEFAULT_CAN_CHANNELS, DBC_CAN_CHANNELS
 from racepi.sensor.data_utilities import TimeToDistanceConverter
 
 RACEPI_MAP_SIZE = 600
+# samples per channel on the initial load of a cached session
+MAX_CHANNEL_POINTS = 10000
 
 
 class RacePiDBSession:
 
-    def __init__(self, db_location):
+    def __init__(self, db_location, cache_dir=None, dbc_filename=None):
+        """
+        :param db_location: path to sqlite database file
+        :param cache_dir: session cache directory, None to always read the database
+        :param dbc_filename: DBC file to decode CAN channels with, None for the Focus RS converters
+        """
+        self.db_location = db_location
+        self.cache_dir = cache_dir
+        if dbc_filename:
+            self.can_channels = CanDecodePlan.from_dbc_file(dbc_filename).get_channels(DBC_CAN_CHANNELS)
+        else:
+            self.can_channels = DEFAULT_CAN_CHANNELS
         self.db = create_engine("sqlite:///" + db_location)
         # TODO: sanity check that expected tables exist
 
@@ -62,10 +77,22 @@ class RacePiDBSession:
             ("can_data", session_id, arbitration_id)
         data = pd.read_sql_query(query, self.db, index_col='timestamp')
 
-        data['result'] = [value_converter.convert_frame(CanFrame('999', x)) for x in data.msg.tolist()]
+        data['result'] = value_converter.convert_frames(data.msg.tolist())
         data['distance'] = time_distance_converter.generate_distance_trace(data.index)
         return data
 
+    def get_cached_session(self, session_id):
+        """
+        :return: SessionCache of the session, built on first use, None without a cache directory
+        """
+        if not self.cache_dir:
+            return None
+        db = sqlite3.connect(self.db_location)
+        try:
+            return get_session_cache(db, session_id, self.cache_dir, self.can_channels)
+        finally:
+            db.close()
+
 
 class RunView:
 
@@ -91,13 +118,30 @@ class RacePiAnalysis:
         if not dataframe.empty:
             dataframe.index = dataframe.index - t0
 
-    def load_data(self, session_info, v):
+    @staticmethod
+    def load_cached_channel(cache, channel, columns):
         """
-
-        :param session_info:
-        :param v: view
+        Load a channel at the finest pyramid level within MAX_CHANNEL_POINTS,
+        using bucket means below full rate
         """
-        session_id = session_info[0]
+        level = cache.select_level(channel, max_points=MAX_CHANNEL_POINTS)
+        if level == 1:
+            return cache.to_dataframe(channel, columns)
+        data = cache.to_dataframe(channel, [c + '_mean' for c in columns], level)
+        data.columns = columns
+        return data
+
+    def load_cached_data(self, cache):
+        gps_data = self.load_cached_channel(cache, 'gps', ['speed', 'track', 'lat', 'lon', 'distance'])
+        gps_data = gps_data[gps_data.speed > 0.25]
+        imu_data = self.load_cached_channel(cache, 'imu', ['x_accel', 'y_accel', 'z_accel', 'distance'])
+        can_channels = {}
+        for c in self.db.can_channels:
+            can_channels[c] = self.load_cached_channel(cache, 'can.' + c, ['value', 'distance'])\
+                .rename(columns={'value': 'result'})
+        return gps_data, imu_data, can_channels
+
+    def load_database_data(self, session_id):
         gps_data = self.db.get_gps_data(session_id)
         imu_data = self.db.get_imu_data(session_id)
         tdc = TimeToDistanceConverter(list(zip(gps_data.index, gps_data['speed'])))
@@ -106,17 +150,26 @@ class RacePiAnalysis:
 
         try:
             can_channels = {
-                 'tps': self.db.get_and_transform_can_data(session_id, 128, focus_rs_tps_converter, tdc),
-                 'b_pres': self.db.get_and_transform_can_data(session_id, 531, focus_rs_brake_pressure_converter, tdc),
-                 'rpm': self.db.get_and_transform_can_data(session_id, 144, focus_rs_rpm_converter, tdc),
-                 'wheelspeed1': self.db.get_and_transform_can_data(session_id, 400, focus_rs_wheelspeed1_converter, tdc),
-                 'wheelspeed2': self.db.get_and_transform_can_data(session_id, 400, focus_rs_wheelspeed2_converter, tdc),
-                 'wheelspeed3': self.db.get_and_transform_can_data(session_id, 400, focus_rs_wheelspeed3_converter, tdc),
-                 'wheelspeed4': self.db.get_and_transform_can_data(session_id, 400, focus_rs_wheelspeed4_converter, tdc)
+                c: self.db.get_and_transform_can_data(session_id, arbitration_id, converter, tdc)
+                for c, (arbitration_id, converter) in self.db.can_channels.items()
             }
         except ValueError as e:
             print("Error loading can channels: " + str(e))
             can_channels = {}
+        return gps_data, imu_data, can_channels
+
+    def load_data(self, session_info, v):
+        """
+
+        :param session_info:
+        :param v: view
+        """
+        session_id = session_info[0]
+        cache = self.db.get_cached_session(session_id)
+        if cache:
+            gps_data, imu_data, can_channels = self.load_cached_data(cache)
+        else:
+            gps_data, imu_data, can_channels = self.load_database_data(session_id)
 
         # find first time vehicle moved
         t0 = gps_data.index[0]
@@ -147,8 +200,8 @@ class RacePiAnalysis:
         v.stats.text = str(gps_data.describe())
         v.details.text = "duration:%.0f\nVmax:%.0f\nsamples:%d" % session_info[2:5]
 
-    def __init__(self, db_location):
-        self.db = RacePiDBSession(db_location)
+    def __init__(self, db_location, cache_dir=None, dbc_filename=None):
+        self.db = RacePiDBSession(db_location, cache_dir, dbc_filename)
         self.sessions = {"%s:%.0f" % (datetime.fromtimestamp(s[1]).isoformat(), s[2]): s for s in self.db.get_sessions()}
 
         self.primary_view = pv = RunView()
@@ -14,15 +14,19 @@
 # You should have received a copy of the GNU General Public License
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
 
-from functools import lru_cache
-
-from .plotly_helpers import get_scatterplot
+from .plotly_helpers import get_scatterplot, get_plot_data, get_xy_combined_plot, sfl, \
+    session_data_cache, DEFAULT_PLOT_WIDTH, DEFAULT_DOWNSAMPLE_METHOD
 from flask import Flask, jsonify, request, Response, abort
 from plotly import graph_objs as pgo
 from plotly import tools
+import numpy as np
 import pandas as pd
-from racepi_can_decoder import *
-from racepi_database_handler import *
+from racepi.can import *
+from racepi.can.data import can_payloads_to_array
+from racepi.database import *
+from racepi.database.export import SessionExporter, session_exists
+from racepi.database.session_cache import get_session_cache, DEFAULT_CAN_CHANNELS, DBC_CAN_CHANNELS
+from racepi.sensor.data_utilities import DOWNSAMPLE_METHODS
 from sqlalchemy.orm import sessionmaker
 
 app = Flask(__name__)
@@ -43,15 +47,107 @@ def get_orm_session():
     return sm()
 
 
-def get_and_transform_can_data(session_id, arbitration_id, value_converter):
-    s = get_orm_session()
+# CAN signals of the webapp, name: (arbitration id, value converter)
+CAN_SIGNALS = {
+    'tps': (128, focus_rs_tps_converter),
+    'rpm': (144, focus_rs_rpm_converter),
+    'brake': (531, focus_rs_brake_pressure_converter),
+    'steering': (16, focus_rs_steering_angle_converter),
+}
+
+# DBC signal of each webapp CAN signal, decoded with app.can_decode_plan when set
+CAN_SIGNAL_DBC_NAMES = {
+    'tps': 'AcceleratorPosition',
+    'rpm': 'EngineSpeed',
+    'brake': 'BrakePedal',
+    'steering': 'SteeringAngle',
+}
+
+
+def get_can_signals():
+    """
+    :return: dict of webapp CAN signal name to (arbitration id, value converter)
+    """
+    plan = getattr(app, 'can_decode_plan', None)
+    if plan:
+        return plan.get_channels(CAN_SIGNAL_DBC_NAMES)
+    return CAN_SIGNALS
+
+
+def get_session_cache_channels():
+    """
+    :return: CAN channels of session caches, see racepi.database.session_cache
+    """
+    plan = getattr(app, 'can_decode_plan', None)
+    if plan:
+        return plan.get_channels(DBC_CAN_CHANNELS)
+    return DEFAULT_CAN_CHANNELS
+
+
+def read_can_frames(session_id, arbitration_id):
+    """
+    :return: (timestamps, (N, 8) payload array) of one arbitration id of a session, in time order
+    """
+    db = app.db.raw_connection()
+    try:
+        cursor = db.cursor()
+        cursor.execute("SELECT timestamp, msg FROM can_data WHERE session_id=? AND arbitration_id=? "
+                       "ORDER BY timestamp", (session_id, arbitration_id))
+        rows = cursor.fetchall()
+    finally:
+        db.close()
+    timestamps = np.array([r[0] for r in rows], dtype=np.float64)
+    return timestamps, can_payloads_to_array([r[1] for r in rows])
+
+
+def get_can_signal(session_id, name):
+    """
+    Decode a CAN signal of a session. The frames of each arbitration id
+    are read once and cached, so signals sharing an id decode from the
+    same frames. Decoded columns are cached per signal.
+
+    :param name: key of CAN_SIGNALS
+    :return: (timestamps, values) numpy arrays, empty if the signal is not decoded
+    """
+    signals = get_can_signals()
+    if name not in signals:
+        return np.zeros(0), np.zeros(0)
+    arbitration_id, converter = signals[name]
+
+    def decode():
+        timestamps, payloads = session_data_cache.get(session_id, 'can_frames', (arbitration_id,),
+                                              lambda: read_can_frames(session_id, arbitration_id))
+        values = converter.convert_frames(payloads) if len(payloads) else np.zeros(0)
+        return timestamps, np.asarray(values, dtype=np.float64)
+    return session_data_cache.get(session_id, 'can.' + name, (arbitration_id,), decode)
+
+
+def get_session_fingerprint(session_id):
+    """
+    :return: value that changes when samples are added to a session
+    """
+    with app.db.connect() as c:
+        row = c.execute("select (select max(timestamp) from gps_data where session_id=?), "
+                        "(select max(timestamp) from imu_data where session_id=?), "
+                        "(select num_data_samples from session_info where session_id=?)",
+                        (session_id, session_id, session_id)).fetchone()
+    return tuple(row)
+
+
+def validate_session_data(session_id):
+    """
+    Drop cached data of a session if it has changed, e.g. while it is being recorded
+    """
+    session_data_cache.validate(session_id, get_session_fingerprint(session_id))
+
 
-    data = [{'timestamp': x.timestamp,
-            'value': value_converter.convert_frame(CanFrame("999", x.msg))}
-            for x in
-            s.query(CANData).filter(CANData.session_id == session_id).filter(CANData.arbitration_id == arbitration_id)
-            ]
-    return data
+def get_session_data(session_id, channel, compute):
+    """
+    :param compute: function loading the data on a cache miss
+    :return: cached data of a session channel
+    """
+    validate_session_data(session_id)
+    return session_data_cache.get(session_id, channel, (), compute)
 
 
 @app.route('/data/sessions')
@@ -60,10 +156,10 @@ def get_sessions():
 
 
 @app.route('/data/gps/<session_id>')
-@lru_cache(maxsize=32)
 def get_gps_data(session_id):
-    s = get_orm_session()
-    results = [{
+    def load():
+        s = get_orm_session()
+        return [{
                 'timestamp': x.timestamp,
                 'speed': x.speed,
                 'lat': x.lat,
@@ -71,14 +167,14 @@ def get_gps_data(session_id):
                 }
                 for x in
                 s.query(GPSData).filter(GPSData.session_id == session_id).all()]
-    return jsonify(data=results, session_id=session_id)
+    return jsonify(data=get_session_data(session_id, 'gps', load), session_id=session_id)
 
 
 @app.route('/data/imu/<session_id>')
-@lru_cache(maxsize=32)
 def get_imu_data(session_id):
-    s = get_orm_session()
-    results = [{
+    def load():
+        s = get_orm_session()
+        return [{
                 'timestamp': x.timestamp,
                 'x_accel': x.x_accel,
                 'y_accel': x.y_accel,
@@ -86,26 +182,22 @@ def get_imu_data(session_id):
                 }
                 for x in
                 s.query(IMUData).filter(IMUData.session_id == session_id).all()]
-    return jsonify(data=results, session_id=session_id)
+    return jsonify(data=get_session_data(session_id, 'imu', load), session_id=session_id)
 
 
 @app.route('/data/can/<channel>/<session_id>')
-@lru_cache(maxsize=32)
 def get_can_data(channel, session_id):
-
-    data = None
-    if channel == "tps":
-        data = get_and_transform_can_data(session_id, 128, focus_rs_tps_converter)
-    elif channel == "rpm":
-        data = get_and_transform_can_data(session_id, 144, focus_rs_rpm_converter)
-    elif channel == "brake":
-        data = get_and_transform_can_data(session_id, 531, focus_rs_brake_pressure_converter)
-    elif channel == "steering":
-        data = get_and_transform_can_data(session_id, 16, focus_rs_steering_angle_converter)
-    if data is not None:
-        return jsonify(data=data, channel=channel, session_id=session_id)
-    else:
+    if channel not in get_can_signals():
         abort(404)
+    validate_session_data(session_id)
+    timestamps, values = get_can_signal(session_id, channel)
+    data = [{'timestamp': t, 'value': v} for t, v in zip(timestamps.tolist(), values.tolist())]
+    return jsonify(data=data, channel=channel, session_id=session_id)
+
+
+@app.route('/data/cache')
+def get_data_cache_metrics():
+    return jsonify(session_data_cache.get_metrics())
 
 
 ###################################
@@ -131,173 +223,207 @@ def get_stats_session(session_id):
     return jsonify(data="")
 
 
+def get_downsample_args():
+    """
+    Plot resolution requested by the client, e.g. ?width=400&downsample=minmax
+
+    :return: (plot width in pixels, downsampling method)
+    """
+    width = request.args.get("width", DEFAULT_PLOT_WIDTH, type=int)
+    method = request.args.get("downsample", DEFAULT_DOWNSAMPLE_METHOD)
+    if method not in DOWNSAMPLE_METHODS:
+        abort(400)
+    return width, method
+
+
+def sql_series(session_id, table, column, scale=1.0):
+    """
+    :return: function loading one column of a session as a series indexed by timestamp
+    """
+    def load():
+        data = pd.read_sql_query("select timestamp, %s FROM %s where session_id=? ORDER BY timestamp" %
+                                 (column, table), app.db, index_col='timestamp', params=(session_id,))
+        return data[column] * scale
+    return load
+
+
+def can_series(session_id, name, transform=None):
+    """
+    :param name: key of CAN_SIGNALS
+    :return: function loading a decoded CAN signal of a session as a series indexed by timestamp
+    """
+    def load():
+        timestamps, values = get_can_signal(session_id, name)
+        return pd.Series(transform(values) if transform else values, index=timestamps)
+    return load
+
+
 @app.route('/plot/accel')
-@lru_cache(maxsize=32)
 def get_plot_timeseries():
     session_id = request.args.get("session_id")
-    # TODO fail on bad session_id
-    with app.db.connect() as c:
-        q = c.execute("select timestamp,x_accel,y_accel,z_accel FROM %s where %s " % ("imu_data", "session_id='%s'" % session_id))
-        t = []
-        x = []
-        y = []
-        z = []
-        data = q.cursor.fetchall()
-        t0 = data[0][0]
-        map(lambda p: t.append(round(p[0]-t0, 3)), data)
-        map(lambda p: x.append(round(p[1], 3)), data)
-        map(lambda p: y.append(round(p[2], 3)), data)
-        map(lambda p: z.append(round(p[3], 3)), data)
-        data = [
-            pgo.Scatter(x=t, y=x, name="x"),
-            pgo.Scatter(x=t, y=y, name="y"),
-            pgo.Scatter(x=t, y=z, name="z")
-
-        ]
-        layout = pgo.Layout(
-            title="Accel",
-            xaxis=dict(title="time"),
-            yaxis=dict(title="val"),
-        )
-        fig = pgo.Figure(data=data, layout=layout)
-        return jsonify(data=fig.get('data'), layout=fig.get('layout'))
+    validate_session_data(session_id)
+    width, method = get_downsample_args()
+    data = []
+    for axis in ['x', 'y', 'z']:
+        t, v = get_plot_data(sql_series(session_id, "imu_data", axis + "_accel"), 0, width, method,
+                             (session_id, axis + "_accel"))
+        if t is None:
+            abort(404)
+        data.append(pgo.Scatter(x=t, y=v, name=axis))
+    layout = pgo.Layout(
+        title="Accel",
+        xaxis=dict(title="time"),
+        yaxis=dict(title="val"),
+    )
+    fig = pgo.Figure(data=data, layout=layout)
+    return jsonify(data=fig.get('data'), layout=fig.get('layout'))
 
 
 @app.route('/plot/gps')
-@lru_cache(maxsize=32)
 def get_gpsplot_timeseries():
     session_id = request.args.get("session_id")
-    # TODO fail on bad session_id
-    with app.db.connect() as c:
-        q = c.execute("select timestamp,speed,track FROM %s where %s " % ("gps_data", "session_id='%s'" % session_id))
-        t = []
-        x = []
-        y = []
-        data = q.cursor.fetchall()
-        t0 = data[0][0]
-        map(lambda p: t.append(p[0]-t0), data)
-        map(lambda p: x.append(p[1]*2.23), data)
-        map(lambda p: y.append(p[2]), data)
-        data = [
-            pgo.Scatter(x=t, y=x, name="speed"),
-            pgo.Scatter(x=t, y=y, name="track", yaxis='y2'),
-
-        ]
-        layout = pgo.Layout(
-            title="GPS",
-            xaxis=dict(title="time"),
-            yaxis=dict(title="val"),
-            yaxis2=dict(
-                title='yaxis2 title',
-                titlefont=dict(
-                    color='rgb(148, 103, 189)'
-                ),
-                tickfont=dict(
-                    color='rgb(148, 103, 189)'
-                ),
-                overlaying='y',
-                side='right'
-            )
+    validate_session_data(session_id)
+    width, method = get_downsample_args()
+    t, speed = get_plot_data(sql_series(session_id, "gps_data", "speed", 2.23), 0, width, method,
+                             (session_id, "speed_mph"))
+    if t is None:
+        abort(404)
+    t2, track = get_plot_data(sql_series(session_id, "gps_data", "track"), 0, width, method,
+                              (session_id, "track"))
+    data = [
+        pgo.Scatter(x=t, y=speed, name="speed"),
+        pgo.Scatter(x=t2, y=track, name="track", yaxis='y2'),
+
+    ]
+    layout = pgo.Layout(
+        title="GPS",
+        xaxis=dict(title="time"),
+        yaxis=dict(title="val"),
+        yaxis2=dict(
+            title='yaxis2 title',
+            titlefont=dict(
+                color='rgb(148, 103, 189)'
+            ),
+            tickfont=dict(
+                color='rgb(148, 103, 189)'
+            ),
+            overlaying='y',
+            side='right'
         )
-        fig = pgo.Figure(data=data, layout=layout)
-        return jsonify(data=fig.get('data'), layout=fig.get('layout'))
+    )
+    fig = pgo.Figure(data=data, layout=layout)
+    return jsonify(data=fig.get('data'), layout=fig.get('layout'))
 
 
 @app.route('/plot/run')
-@lru_cache(maxsize=32)
 def get_singlerun_timeseries():
     session_id = request.args.get("session_id")
+    validate_session_data(session_id)
     if 'smooth' in request.args:
         smoothing_window = int(request.args.get("smooth"))
     else:
         smoothing_window = 10
+    width, method = get_downsample_args()
 
     can_channels = {
-        'TPS (%)': get_and_transform_can_data(session_id, 128, focus_rs_tps_converter),
-        'Brake Pressure (kPa)': get_and_transform_can_data(session_id, 531, focus_rs_brake_pressure_converter),
-        'RPM': get_and_transform_can_data(session_id, 144, focus_rs_rpm_converter)
+        'TPS (%)': can_series(session_id, 'tps'),
+        'Brake Pressure (kPa)': can_series(session_id, 'brake'),
+        'RPM': can_series(session_id, 'rpm')
     }
-    gps_data = pd.read_sql_query("select timestamp, speed, track, lat, lon FROM %s where session_id='%s'" % ("gps_data", session_id), app.db, index_col='timestamp')
-    imu_data = pd.read_sql_query("select timestamp, x_accel, y_accel, z_accel FROM %s where session_id='%s'" % ("imu_data", session_id), app.db, index_col='timestamp')
-    can_samples = pd.read_sql_query("select timestamp, msg FROM %s where session_id='%s' and arbitration_id=16" % ("can_data", session_id), app.db, index_col='timestamp')
+    steering = can_series(session_id, 'steering', lambda a: a * 3000 * ((-1) * a))
 
-    can_samples['Steering'] = [
-        (focus_rs_steering_angle_converter.convert_frame(CanFrame('010', x)) * 3000 *
-         ((-1)* focus_rs_steering_angle_converter.convert_frame(CanFrame('010', x))))
-        for x in can_samples.msg.tolist()]
+    def scatterplot(series, w, title):
+        return get_scatterplot(series, w, title, width=width, method=method, cache_key=(session_id, title))
 
     fig = tools.make_subplots(rows=6, cols=1)
-    fig.append_trace(get_scatterplot(gps_data.speed, smoothing_window, "Speed (m/s)"), 1, 1)
-    fig.append_trace(get_scatterplot(imu_data.y_accel, smoothing_window << 3, "YAccel (avg)"), 2, 1)
-    fig.append_trace(get_scatterplot(imu_data.x_accel, smoothing_window << 3, "XAccel (avg)"), 2, 1)
-    fig.append_trace(get_scatterplot(can_samples['Steering'], smoothing_window, "Steering"), 3, 1)
+    fig.append_trace(scatterplot(sql_series(session_id, "gps_data", "speed"), smoothing_window, "Speed (m/s)"), 1, 1)
+    fig.append_trace(scatterplot(sql_series(session_id, "imu_data", "y_accel"), smoothing_window << 3,
+                                 "YAccel (avg)"), 2, 1)
+    fig.append_trace(scatterplot(sql_series(session_id, "imu_data", "x_accel"), smoothing_window << 3,
+                                 "XAccel (avg)"), 2, 1)
+    fig.append_trace(scatterplot(steering, smoothing_window, "Steering"), 3, 1)
     i = 4
     for c in can_channels:
-        fig.append_trace(get_scatterplot(can_channels[c].result, smoothing_window, c), int(i), 1)
+        fig.append_trace(scatterplot(can_channels[c], smoothing_window, c), int(i), 1)
         i += 0.5
 
     return jsonify(data=fig.get('data'), layout=fig.get('layout'))
 
 
 @app.route('/plot/speed')
-@lru_cache(maxsize=32)
 def get_plots_speed():
     session_id = request.args.get("session_id")
+    validate_session_data(session_id)
     smoothing_window = 10
+    width, method = get_downsample_args()
 
     can_channels = {
-        'TPS (%)': get_and_transform_can_data(session_id, 128, focus_rs_rpm_converter),
-        'Brake Pressure (kPa)': get_and_transform_can_data(session_id, 531, focus_rs_brake_pressure_converter),
+        'TPS (%)': can_series(session_id, 'tps'),
+        'Brake Pressure (kPa)': can_series(session_id, 'brake'),
     }
-    gps_data = pd.read_sql_query("select timestamp, speed, track, lat, lon FROM %s where session_id='%s'" % ("gps_data", session_id), app.db, index_col='timestamp')
 
-    sources = [(gps_data.speed, smoothing_window, "Speed (m/s)")]
+    sources = [(sql_series(session_id, "gps_data", "speed"), smoothing_window, "Speed (m/s)")]
     for c in can_channels:
-        sources.append((can_channels[c].result, smoothing_window, c))
+        sources.append((can_channels[c], smoothing_window, c))
 
-    fig = plotly_helpers.get_xy_combined_plot(sources, "Speed")
+    fig = get_xy_combined_plot(sources, "Speed", width, method, session_id)
     return jsonify(data=fig.get('data'), layout=fig.get('layout'))
 
 
+@app.route('/data/channel/<session_id>/<channel>/<column>')
+def get_channel_range(session_id, channel, column):
+    """
+    Channel data from the session cache at the coarsest pyramid level
+    that still fills the plot, e.g.
+    /data/channel/<session>/imu/x_accel?start=1500000000&stop=1500000060&width=600
+    """
+    cache_dir = getattr(app, 'session_cache_dir', None)
+    if not cache_dir:
+        abort(404)
+    start = request.args.get("start", type=float)
+    stop = request.args.get("stop", type=float)
+    width, _ = get_downsample_args()
+
+    db = app.db.raw_connection()
+    try:
+        if not session_exists(db, session_id):
+            abort(404)
+        cache = get_session_cache(db, session_id, cache_dir, get_session_cache_channels())
+    finally:
+        db.close()
+    if channel not in cache.channels() or column not in cache.columns(channel):
+        abort(404)
+
+    level = cache.select_level(channel, start, stop, width)
+    if level == 1:
+        level, data = cache.get_range(channel, start, stop, None, ['timestamp', column])
+        result = {'value': sfl(data[column].tolist())}
+    else:
+        aggregates = ['min', 'max', 'mean']
+        level, data = cache.get_range(channel, start, stop, width,
+                                      ['timestamp'] + ["%s_%s" % (column, a) for a in aggregates])
+        result = {a: sfl(data["%s_%s" % (column, a)].tolist()) for a in aggregates}
+    return jsonify(session_id=session_id, channel=channel, column=column, level=level,
+                   timestamp=data['timestamp'].tolist(), **result)
+
+
 @app.route('/export/csv')
 def get_run_csv():
     session_id = request.args.get("session_id")
-    get_csv_cmd="""
-select * from
-(select
-    session_id,timestamp,'GPS' as type,time,speed,track,lat,lon,epx,epy,epv
-    NULL as arbitration_id,NULL as msg,
-    NULL AS r,NULL AS p,NULL AS y,NULL AS x_accel,NULL AS y_accel,NULL AS z_accel,NULL AS x_gyro,NULL AS y_gyro,NULL AS z_gyro
-    from gps_data
-union
-select
-    session_id,timestamp,'CAN' as type, NULL as time, NULL as speed,NULL as track,NULL as lat,NULL as lon,NULL as epx,NULL as epy,NULL as epv,
-    arbitration_id, msg,
-    NULL AS r,NULL AS p,NULL AS y,NULL AS x_accel,NULL AS y_accel,NULL AS z_accel,NULL AS x_gyro,NULL AS y_gyro,NULL AS z_gyro
-    from can_data
-union
-select
-    session_id,timestamp,'IMU' as type, NULL as time, NULL as speed,NULL as track,NULL as lat,NULL as lon,NULL as epx,NULL as epy,NULL as epv,
-    NULL as arbitration_id, NULL as msg,
-    r,p,y,x_accel,y_accel,z_accel,x_gyro,y_gyro,z_gyro
-    from imu_data )
-
-
-where session_id = '%s'
-    """ % session_id
-    with app.db.connect() as c:
-        q = c.execute(get_csv_cmd)
-        results = ["#" + ','.join(q.keys())]
-        for row in q:
-            data = [str(x) if x else '' for x in row]
-            results.append(','.join(data))
+    db = app.db.raw_connection()
+    if not session_exists(db, session_id):
+        db.close()
+        abort(404)
 
-        # only column header available
-        if len(results) <= 1:
-            raise ValueError("Invalid session")
+    def generate():
+        try:
+            # app.can_decode_plan adds decoded signal columns
+            exporter = SessionExporter(getattr(app, 'can_decode_plan', None))
+            yield from exporter.iter_csv(db, session_id)
+        finally:
+            db.close()
 
-        result = '\n'.join(results)
-        return Response(result, mimetype='text/csv')
+    return Response(generate(), mimetype='text/csv')
 
 
 @app.route('/plot/bokeh_test/<session_id>')
@@ -310,9 +436,10 @@ def get_plots_bokeh_test(session_id):
     from bokeh.util.string import encode_utf8
     import flask
 
+    validate_session_data(session_id)
     can_channels = {
-        'TPS (%)': get_and_transform_can_data(session_id, 128, tps_converter),
-        'Brake Pressure (kPa)': get_and_transform_can_data(session_id, 531, brake_pressure_converter),
+        'TPS (%)': can_series(session_id, 'tps')(),
+        'Brake Pressure (kPa)': can_series(session_id, 'brake')(),
     }
     gps_data = pd.read_sql_query("select timestamp, speed, track, lat, lon FROM %s where session_id='%s'" % ("gps_data", session_id), app.db, index_col='timestamp')
     imu_data = pd.read_sql_query("select timestamp, x_accel, y_accel, z_accel FROM %s where session_id='%s'" % ("imu_data", session_id), app.db, index_col='timestamp')
@@ -327,7 +454,7 @@ def get_plots_bokeh_test(session_id):
     subplots = [[s1],[s2]]
     for c in can_channels:
         s = figure(width=800, plot_height=250, title=c, x_range=s1.x_range)
-        s.line(can_channels[c].index, can_channels[c].result)
+        s.line(can_channels[c].index, can_channels[c].values)
         subplots.append([s])
         print("added")
 
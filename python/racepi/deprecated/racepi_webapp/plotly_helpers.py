@@ -16,8 +16,18 @@
 
 from plotly import graph_objs as pgo
 
+import numpy as np
 import pandas as pd
 
+from racepi.database.data_cache import SessionDataCache
+from racepi.sensor.data_utilities import DOWNSAMPLE_METHODS
+
+# plot width in pixels when the client does not send one, 0 disables downsampling
+DEFAULT_PLOT_WIDTH = 1200
+DEFAULT_DOWNSAMPLE_METHOD = 'lttb'
+# downsampled series and query results of the webapp, keyed by (session, channel, params)
+session_data_cache = SessionDataCache()
+
 
 def sfl(float_list, ndigits=3):
     """
@@ -31,28 +41,96 @@ def sfl(float_list, ndigits=3):
     return [round(x, ndigits) for x in float_list]
 
 
-def get_scatterplot(series, w, title, y_axis_id=1):
+def downsample(x, y, width, method=DEFAULT_DOWNSAMPLE_METHOD):
+    """
+    Reduce a series to about one point per pixel of plot width. Samples
+    that are not finite are dropped first.
+
+    :param x: sample times
+    :param y: sample values
+    :param width: plot width in pixels, 0 or None to keep every sample
+    :param method: 'lttb' or 'minmax'
+    :return: (x, y) numpy arrays
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError("Unknown downsampling method: %s" % method)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+    if not width:
+        return x, y
+    return DOWNSAMPLE_METHODS[method](x, y, width)
+
+
+def get_cached_series(key, compute):
+    """
+    Look up a downsampled series in session_data_cache, computing and caching it on a miss.
+
+    :param key: (session, channel, smoothing, width, method)
+    :param compute: function returning the (x, y) series
+    :return: (x, y) series
+    """
+    return session_data_cache.get(key[0], key[1], key[2:], compute)
+
+
+def get_plot_data(series, w, width=None, method=DEFAULT_DOWNSAMPLE_METHOD, cache_key=None):
+    """
+    Smooth and downsample a timeseries for plotting
+
+    :param series: pandas series indexed by time, or a function returning
+                   it that is only called on a cache miss
+    :param w: rolling average window radius, 0 for no smoothing
+    :param width: plot width in pixels to downsample to, None for every sample
+    :param method: downsampling method, 'lttb' or 'minmax'
+    :param cache_key: (session, channel) of the series, None to not cache
+    :return: (x, y) lists with x relative to the first sample, (None, None) if the series is too short
+    """
+    def compute():
+        data = pd.Series(series() if callable(series) else series)
+        if len(data) <= 2*w:
+            return None, None
+        t = data.index.values.astype(np.float64)
+        if w:
+            data = data.rolling(window=w, center=True).mean()
+            return downsample(t[w:-w] - t[0], data.values[w:-w], width, method)
+        return downsample(t - t[0], data.values, width, method)
+
+    if cache_key:
+        x, y = get_cached_series(tuple(cache_key) + (w, width, method), compute)
+    else:
+        x, y = compute()
+    if x is None:
+        return None, None
+    return sfl(x.tolist()), sfl(y.tolist())
+
+
+def get_scatterplot(series, w, title, y_axis_id=1, width=None, method=DEFAULT_DOWNSAMPLE_METHOD, cache_key=None):
     """
     Generate plotly scatter plot from pandas timeseries data
 
-    :param series: plot dataframe series
+    :param series: plot dataframe series, or function returning it
     :param w: rolling averge window radius
     :param title: title for plot
+    :param width: plot width in pixels to downsample to, None for every sample
+    :param method: downsampling method, 'lttb' or 'minmax'
+    :param cache_key: (session, channel) of the series, None to not cache
     :return: scatterplot graph object
     """
-    xdata = None
-    ydata = None
-    if len(series) > (2*w):
-        data = pd.Series(series).rolling(window=w, center=True).mean()
-        t0 = data.index.values.tolist()[0]
-        data.offset_time = [x-t0 for x in data.index.values.tolist()]
-        xdata = sfl(data.offset_time[w:-w])
-        ydata = sfl(data.values.tolist()[w:-w])
-
+    xdata, ydata = get_plot_data(series, w, width, method, cache_key)
     return pgo.Scatter(x=xdata, y=ydata, name=title, yaxis='y'+str(y_axis_id))
 
 
-def get_xy_combined_plot(sources, title=None):
+def get_xy_combined_plot(sources, title=None, width=None, method=DEFAULT_DOWNSAMPLE_METHOD, session_id=None):
+    """
+    :param sources: list of (series, smoothing window, title)
+    :param title: plot title
+    :param width: plot width in pixels to downsample to, None for every sample
+    :param method: downsampling method, 'lttb' or 'minmax'
+    :param session_id: session of the sources, used with the title to cache series
+    :return: plotly figure
+    """
     if not sources:
         return None
 
@@ -65,7 +143,8 @@ def get_xy_combined_plot(sources, title=None):
 
     for i in range(len(sources)):
         s = sources[i]
-        data.append(get_scatterplot(s[0], s[1], s[2], i+1))
+        cache_key = (session_id, s[2]) if session_id else None
+        data.append(get_scatterplot(s[0], s[1], s[2], i+1, width, method, cache_key))
         axis_name = "yaxis"
         if i > 0:
             axis_name += str(i+1)
@@ -19,8 +19,8 @@ import time
 import socket
 from collections import defaultdict
 from threading import Event, Thread
-import cantools
 
+from racepi.can.decode_plan import CanDecodePlan
 from racepi.sensor.data_utilities import safe_speed_to_float
 from racepi.racetech.messages import *
 
@@ -33,6 +33,16 @@ MAX_BRAKE_PRESSURE = float(1e-6)  # TODO determine proper unit
 # will clip these values if their magnitude is greater than a threshold.
 CLIP_STEERING_ANGLE = 720.0  # degrees
 
+# DBC signals forwarded to DL1 clients
+DL1_CAN_SIGNALS = [
+    "EngineSpeed",
+    "AcceleratorPosition",
+    "SteeringAngle",
+    "LateralAccel",
+    "LongAccel",
+    "BrakePedal",
+]
+
 # Some sensors are rate limited
 MIN_SAMPLE_INTERVAL = 0.05  # 20 hz
 last_sample_time = defaultdict(int)
@@ -53,10 +63,35 @@ class RaceTechnologyDL1FeedWriter:
         self.__socket_listener_thread.start()
 
         self.__earliest_time_seen = time.time()
+        # arbitration id -> (decoder, [(signal index, sender)])
+        self.__can_senders = {}
         if dbc_filename:
-            self.__candb = cantools.database.load_file(dbc_filename)
-        else:
-            self.__candb = None
+            plan = CanDecodePlan.from_dbc_file(dbc_filename, DL1_CAN_SIGNALS)
+            for arb_id in plan.arbitration_ids():
+                decoder = plan.get(arb_id)
+                self.__can_senders[arb_id] = (decoder, self.__get_can_signal_senders(decoder))
+
+    def __get_can_signal_senders(self, decoder):
+        """
+        Work out once which DL1 messages a CAN message feeds
+
+        :param decoder: CanMessageDecoder for DL1_CAN_SIGNALS
+        :return: list of (signal index, sender) in DL1 send order
+        """
+        index = {name: i for i, name in enumerate(decoder.signal_names())}
+        long_index = index.get("LongAccel")
+
+        def send_accel(value, values):
+            self.send_xyz_accel(value, values[long_index] if long_index is not None else None, 0)
+
+        senders = [
+            ("EngineSpeed", lambda value, values: self.send_rpm(value)),
+            ("SteeringAngle", lambda value, values: self.send_steering_angle(value)),
+            ("AcceleratorPosition", lambda value, values: self.send_tps(value)),
+            ("LateralAccel", send_accel),
+            ("BrakePedal", lambda value, values: self.send_brake_pressure(value)),
+        ]
+        return [(index[name], send) for name, send in senders if name in index]
 
     def close(self):
         self.__socket_listener_done.set()
@@ -214,57 +249,38 @@ class RaceTechnologyDL1FeedWriter:
         Write an unprocessed can sample to Racetech data clients
 
         :param timestamp: timestamp of the can message
-        :param data: unprocesses can data as byte array
+        :param data: unprocessed can data as CanSample
         :raises: ValueError if can message is unprocessable
         """
 
-        if len(data) < 5:
+        if not data.payload:
             return  # skip
 
-        arb_id = data[:3]
-        payload = data[3:]
+        arb_id = data.arbitration_id
+        dispatch = self.__can_senders.get(arb_id)
+        if not dispatch:
+            return  # skip, no signals of interest
+
         if (timestamp - last_sample_time[arb_id]) < MIN_SAMPLE_INTERVAL:
             return  # skip, rate limit
         else:
             last_sample_time[arb_id] = timestamp
 
-        if self.__candb:
-            try:
-                can_signals = self.__candb.decode_message(int(arb_id, 16),
-                                                          bytearray.fromhex(payload))
-                engine_speed   = can_signals.get("EngineSpeed")
-                accel_position = can_signals.get("AcceleratorPosition")
-                steering_angle = can_signals.get("SteeringAngle")
-                lateral_accel  = can_signals.get("LateralAccel")
-                long_accel     = can_signals.get("LongAccel")
-                brake_pedal    = can_signals.get("BrakePedal")
-
-                if engine_speed:
-                    self.send_timestamp(timestamp)
-                    self.send_rpm(engine_speed)
-
-                if steering_angle:
-                    self.send_timestamp(timestamp)
-                    self.send_steering_angle(steering_angle)
-
-                if accel_position:
-                    self.send_timestamp(timestamp)
-                    self.send_tps(accel_position)
-
-                if lateral_accel:
-                    self.send_timestamp(timestamp)
-                    self.send_xyz_accel(lateral_accel, long_accel, 0)
-
-                if brake_pedal:
+        try:
+            decoder, senders = dispatch
+            values = decoder.decode_values(data.payload)
+            for index, send in senders:
+                value = values[index]
+                if value:
                     self.send_timestamp(timestamp)
-                    self.send_brake_pressure(brake_pedal)
-
-            except KeyError as ke:
-                if LOG_DECODING_FAILURES:
-                    print (ke)
-            except Exception as e:
-                if LOG_DECODING_FAILURES:
-                    print (e)
+                    send(value, values)
+
+        except KeyError as ke:
+            if LOG_DECODING_FAILURES:
+                print (ke)
+        except Exception as e:
+            if LOG_DECODING_FAILURES:
+                print (e)
 
 
 
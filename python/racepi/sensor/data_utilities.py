@@ -13,8 +13,11 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
-import itertools
+import heapq
+
+import numpy as np
 from math import cos, pi, fabs
+from operator import itemgetter
 
 
 def uptime_helper():
@@ -24,6 +27,31 @@ def uptime_helper():
         return uptime_seconds
 
 
+def _tag_samples(source, samples):
+    for t, value in samples:
+        yield source, t, value
+
+
+def iter_ordered_log(data):
+    """
+    Lazily merge a data object of the type
+    { source: iterable of (timestamp, value), ... } into a single time
+    ordered stream of (source, timestamp, value). Each source must
+    already be in time order. This is a k-way merge, O(n log k) for k
+    sources, and the sources may be generators, e.g. database cursors.
+    Samples with equal timestamps keep the order of the sources.
+
+    :param data: dict of source name to time ordered samples
+    :return: generator of (source, timestamp, value)
+    """
+    return heapq.merge(*[_tag_samples(source, samples) for source, samples in data.items()],
+                       key=itemgetter(1))
+
+
+def _is_time_ordered(samples):
+    return all(samples[i][0] <= samples[i + 1][0] for i in range(len(samples) - 1))
+
+
 def merge_and_generate_ordered_log(data):
     """
     This utility function takes a data object of the type
@@ -31,13 +59,16 @@ def merge_and_generate_ordered_log(data):
     a new list of (source, timestamp, (values,...)) for outputting
     as a multi-source stream.
 
+    Sources out of time order are sorted first, use iter_ordered_log()
+    for ordered sources.
+
     :param data:
     :return:
     """
-    vals_with_keys = [[(key,) + val for val in data[key]] for key in data.keys()]
-    flat_data = list(itertools.chain.from_iterable(vals_with_keys))
-    flat_data.sort(key=lambda x: x[1])  # sort by time
-    return flat_data
+    ordered = {}
+    for source, samples in data.items():
+        ordered[source] = samples if _is_time_ordered(samples) else sorted(samples, key=itemgetter(0))
+    return list(iter_ordered_log(ordered))
 
 
 def safe_speed_to_float(v):
@@ -81,65 +112,140 @@ class TimeToDistanceConverter:
     """
     This is a utility class for converting samples timestamps to distance deltas
     withing a recording
-    """
-
-    def __init__(self, speed_data):
 
-        # calculate distance trace
+    Distance is integrated from speed samples once, then any time trace
+    is converted by linear interpolation. Times before the first or after
+    the last speed sample are extrapolated with the speed of the first or
+    last interval.
+    """
 
-        if not speed_data or len(speed_data) < 2:
+    def __init__(self, speed_data, interpolate_speed=False):
+        """
+        :param speed_data: sequence of (time, speed) samples in time order, or an (N, 2) array
+        :param interpolate_speed: integrate with the average speed of each interval
+                                  (trapezoidal) instead of the speed at its end
+        """
+        if speed_data is None or len(speed_data) < 2:
             raise ValueError("Insufficient data provided")
 
-        self.distance_samples = []
-
-        t_last = speed_data[0][0]
-        total_distance = 0.0
-
-        for sample in speed_data[1:]:
-
-            t = sample[0]
-            v = sample[1]
-            t_delta = t-t_last
-            t_last = t
-
-            # TODO: interpolate v from multiple samples
-            d_delta = t_delta * v
-            total_distance = total_distance + d_delta
-            self.distance_samples.append((t, total_distance, t_delta, d_delta))
+        data = np.asarray(speed_data, dtype=np.float64)
+        self.__integrate(data[:, 0], data[:, 1], interpolate_speed)
+
+    @staticmethod
+    def from_arrays(times, speeds, interpolate_speed=False):
+        """
+        :param times: sample times, e.g. a pandas index
+        :param speeds: speed at each sample time
+        :param interpolate_speed: see __init__
+        :return: TimeToDistanceConverter
+        """
+        return TimeToDistanceConverter(np.column_stack((np.asarray(times, dtype=np.float64),
+                                                        np.asarray(speeds, dtype=np.float64))),
+                                       interpolate_speed)
+
+    def __integrate(self, times, speeds, interpolate_speed):
+        self.times = times
+        self.t_deltas = np.diff(times)
+        if interpolate_speed:
+            self.d_deltas = self.t_deltas * (speeds[:-1] + speeds[1:]) * 0.5
+        else:
+            self.d_deltas = self.t_deltas * speeds[1:]
+        self.distances = np.concatenate(([0.0], np.cumsum(self.d_deltas)))
+
+    @property
+    def distance_samples(self):
+        """
+        :return: list of (time, total distance, time delta, distance delta) for each interval
+        """
+        return list(zip(self.times[1:].tolist(), self.distances[1:].tolist(),
+                        self.t_deltas.tolist(), self.d_deltas.tolist()))
+
+    def __edge_speed(self, i):
+        # speed over interval i, zero for intervals too short to divide by
+        return self.d_deltas[i] / self.t_deltas[i] if self.t_deltas[i] > 1e-4 else 0.0
 
     def generate_distance_trace(self, time_trace):
-
-        if not self.distance_samples:
-            raise RuntimeError("No distance data available")
-
-        result = []
-        dist_iter = iter(self.distance_samples)
-        last_dist = next(dist_iter)
-        next_dist = next(dist_iter)
-        for sample in time_trace:
-            # find next distance sample if necessary
-            try:
-                # this try catch is REALLY stupid, but python iterators can't
-                # detect the end
-                while next_dist[0] < sample:
-                    last_dist = next_dist
-                    next_dist = next(dist_iter)
-            except:
-                pass
-            # linear interpolation of last distance sample
-            # before and after the target sample
-            if next_dist[2] > 1e-4:
-                interpolated_distance = \
-                    (sample-last_dist[0])/next_dist[2] * next_dist[3] + last_dist[1]
-            else:
-                interpolated_distance = 0.0
-
-            result.append(interpolated_distance)
-
-        if len(time_trace) != len(result):
-            print("Warning: distance samples dropped")
-
+        """
+        :param time_trace: sample times, e.g. a list, numpy array or pandas index
+        :return: numpy array with the distance at each sample time
+        """
+        time_trace = np.asarray(time_trace, dtype=np.float64)
+        result = np.interp(time_trace, self.times, self.distances)
+
+        before = time_trace < self.times[0]
+        result[before] = (time_trace[before] - self.times[0]) * self.__edge_speed(0)
+        after = time_trace > self.times[-1]
+        result[after] = self.distances[-1] + (time_trace[after] - self.times[-1]) * self.__edge_speed(-1)
         return result
 
 
-
+def lttb_downsample(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling. Keeps the first and last
+    point and, from each of threshold - 2 equal sized buckets, the point
+    forming the largest triangle with the previously kept point and the
+    average of the next bucket. This preserves the visual shape of a
+    trace much better than decimation.
+
+    :param x: sample times, in order
+    :param y: sample values
+    :param threshold: number of points to return
+    :return: (x, y) numpy arrays of at most threshold points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        # average of the next bucket, the last point for the last bucket
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+def minmax_downsample(x, y, buckets):
+    """
+    Keep the minimum and maximum of each of equal sized buckets, in time
+    order. Peaks are never lost, which matters for brake pressure and
+    acceleration spikes.
+
+    :param x: sample times, in order
+    :param y: sample values
+    :param buckets: number of buckets, e.g. the plot width in pixels
+    :return: (x, y) numpy arrays of at most 2 * buckets points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if buckets < 1 or 2 * buckets >= n:
+        return x, y
+
+    edges = (np.arange(buckets + 1) * (n / buckets)).astype(np.int64)
+    # sort by value within each bucket, buckets stay at their index range
+    order = np.lexsort((y, np.repeat(np.arange(buckets), np.diff(edges))))
+    min_index = order[edges[:-1]]
+    max_index = order[edges[1:] - 1]
+
+    # buckets hold at least two samples, so min and max are distinct points
+    indices = np.sort(np.stack((min_index, max_index), axis=1), axis=1).ravel()
+    return x[indices], y[indices]
+
+
+# name: function(x, y, plot width in pixels)
+DOWNSAMPLE_METHODS = {
+    'lttb': lttb_downsample,
+    'minmax': minmax_downsample,
+}
@@ -0,0 +1,151 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Sensor handlers for socket based sources, e.g. gpsd or SocketCAN,
+run as coroutines on one asyncio event loop in a background thread of
+the logger process. This avoids a process per sensor. Blocking drivers
+such as RTIMU and pyserial still use the process based SensorHandler.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, TimeoutError
+from multiprocessing import Pipe
+
+DEFAULT_QUEUE_CAPACITY = 50000
+STOP_TIMEOUT = 3.0  # seconds
+
+_sensor_loop = None
+_sensor_loop_lock = threading.Lock()
+
+
+def get_sensor_event_loop():
+    """
+    :return: event loop shared by all AsyncSensorHandlers, running in a daemon thread
+    """
+    global _sensor_loop
+    with _sensor_loop_lock:
+        if _sensor_loop is None:
+            _sensor_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sensor_loop.run_forever, name="sensor-io", daemon=True).start()
+        return _sensor_loop
+
+
+class AsyncSensorHandler:
+    """
+    Base handler for sensors read by a coroutine. It has the same
+    consumer interface as SensorHandler: start(), stop(),
+    get_all_data(), dropped_samples, wait_handle and data_ready().
+
+    Subclasses implement read(), which runs on the shared event loop
+    and calls send_sample() per sample. Samples are passed to the
+    consumer in a deque and are never pickled. A wakeup message is sent
+    on wait_handle when a sample is queued while the queue is empty.
+    """
+
+    def __init__(self, queue_capacity=DEFAULT_QUEUE_CAPACITY):
+        """
+        :param queue_capacity: maximum number of unread samples, later samples are dropped
+        """
+        self.queue_capacity = queue_capacity
+        self.queue = deque()
+        self.dropped = 0
+        self.wait_handle, self.pipe_out = Pipe(duplex=False)
+        self.future = None
+
+    async def read(self):
+        """
+        Read samples until cancelled, running on the sensor event loop
+        """
+        raise NotImplementedError
+
+    async def __run(self):
+        try:
+            await self.read()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("%s: reader failed: %s" % (type(self).__name__, str(e)))
+
+    def start(self):
+        """
+        Begin recording data
+        """
+        self.future = asyncio.run_coroutine_threadsafe(self.__run(), get_sensor_event_loop())
+
+    def stop(self):
+        """
+        Stop recording data, cancelling the reader
+        """
+        if self.future is None:
+            return
+        get_sensor_event_loop().call_soon_threadsafe(self.future.cancel)
+        try:
+            self.future.result(STOP_TIMEOUT)
+        except (CancelledError, TimeoutError):
+            pass
+        self.future = None
+
+    def close(self):
+        """
+        Release the wakeup pipe of a stopped handler. Subclasses also
+        close their device.
+        """
+        self.wait_handle.close()
+        self.pipe_out.close()
+
+    def is_alive(self):
+        """
+        :return: true if the reader coroutine is running
+        """
+        return self.future is not None and not self.future.done()
+
+    @property
+    def dropped_samples(self):
+        """
+        :return: number of samples dropped because the queue was full
+        """
+        return self.dropped
+
+    def send_sample(self, sample):
+        """
+        Queue a sample for the consumer, called from the reader coroutine
+
+        :param sample: sensor data tuple (time, value)
+        """
+        if len(self.queue) >= self.queue_capacity:
+            self.dropped += 1
+            return
+        self.queue.append(sample)
+        if len(self.queue) == 1:
+            self.pipe_out.send_bytes(b'')
+
+    def data_ready(self):
+        """
+        :return: true if data is queued
+        """
+        return len(self.queue) > 0
+
+    def get_all_data(self):
+        """
+        Read all queued data from sensor handler
+        :return: list of sensor data tuples, each tuple is (time, value)
+        """
+        # drain wakeups before reading, later samples wake the consumer again
+        while self.wait_handle.poll():
+            self.wait_handle.recv_bytes()
+        return [self.queue.popleft() for _ in range(len(self.queue))]
@@ -15,23 +15,36 @@
 # You should have received a copy of the GNU General Public License
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import os
 import gps3.gps3 as gps3
 import time
 
+from racepi.sensor.handler.async_handler import AsyncSensorHandler
 from racepi.sensor.handler.sensor_handler import SensorHandler
 
 GPS_REQUIRED_FIELDS = ['time', 'lat', 'lon', 'speed', 'track', 'epx', 'epy', 'epv', 'alt']
 GPS_READ_TIMEOUT = 2.0
 
 
+def tpv_sample(data_stream):
+    """
+    :param data_stream: gps3 DataStream after unpacking a gpsd report
+    :return: copy of the TPV report, None if it has no fix time or misses required fields
+    """
+    sample = data_stream.TPV
+    if sample.get('time') is not None and set(GPS_REQUIRED_FIELDS).issubset(set(sample.keys())):
+        return dict(sample)
+    return None
+
+
 class GpsSensorHandler(SensorHandler):
 
     def __init__(self):
         SensorHandler.__init__(self, self.__record_from_gps)
 
     def __record_from_gps(self):
-        # TODO auto retry and reinit on hotplug
+        # the reader exits on errors, SensorSupervisor recreates the handler
 
         if not self.pipe_out:
             raise ValueError("Illegal argument, no queue specified")
@@ -49,11 +62,13 @@ class GpsSensorHandler(SensorHandler):
             now = time.time()
             if newdata:
                 data_stream.unpack(newdata)
-                sample = data_stream.TPV
-                t = sample.get('time')
-                if t is not None and set(GPS_REQUIRED_FIELDS).issubset(set(sample.keys())):
-                    self.pipe_out.send((now, sample))
+                sample = tpv_sample(data_stream)
+                if sample:
+                    self.send_sample((now, sample))
+            else:
+                self.flush_samples()
 
+        self.flush_samples()
         print("GPS reader shutdown")
 
 
@@ -61,3 +76,33 @@ class GpsSensorHandler(SensorHandler):
 
     
 
+
+class AsyncGpsSensorHandler(AsyncSensorHandler):
+    """
+    gpsd reader running on the shared sensor event loop
+    """
+
+    def __init__(self, host=gps3.HOST, port=gps3.GPSD_PORT):
+        AsyncSensorHandler.__init__(self)
+        self.host = host
+        self.port = port
+
+    async def read(self):
+        print("Starting GPS reader")
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        data_stream = gps3.DataStream()
+        try:
+            writer.write(('?WATCH={"enable":true,"%s":true}' % gps3.PROTOCOL).encode())
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break  # gpsd closed the connection
+                now = time.time()
+                data_stream.unpack(line.decode(errors='replace'))
+                sample = tpv_sample(data_stream)
+                if sample:
+                    self.send_sample((now, sample))
+        finally:
+            writer.close()
+            print("GPS reader shutdown")
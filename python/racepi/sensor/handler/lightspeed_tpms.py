@@ -22,9 +22,13 @@ http://macsboost.com/motorsports/data-acquisition/tpms/lightspeed-tpms-by-macsbo
 import bluetooth as bt
 from collections import defaultdict
 
+import asyncio
 import time
 import os
+import select
+import socket
 
+from racepi.sensor.handler.async_handler import AsyncSensorHandler
 from racepi.sensor.handler.sensor_handler import SensorHandler
 
 DEFAULT_TPMS_NAME = 'TPMS'
@@ -87,6 +91,21 @@ class LightSpeedTPMSMessageParser:
         return results
 
 
+def find_tpms_address(tpms_name):
+    """
+    Scan for the TPMS device, blocks until it is found
+
+    :param tpms_name: part of the bluetooth name of the device
+    :return: bluetooth address
+    """
+    while True:
+        nearby_devices = bt.discover_devices(lookup_names=True)
+        for addr, name in nearby_devices:
+            if tpms_name in name:
+                print("tpms: %s - %s" % (addr, name))
+                return addr
+
+
 class LightSpeedTPMSSensorHandler(SensorHandler):
 
     def __init__(self, tpms_name=DEFAULT_TPMS_NAME, bt_port=TPMS_BT_PORT):
@@ -101,13 +120,7 @@ class LightSpeedTPMSSensorHandler(SensorHandler):
         port 6.
         :return: 
         """
-        dev_addr = None
-        while not dev_addr:
-            nearby_devices = bt.discover_devices(lookup_names=True)
-            for addr, name in nearby_devices:
-                if self.tpms_name in name:
-                    print("tpms: %s - %s" % (addr, name))
-                    dev_addr = addr
+        dev_addr = find_tpms_address(self.tpms_name)
 
         # Create the client socket
         self.sock = bt.BluetoothSocket(bt.RFCOMM)
@@ -118,7 +131,7 @@ class LightSpeedTPMSSensorHandler(SensorHandler):
             raise ValueError("Illegal argument, no queue specified")
 
         os.system("taskset -p 0xfe %d" % os.getpid())        
-        import os.nice(20)
+        os.nice(20)
         
         print("Starting LightSpeed TPMS reader")
         while not self.doneEvent.is_set():
@@ -130,15 +143,69 @@ class LightSpeedTPMSSensorHandler(SensorHandler):
                     return
 
             try:
+                readable, _, _ = select.select([self.sock], [], [], self.batch_latency)
+                if not readable:
+                    self.flush_samples()
+                    continue
                 d = self.sock.recv(TPMS_MESG_LEN)
                 now = time.time()
                 data = LightSpeedTPMSMessageParser.unpack_messages(d)
-                self.pipe_out.send((now, data))
+                self.send_sample((now, data))
             except bt.btcommon.BluetoothError:
                 print("tpms: disconnected")
                 self.sock = None
 
+        self.flush_samples()
         if self.sock:
             self.sock.close()
 
 
+class AsyncLightSpeedTPMSSensorHandler(AsyncSensorHandler):
+    """
+    TPMS reader running on the shared sensor event loop. The RFCOMM
+    connection uses a native bluetooth socket, the device scan runs in
+    an executor thread.
+    """
+
+    def __init__(self, tpms_name=DEFAULT_TPMS_NAME, bt_port=TPMS_BT_PORT):
+        AsyncSensorHandler.__init__(self)
+        self.tpms_name = tpms_name
+        self.port = bt_port
+
+    async def __connect(self, loop):
+        dev_addr = await loop.run_in_executor(None, find_tpms_address, self.tpms_name)
+        sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, (dev_addr, self.port))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    async def read(self):
+        print("Starting LightSpeed TPMS reader")
+        loop = asyncio.get_running_loop()
+        sock = None
+        try:
+            while True:
+                if not sock:
+                    try:
+                        sock = await self.__connect(loop)
+                    except OSError as e:
+                        print("tpms: failed to connect:" + str(e))
+                        return
+                try:
+                    d = await loop.sock_recv(sock, TPMS_MESG_LEN)
+                except OSError:
+                    d = None
+                if not d:
+                    print("tpms: disconnected")
+                    sock.close()
+                    sock = None
+                    continue
+                now = time.time()
+                self.send_sample((now, LightSpeedTPMSMessageParser.unpack_messages(d)))
+        finally:
+            if sock:
+                sock.close()
@@ -70,6 +70,10 @@ class RpiImuSensorHandler(SensorHandler):
         while not self.doneEvent.is_set():
             if imu.IMURead():
                 data = imu.getIMUData()
-                self.pipe_out.send((time.time(), data))
+                self.send_sample((time.time(), data))
                 time.sleep(poll_interval_ms * 0.95 / 1000.0)
+            else:
+                self.flush_expired_samples()
+
+        self.flush_samples()
 
@@ -14,18 +14,44 @@
 # You should have received a copy of the GNU General Public License
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
 from multiprocessing import Pipe, Event, Process
 
+# Samples are sent to the consumer in batches. A batch is flushed
+# when it is full or when its oldest sample has waited too long,
+# whichever happens first.
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_BATCH_LATENCY = 0.02  # seconds
+
 
 class SensorHandler:
     """
     Base handler class for using producer-consumer sensor reading, using
     multiproccess
+
+    Readers call send_sample() from the producer process. Samples are
+    coalesced into lists and sent over the pipe as a single message,
+    which avoids one pickle and pair of syscalls per sample on busy
+    sources like the CAN bus.
+
+    Consumers can block on wait_handle with multiprocessing.connection.wait.
+    It becomes readable when a batch is sent.
     """
-    def __init__(self, read_func):
+    def __init__(self, read_func, batch_size=DEFAULT_BATCH_SIZE,
+                 batch_latency=DEFAULT_BATCH_LATENCY):
+        """
+        :param read_func: producer function, run in a separate process
+        :param batch_size: maximum number of samples per batch
+        :param batch_latency: maximum time in seconds a sample is held before its batch is sent,
+                              readers must flush while idle for this to hold when no samples arrive
+        """
         self.doneEvent = Event()
         self.pipe_out, self.pipe_in = Pipe()
         self.process = Process(target=read_func)
+        self.batch_size = max(1, batch_size)
+        self.batch_latency = batch_latency
+        self.pending_samples = []
+        self.pending_since = 0.0
 
     def start(self):
         """
@@ -41,7 +67,91 @@ class SensorHandler:
         """
         self.doneEvent.set()
         self.process.join(3)
-        self.process.terminate()
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def close(self):
+        """
+        Release the pipe, event and process of a stopped handler.
+        Subclasses also close their device. The handler cannot be
+        started again.
+        """
+        self.pipe_in.close()
+        self.pipe_out.close()
+        if self.process.pid is not None:
+            self.process.close()
+        # multiprocessing events have no close, the semaphore is freed with the last reference
+        self.doneEvent = None
+
+    def is_alive(self):
+        """
+        :return: true if the reader process is running
+        """
+        return self.process.is_alive()
+
+    @property
+    def dropped_samples(self):
+        """
+        :return: number of dropped samples, always 0 as batches are never dropped
+        """
+        return 0
+
+    def send_sample(self, sample):
+        """
+        Queue a sample for the consumer, called from the producer process.
+        The sample is sent when the current batch is full or too old.
+
+        :param sample: sensor data tuple (time, value)
+        """
+        if not self.pending_samples:
+            self.pending_since = time.time()
+        self.pending_samples.append(sample)
+        if len(self.pending_samples) >= self.batch_size or \
+                time.time() - self.pending_since >= self.batch_latency:
+            self.flush_samples()
+
+    def flush_expired_samples(self):
+        """
+        Send the queued batch if it has been held for longer than the
+        batch latency. Readers call this while their source is idle so
+        that the last samples of a burst are not held back.
+        """
+        if self.pending_samples and \
+                time.time() - self.pending_since >= self.batch_latency:
+            self.flush_samples()
+
+    def flush_samples(self):
+        """
+        Send all queued samples to the consumer as a single batch
+        """
+        if self.pending_samples:
+            self.pipe_out.send(self.pending_samples)
+            self.pending_samples = []
+
+    @property
+    def wait_handle(self):
+        """
+        :return: connection that is readable when data is queued, for multiprocessing.connection.wait
+        """
+        return self.pipe_in
+
+    def data_ready(self):
+        """
+        Check for queued data without blocking
+
+        :return: true if data is queued
+        """
+        return self.pipe_in.poll()
+
+    def get_batch(self):
+        """
+        Read a single batch from the sensor handler, if available
+        :return: list of sensor data tuples, empty if no batch is queued
+        """
+        if self.pipe_in.poll():
+            return self.pipe_in.recv()
+        return []
 
     def get_all_data(self):
         """
@@ -50,6 +160,5 @@ class SensorHandler:
         """
         data = []
         while self.pipe_in.poll():
-            data.append(self.pipe_in.recv())
+            data.extend(self.pipe_in.recv())
         return data
-
@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
 
+from racepi.can.data import CanSample
 from racepi.sensor.handler.sensor_handler import SensorHandler
 import time
 
@@ -43,10 +44,13 @@ class SimulatedCanSensorHandler(SensorHandler):
             now = time.time()*1000
             for m in self.msg_defs:
                 if (last_msg_times[m] + m[1]) < now:
-                    self.pipe_out.send((now, m[0]))
+                    self.send_sample((now, CanSample.from_hex_string(now, m[0])))
                     last_msg_times[m] = now
+            self.flush_expired_samples()
             time.sleep(0.001)
 
+        self.flush_samples()
+
         print("Shutting down CAN reader")
 
 
@@ -15,12 +15,16 @@
 # You should have received a copy of the GNU General Public License
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+import select
 import socket
 import time
 import struct
 import sys
 import os
 
+from racepi.can.data import CanSample
+from racepi.sensor.handler.async_handler import AsyncSensorHandler
 from racepi.sensor.handler.sensor_handler import SensorHandler
 
 if not hasattr(socket, "PF_CAN"):
@@ -29,44 +33,187 @@ if not hasattr(socket, "PF_CAN"):
 DEFAULT_CAN_DEVICE = "slcan0"
 
 # Basic data frame format: https://en.wikipedia.org/wiki/CAN_bus#Data_frame
-CAN_MESSAGE_FMT = "<IB3x8B"
+CAN_MESSAGE_FMT = "<IB3x8s"
+CAN_MESSAGE_SIZE = struct.calcsize(CAN_MESSAGE_FMT)
+# struct canfd_frame, the len and flags bytes share the layout of can_frame
+CANFD_MESSAGE_FMT = "<IB3x64s"
+CANFD_MESSAGE_SIZE = struct.calcsize(CANFD_MESSAGE_FMT)
+# can_id carries the EFF/RTR/ERR flags in its top bits
+CAN_SFF_MASK = 0x7FF
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+
+# frames read per call of CanFrameBatchReader.read_samples()
+DEFAULT_CAN_READ_BATCH = 256
+# kernel receive timestamps as struct timeval, the socket module lacks the Linux constant
+SO_TIMESTAMP = getattr(socket, "SO_TIMESTAMP", 29)
+TIMEVAL_FMT = "@ll"
+TIMEVAL_SIZE = struct.calcsize(TIMEVAL_FMT)
+
+
+def unpack_can_frame(timestamp, data):
+    """
+    Convert a raw struct can_frame into a CanSample
+
+    :param timestamp: receive time
+    :param data: can_frame or canfd_frame bytes as read from a CAN_RAW socket
+    :return: CanSample with the flag bits removed from the id and the payload cut to the dlc,
+             extended is set for frames with a 29-bit id
+    """
+    fmt = CANFD_MESSAGE_FMT if len(data) == CANFD_MESSAGE_SIZE else CAN_MESSAGE_FMT
+    can_id, dlc, payload = struct.unpack(fmt, data)
+    return CanSample(timestamp, can_id & CAN_EFF_MASK, dlc, payload[:dlc], bool(can_id & CAN_EFF_FLAG))
+
+
+def can_id_filter(can_id):
+    """
+    Kernel filter matching the data frames of one arbitration id. Ids
+    above 0x7FF are 29-bit extended ids, smaller ids are 11-bit ids.
+
+    :param can_id: arbitration id as integer, or a (can_id, can_mask) pair used unchanged
+    :return: (can_id, can_mask) for CAN_RAW_FILTER
+    """
+    if isinstance(can_id, tuple):
+        return can_id
+    if can_id > CAN_SFF_MASK:
+        return (can_id & CAN_EFF_MASK) | CAN_EFF_FLAG, CAN_EFF_MASK | CAN_EFF_FLAG | CAN_RTR_FLAG
+    return can_id, CAN_SFF_MASK | CAN_EFF_FLAG | CAN_RTR_FLAG
+
+
+class CanFrameBatchReader:
+    """
+    Reads all pending frames of a CAN_RAW socket per call. The socket is
+    made non-blocking; callers wait for it to become readable with
+    select or an event loop.
+
+    Frames are received with recvmsg_into() into consecutive slots of a
+    preallocated buffer and unpacked in one pass. With CAN FD frames
+    enabled each slot holds a canfd_frame, classic frames received into
+    a slot are unpacked by their dlc. Sample times are the
+    kernel receive timestamps (SO_TIMESTAMP), so they do not depend on
+    when the reader gets scheduled. time.time() is used if the kernel
+    does not supply them.
+    """
+
+    def __init__(self, cansocket, batch_size=DEFAULT_CAN_READ_BATCH, kernel_timestamps=True, fd_frames=False):
+        """
+        :param cansocket: bound CAN_RAW socket
+        :param batch_size: maximum number of frames per read
+        :param kernel_timestamps: request kernel receive timestamps
+        :param fd_frames: the socket has CAN_RAW_FD_FRAMES enabled
+        """
+        self.sock = cansocket
+        self.fd_frames = fd_frames
+        self.frame_fmt = CANFD_MESSAGE_FMT if fd_frames else CAN_MESSAGE_FMT
+        self.frame_size = CANFD_MESSAGE_SIZE if fd_frames else CAN_MESSAGE_SIZE
+        self.frame_sizes = (CAN_MESSAGE_SIZE, CANFD_MESSAGE_SIZE) if fd_frames else (CAN_MESSAGE_SIZE,)
+        self.sock.setblocking(False)
+        self.kernel_timestamps = kernel_timestamps
+        if kernel_timestamps:
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMP, 1)
+            except OSError:
+                self.kernel_timestamps = False
+        self.batch_size = batch_size
+        self.buffer = memoryview(bytearray(self.frame_size * batch_size))
+        self.ancbufsize = socket.CMSG_SPACE(TIMEVAL_SIZE)
+
+    @staticmethod
+    def __receive_time(ancdata):
+        for level, msg_type, data in ancdata:
+            if level == socket.SOL_SOCKET and msg_type == SO_TIMESTAMP and len(data) >= TIMEVAL_SIZE:
+                sec, usec = struct.unpack(TIMEVAL_FMT, data[:TIMEVAL_SIZE])
+                return sec + usec * 1e-6
+        return time.time()
+
+    def read_samples(self):
+        """
+        Read pending frames without blocking
+
+        :return: list of (timestamp, CanSample) tuples, oldest first, empty if no frame is pending
+        """
+        timestamps = []
+        count = 0
+        while count < self.batch_size:
+            offset = count * self.frame_size
+            try:
+                nbytes, ancdata, _, _ = self.sock.recvmsg_into(
+                    [self.buffer[offset:offset + self.frame_size]], self.ancbufsize)
+            except (BlockingIOError, InterruptedError):
+                break
+            if nbytes not in self.frame_sizes:
+                continue  # not a CAN frame, the slot is reused
+            timestamps.append(self.__receive_time(ancdata))
+            count += 1
+
+        frames = struct.iter_unpack(self.frame_fmt, self.buffer[:count * self.frame_size])
+        return [(t, CanSample(t, can_id & CAN_EFF_MASK, dlc, payload[:dlc], bool(can_id & CAN_EFF_FLAG)))
+                for t, (can_id, dlc, payload) in zip(timestamps, frames)]
+
+
+def set_can_id_filters(cansocket, can_filters):
+    """
+    Set kernel RX filters to receive only specified IDs, other frames
+    are dropped before they reach the socket. Without IDs the kernel
+    default of receiving all frames is kept.
+
+    :param cansocket: CAN_RAW socket
+    :param can_filters: list of arbitration IDs to receive, see can_id_filter()
+    """
+    if not can_filters:
+        return
+    filter_fmt = "={}I".format(2 * len(can_filters))
+    filter_data = []
+    for f in can_filters:
+        filter_data.extend(can_id_filter(f))
+        print("setting filter: %s" % str(f))
+    cansocket.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER,
+                         struct.pack(filter_fmt, *filter_data))
+
+
+def open_can_socket(device_name, can_filters, fd_frames=False):
+    """
+    :param device_name: name of socketcan device (e.g. slcan0)
+    :param can_filters: list of allowed arbitration IDs, as integer
+    :param fd_frames: also receive CAN FD frames
+    :return: bound CAN_RAW socket, None if the device is not available
+    """
+    cansocket = socket.socket(socket.PF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+    set_can_id_filters(cansocket, can_filters)
+    if fd_frames:
+        cansocket.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FD_FRAMES, 1)
+    try:
+        cansocket.bind((device_name,))
+    except OSError as e:
+        print(str(e) + ":" + device_name, file=sys.stderr)
+        cansocket.close()
+        return None
+    return cansocket
 
 
 class SocketCanSensorHandler(SensorHandler):
 
-    def __init__(self, device_name=DEFAULT_CAN_DEVICE, can_filters=[]):
+    def __init__(self, device_name=DEFAULT_CAN_DEVICE, can_filters=[], fd_frames=False):
         """
         :param device_name: name of socketcan device (e.g. slcan0)
-        :param can_filters: list of allowed arbitration IDs, as integer
+        :param can_filters: list of allowed arbitration IDs, as integer, empty for all
+        :param fd_frames: also receive CAN FD frames
         """
 
-        # TODO this should retry in the case that the device comes online
-        # while running
+        # without the device the reader exits at once, SensorSupervisor
+        # recreates the handler until the device comes online
 
         SensorHandler.__init__(self, self.__record_from_can)
         self.dev_name = device_name
-        self.cansocket = socket.socket(socket.PF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
-        self._set_can_id_filters(can_filters)
-        try:
-            self.cansocket.bind((self.dev_name,))
-        except OSError as e:
-            print(str(e) + ":" + self.dev_name, file=sys.stderr)
-            self.cansocket = None
+        self.fd_frames = fd_frames
+        self.cansocket = open_can_socket(device_name, can_filters, fd_frames)
 
-    def _set_can_id_filters(self, can_filters):
-        """
-        Set RX filters to receive only specified IDs
-
-        :param can_filters: list of arbitration IDs to receive
-        """
-        filter_fmt = "={}I".format(2 * len(can_filters))
-        filter_data = []
-        for f in can_filters:
-            filter_data.append(f)
-            filter_data.append(0xFFF)
-            print("setting filter: %s" % str(f))
-        self.cansocket.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER,
-                                  struct.pack(filter_fmt, *filter_data))
+    def close(self):
+        SensorHandler.close(self)
+        if self.cansocket:
+            self.cansocket.close()
+            self.cansocket = None
 
     def __record_from_can(self):
 
@@ -75,25 +222,61 @@ class SocketCanSensorHandler(SensorHandler):
 
         os.system("taskset -p 0xfe %d" % os.getpid())
         os.nice(30)
-        
-        message_size = struct.calcsize(CAN_MESSAGE_FMT)
 
         print("Starting Socket-CAN reader")
-        while not self.doneEvent.is_set() and self.cansocket:
-            data = self.cansocket.recv(message_size)
-            now = time.time()
-            if data:
-
-                # this unpacking is not strictly necessary, but is a nice
-                # convention and adopted by most socketcan handlers
-                data = struct.unpack(CAN_MESSAGE_FMT, data)
-
-                # check for empty data
-                if data and len(data) > 1:
-                    # pack the message back into a string
-                    result = "%03x" % data[0] + \
-                             "".join([("%02x" % v) for v in data[2:]])
-                    self.pipe_out.send((now, result))
+        reader = CanFrameBatchReader(self.cansocket, fd_frames=self.fd_frames) if self.cansocket else None
+        while not self.doneEvent.is_set() and reader:
+            # wake up periodically so a partial batch is not held
+            # while the bus is quiet
+            readable, _, _ = select.select([self.cansocket], [], [], self.batch_latency)
+            samples = reader.read_samples() if readable else []
+            if not samples:
+                self.flush_samples()
+                continue
+            for sample in samples:
+                self.send_sample(sample)
 
+        self.flush_samples()
         print("Shutting down SocketCAN reader")
 
+
+class AsyncSocketCanSensorHandler(AsyncSensorHandler):
+    """
+    SocketCAN reader running on the shared sensor event loop
+    """
+
+    def __init__(self, device_name=DEFAULT_CAN_DEVICE, can_filters=[], fd_frames=False):
+        """
+        :param device_name: name of socketcan device (e.g. slcan0)
+        :param can_filters: list of allowed arbitration IDs, as integer, empty for all
+        :param fd_frames: also receive CAN FD frames
+        """
+        AsyncSensorHandler.__init__(self)
+        self.dev_name = device_name
+        self.fd_frames = fd_frames
+        self.cansocket = open_can_socket(device_name, can_filters, fd_frames)
+
+    def close(self):
+        AsyncSensorHandler.close(self)
+        if self.cansocket:
+            self.cansocket.close()
+            self.cansocket = None
+
+    async def read(self):
+        if not self.cansocket:
+            return
+        print("Starting Socket-CAN reader")
+        reader = CanFrameBatchReader(self.cansocket, fd_frames=self.fd_frames)
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(self.cansocket.fileno(), readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                # frames left after a full batch make the socket readable again
+                for sample in reader.read_samples():
+                    self.send_sample(sample)
+        finally:
+            loop.remove_reader(self.cansocket.fileno())
+            print("Shutting down SocketCAN reader")
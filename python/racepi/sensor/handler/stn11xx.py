@@ -42,11 +42,18 @@ class STNHandler:
     def __init__(self, dev=DEV_NAME, baud=BAUD_RATE, headers=True):
 
         # TODO autodetect and set baudrate
-        # TODO auto retry and reinit on hotplug
+        # reinit on hotplug is done by recreating the handler, see SensorSupervisor
         print("Initializing STN11xx device on port %s" % dev)
         self.headers = headers
         self.port = serial.Serial(dev, baud)
-
+        try:
+            self.__configure()
+        except Exception:
+            # the supervisor retries with a new handler, which reopens the port
+            self.close()
+            raise
+
+    def __configure(self):
         # reset device and wait for startup
         self.__send_command('atz')
         time.sleep(RESET_WAIT_TIME_SECONDS)
@@ -78,6 +85,14 @@ class STNHandler:
         self.__run_config_cmd("stp " + str(ST_PROTOCOL))
         self.__run_config_cmd("atsp " + str(FORCE_PROTOCOL))
         
+    def close(self):
+        """
+        Close the serial port
+        """
+        if self.port:
+            self.port.close()
+            self.port = None
+
     def set_monitor_ids(self, ids):
         """
         Reset CAN monitors to only allow data from the list
@@ -157,19 +172,30 @@ class STNHandler:
         # TODO, headers should be checked and stripped here
         return self.__get_result()
 
-    def readline(self):
+    def readline(self, timeout=None):
         """
         Read a line of output from device. This is useful when
         monitoring the CAN bus.
-        :return: single line of output, such as a CAN message
-        """
+        :param timeout: maximum time in seconds to wait for a line to start, forever if None
+        :return: single line of output, such as a CAN message, None on timeout
+        """
+        if timeout is not None and self.port and not self.port.in_waiting:
+            self.port.timeout = timeout
+            try:
+                first = self.port.read(1).decode()
+            finally:
+                self.port.timeout = None
+            if not first:
+                return None
+            return self.__get_result(first)
         return self.__get_result()
 
-    def __get_result(self):         
+    def __get_result(self, first=''):
         if self.port:
             buf = ''
             while True:
-                c = self.port.read(1).decode()
+                c = first or self.port.read(1).decode()
+                first = ''
                 if c == "\r" and len(buf) > 0:
                     break
                 else:
@@ -17,13 +17,14 @@
 """
 SensorHandler for CAN bus data. The handler records all messages
 for a list of specified arbitration IDs. Messages are returned as
-received, not decoded.
+CanSamples, not decoded.
 """
 import time
 import os
 
 from serial.serialutil import SerialException
 
+from racepi.can.data import CanSample
 from racepi.sensor.handler.sensor_handler import SensorHandler
 from racepi.sensor.handler.stn11xx import STNHandler
 
@@ -39,6 +40,11 @@ class STN11XXCanSensorHandler(SensorHandler):
             print("Failed to initialize CAN device")
             self.stn = None
 
+    def close(self):
+        SensorHandler.close(self)
+        if self.stn:
+            self.stn.close()
+
     def __record_from_canbus(self):
 
         if not self.pipe_out:
@@ -52,11 +58,17 @@ class STN11XXCanSensorHandler(SensorHandler):
             self.stn.start_monitor()
 
             while not self.doneEvent.is_set():
-                data = self.stn.readline()
-                if "CAN ERROR" not in data:
+                data = self.stn.readline(timeout=self.batch_latency)
+                if not data:
+                    self.flush_samples()
+                elif "CAN ERROR" not in data:
                     now = time.time()
-                    self.pipe_out.send((now, data))
-                
+                    try:
+                        self.send_sample((now, CanSample.from_hex_string(now, data)))
+                    except ValueError:
+                        pass  # skip partial or garbled lines
+
+            self.flush_samples()
             # stop monitors
             self.stn.stop_monitor()
         print("Shutting down CAN reader")
@@ -26,6 +26,10 @@ class STN11XXOBD2SensorHandler(SensorHandler):
         SensorHandler.__init__(self, self.__poll_obd2_pids)
         self.stn = STNHandler(dev=tty, headers=False)
 
+    def close(self):
+        SensorHandler.close(self)
+        self.stn.close()
+
     def get_tps(self):
         rv = self.stn.get_pid("01", "11")
 
@@ -53,11 +57,13 @@ class STN11XXOBD2SensorHandler(SensorHandler):
 
             tps = self.get_tps()
             if not tps:
+                self.flush_samples()
                 time.sleep(0.05)
             else:
                 now = time.time()
-                self.pipe_out.send((now, tps))
+                self.send_sample((now, tps))
 
+        self.flush_samples()
         print("Shutting down OBD2 reader")
 
 
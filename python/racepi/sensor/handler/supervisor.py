@@ -0,0 +1,229 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Supervision of sensor handlers. A handler whose reader exits, e.g.
+when a USB device is unplugged or a bluetooth scan fails, is replaced
+by a new one after an exponentially growing delay. Handlers cannot be
+restarted in place, so each restart builds a new handler, which also
+reopens the device.
+"""
+
+import time
+from enum import Enum
+from multiprocessing import Pipe
+
+DEFAULT_RESTART_BACKOFF = 1.0  # seconds
+MAX_RESTART_BACKOFF = 60.0
+# running this long without exiting resets the restart delay
+HEALTHY_RESET_SECONDS = 30.0
+DEFAULT_STALL_SECONDS = 5.0
+
+
+class SensorHealth(Enum):
+    starting = 1  # running, no samples yet
+    ok = 2        # running and receiving samples
+    stalled = 3   # running, no samples for the stall timeout
+    down = 4      # not running, waiting to restart
+
+
+class SupervisedSensorHandler:
+    """
+    Wraps a sensor handler factory in the consumer interface of
+    SensorHandler, so the logger does not see restarts. Samples still
+    queued by an exited handler are kept.
+    """
+
+    def __init__(self, name, factory, stall_timeout=DEFAULT_STALL_SECONDS,
+                 backoff=DEFAULT_RESTART_BACKOFF, max_backoff=MAX_RESTART_BACKOFF):
+        """
+        :param name: sensor name for reporting, e.g. 'gps'
+        :param factory: function creating a new, not yet started, handler
+        :param stall_timeout: seconds without samples before the sensor is reported stalled
+        :param backoff: delay before the first restart, doubled on each restart
+        :param max_backoff: maximum delay between restarts
+        """
+        self.name = name
+        self.factory = factory
+        self.stall_timeout = stall_timeout
+        self.initial_backoff = backoff
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.handler = None
+        self.health = SensorHealth.down
+        self.restarts = 0
+        self.next_restart = 0.0
+        self.started_at = 0.0
+        self.last_sample_time = 0.0
+        self.sample_rate = 0.0
+        self.sample_count = 0
+        self.rate_time = time.time()
+        self.pending_data = []
+        self.dropped_base = 0
+        # wait handle while no handler is running, never readable
+        self.idle_handle, self.idle_out = Pipe(duplex=False)
+
+    def __set_health(self, health):
+        if health != self.health:
+            print("%s: %s" % (self.name, health.name))
+            self.health = health
+
+    def __start_handler(self, now):
+        try:
+            handler = self.factory()
+            handler.start()
+        except Exception as e:
+            print("%s: failed to start: %s" % (self.name, str(e)))
+            self.__schedule_restart(now)
+            return
+        self.handler = handler
+        self.started_at = now
+        self.__set_health(SensorHealth.starting)
+
+    def __schedule_restart(self, now):
+        self.next_restart = now + self.backoff
+        print("%s: restarting in %.1fs" % (self.name, self.backoff))
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+        self.__set_health(SensorHealth.down)
+
+    def __retire_handler(self):
+        # keep samples sent before the reader exited
+        self.pending_data.extend(self.handler.get_all_data())
+        self.dropped_base += self.handler.dropped_samples
+        self.__close_handler()
+
+    def __close_handler(self):
+        # release the pipes and device of the old handler, each restart opens new ones
+        self.handler.stop()
+        self.handler.close()
+        self.handler = None
+
+    def start(self):
+        self.__start_handler(time.time())
+
+    def stop(self):
+        if self.handler:
+            self.__close_handler()
+
+    def check(self, now=None):
+        """
+        Restart an exited handler once its delay has passed and update
+        the health state and sample rate. Call periodically.
+
+        :param now: current time in seconds
+        :return: health state
+        """
+        if now is None:
+            now = time.time()
+
+        if self.handler is None:
+            if now >= self.next_restart:
+                self.restarts += 1
+                self.__start_handler(now)
+        elif not self.handler.is_alive():
+            print("%s: reader exited" % self.name)
+            self.__retire_handler()
+            self.__schedule_restart(now)
+        else:
+            if now - self.started_at >= HEALTHY_RESET_SECONDS:
+                self.backoff = self.initial_backoff
+            if self.last_sample_time >= self.started_at and now - self.last_sample_time <= self.stall_timeout:
+                self.__set_health(SensorHealth.ok)
+            elif now - max(self.started_at, self.last_sample_time) > self.stall_timeout:
+                self.__set_health(SensorHealth.stalled)
+
+        elapsed = now - self.rate_time
+        if elapsed > 0:
+            self.sample_rate = self.sample_count / elapsed
+            self.sample_count = 0
+            self.rate_time = now
+        return self.health
+
+    @property
+    def dropped_samples(self):
+        return self.dropped_base + (self.handler.dropped_samples if self.handler else 0)
+
+    @property
+    def wait_handle(self):
+        return self.handler.wait_handle if self.handler else self.idle_handle
+
+    def data_ready(self):
+        return bool(self.pending_data) or (self.handler is not None and self.handler.data_ready())
+
+    def get_all_data(self):
+        """
+        Read all queued data from the current handler
+        :return: list of sensor data tuples, each tuple is (time, value)
+        """
+        data = self.pending_data
+        self.pending_data = []
+        if self.handler:
+            data.extend(self.handler.get_all_data())
+        if data:
+            self.sample_count += len(data)
+            self.last_sample_time = time.time()
+        return data
+
+    def get_status(self):
+        """
+        :return: dictionary of health state, restart count and sample rate in hz
+        """
+        return {
+            'health': self.health.name,
+            'restarts': self.restarts,
+            'sample_rate': round(self.sample_rate, 1),
+        }
+
+
+class SensorSupervisor:
+    """
+    Set of supervised sensors, checked together by the logger
+    """
+
+    def __init__(self):
+        self.sensors = {}
+
+    def supervise(self, name, factory, **kwargs):
+        """
+        :param name: sensor name, e.g. 'gps'
+        :param factory: function creating a new handler
+        :param kwargs: options of SupervisedSensorHandler
+        :return: SupervisedSensorHandler to use as the sensor's handler
+        """
+        sensor = SupervisedSensorHandler(name, factory, **kwargs)
+        self.sensors[name] = sensor
+        return sensor
+
+    def check(self, now=None):
+        """
+        Check all sensors, restarting exited handlers
+        """
+        if now is None:
+            now = time.time()
+        for sensor in self.sensors.values():
+            sensor.check(now)
+
+    def lost_sensors(self):
+        """
+        :return: names of sensors that are not running
+        """
+        return [name for name, s in self.sensors.items() if s.health == SensorHealth.down]
+
+    def get_status(self):
+        """
+        :return: dictionary of sensor name to status dictionary
+        """
+        return {name: s.get_status() for name, s in self.sensors.items()}
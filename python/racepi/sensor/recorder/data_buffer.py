@@ -14,36 +14,66 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
-from collections import defaultdict
+import sys
+from collections import defaultdict, deque
 
 
 class DataBuffer:
     """
     Simple collection of buffers for sensor data
+
+    Each source is a deque in time order, so appending and expiring
+    samples are O(1) per sample. Sources can be bounded; when a source
+    is full its oldest samples are dropped and counted.
     """
-    def __init__(self):
-        self.data = defaultdict(list)
+    def __init__(self, source_capacity=None):
+        """
+        :param source_capacity: maximum number of samples per source, either
+                                an integer for all sources or a dict of source
+                                name to integer, None for unbounded
+        """
+        self.source_capacity = source_capacity
+        self.data = {}
+        self.dropped_samples = defaultdict(int)
+
+    def __get_capacity(self, source_name):
+        if isinstance(self.source_capacity, dict):
+            return self.source_capacity.get(source_name)
+        return self.source_capacity
 
     def add_sample(self, source_name, values):
-        self.data[source_name].extend(values)
+        """
+        :param source_name: name of sensor source
+        :param values: list of samples, oldest first
+        :return: number of old samples dropped because the source is full
+        """
+        buf = self.data.get(source_name)
+        if buf is None:
+            buf = self.data[source_name] = deque(maxlen=self.__get_capacity(source_name))
+        overflow = 0
+        if buf.maxlen is not None:
+            overflow = max(0, len(buf) + len(values) - buf.maxlen)
+            self.dropped_samples[source_name] += overflow
+        buf.extend(values)
+        return overflow
 
     def expire_old_samples(self, expire_time):
         """
         Expire (remove) all samples older than specified time
         :param expire_time: expiration age timestamp
         """
-        for k in self.data:
-            while self.data[k] and self.data[k][0][0] < expire_time:
-                self.data[k].pop(0)
+        for buf in self.data.values():
+            while buf and buf[0][0] < expire_time:
+                buf.popleft()
 
     def get_available_sources(self):
-        return self.data.keys()
+        return list(self.data.keys())
 
     def get_sensor_data(self, sensor_source):
         """
         Get data for specified source and clear buffer
         :param sensor_source: name of sensor source
-        :return: data for specified sensor source
+        :return: data for specified sensor source, oldest first
         """
         # fail early if an invalid source is requested
         if sensor_source not in self.data:
@@ -51,6 +81,26 @@ class DataBuffer:
 
         return self.data[sensor_source]
 
+    def get_sample_count(self):
+        """
+        :return: number of samples held over all sources
+        """
+        return sum(len(buf) for buf in self.data.values())
+
+    def get_memory_usage(self):
+        """
+        Estimate the memory held by each source. Samples are assumed to
+        be the size of the newest one, so this is O(1) per source.
+
+        :return: dict of source name to (sample count, estimated bytes)
+        """
+        usage = {}
+        for source_name, buf in self.data.items():
+            sample_bytes = 0
+            if buf:
+                sample_bytes = sum(sys.getsizeof(v) for v in buf[-1]) + sys.getsizeof(buf[-1])
+            usage[source_name] = (len(buf), sys.getsizeof(buf) + len(buf) * sample_bytes)
+        return usage
+
     def clear(self):
         self.data.clear()
-
@@ -0,0 +1,172 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Background database writer for the SensorLogger. All database access
+runs in a single worker thread so that SQLite commit latency never
+stalls the logging loop.
+"""
+
+import time
+from concurrent.futures import Future
+from queue import Queue, Full
+from threading import Thread
+from uuid import uuid1
+
+# about two seconds of logging loop iterations
+DEFAULT_WRITER_QUEUE_SIZE = 64
+# longest time the logging loop may be stalled by a full queue
+DEFAULT_MAX_SUBMIT_WAIT = 0.5
+
+
+class BackgroundDbWriter:
+    """
+    Runs database handler calls in order on a worker thread. The job
+    queue is bounded; when it is full, submitting blocks the caller for
+    at most max_submit_wait seconds (backpressure). Jobs that still do
+    not fit are dropped. Session creation and session info jobs are
+    never dropped, they block until there is room, because the data of
+    a session cannot be written without its session row. Blocked time,
+    dropped jobs and the samples they held are recorded.
+    """
+
+    def __init__(self, db_handler, max_queue_size=DEFAULT_WRITER_QUEUE_SIZE,
+                 max_submit_wait=DEFAULT_MAX_SUBMIT_WAIT):
+        """
+        :param db_handler: connected database handler, e.g. DbHandler
+        :param max_queue_size: maximum number of pending jobs
+        :param max_submit_wait: maximum time in seconds to block on a full queue
+        """
+        self.db_handler = db_handler
+        self.jobs = Queue(maxsize=max_queue_size)
+        self.max_submit_wait = max_submit_wait
+        self.thread = Thread(target=self.__run, daemon=True)
+
+        # backpressure metrics
+        self.jobs_submitted = 0
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.max_queue_depth = 0
+        self.blocked_submits = 0
+        self.blocked_time = 0.0
+        self.dropped_jobs = 0
+        self.dropped_samples = 0
+        self.last_job_time = 0.0
+        self.max_job_time = 0.0
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Write all pending jobs and stop the worker thread
+
+        :param timeout: maximum time in seconds to wait for pending jobs
+        """
+        if self.thread.is_alive():
+            self.jobs.put(None)
+            self.thread.join(timeout)
+
+    def submit(self, func, *args, required=False):
+        """
+        Queue a call for the worker thread
+
+        :param func: function to call
+        :param args: function arguments
+        :param required: block until the job is queued instead of dropping it
+        :return: Future for the result of the call, failed with queue.Full if the job was dropped
+        """
+        job = (Future(), func, args)
+        try:
+            self.jobs.put_nowait(job)
+        except Full:
+            self.blocked_submits += 1
+            start = time.time()
+            try:
+                self.jobs.put(job, timeout=None if required else self.max_submit_wait)
+            except Full as e:
+                self.dropped_jobs += 1
+                job[0].set_exception(e)
+                return job[0]
+            finally:
+                self.blocked_time += time.time() - start
+        self.jobs_submitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.jobs.qsize())
+        return job[0]
+
+    def get_new_session(self):
+        """
+        Create new session. The id is generated immediately and the
+        session row is written ahead of any data queued after it.
+
+        :return: session id
+        """
+        session_id = str(uuid1())
+        self.submit(self.db_handler.get_new_session, session_id, required=True)
+        return session_id
+
+    def log_data(self, data, session_id):
+        """
+        Queue buffered data for writing. The caller must not modify
+        the buffer afterwards. If the queue stays full, the data is
+        dropped and its samples are counted in dropped_samples.
+
+        :param data: DataBuffer of recorded data
+        :param session_id: id of current session
+        """
+        future = self.submit(self.db_handler.log_data_from_active_session, data, session_id)
+        if future.done() and isinstance(future.exception(), Full):
+            samples = data.get_sample_count()
+            self.dropped_samples += samples
+            print("Database writer queue full, dropping %d samples" % samples)
+        return future
+
+    def populate_session_info(self, session_id):
+        return self.submit(self.db_handler.populate_session_info, session_id, required=True)
+
+    def get_metrics(self):
+        """
+        :return: dictionary of queue and latency statistics
+        """
+        return {
+            'queue_depth': self.jobs.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'jobs_submitted': self.jobs_submitted,
+            'jobs_completed': self.jobs_completed,
+            'jobs_failed': self.jobs_failed,
+            'blocked_submits': self.blocked_submits,
+            'blocked_time': self.blocked_time,
+            'dropped_jobs': self.dropped_jobs,
+            'dropped_samples': self.dropped_samples,
+            'last_job_time': self.last_job_time,
+            'max_job_time': self.max_job_time,
+        }
+
+    def __run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            future, func, args = job
+            start = time.time()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                self.jobs_failed += 1
+                print("Database write failed: %s" % e)
+                future.set_exception(e)
+            self.last_job_time = time.time() - start
+            self.max_job_time = max(self.max_job_time, self.last_job_time)
+            self.jobs_completed += 1
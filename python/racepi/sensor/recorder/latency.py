@@ -0,0 +1,82 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Fixed bucket latency histograms, e.g. of the time from a sensor sample
+being read to it being sent to the DL1 feed.
+"""
+
+import numpy as np
+
+# bucket upper bounds in seconds, the last bucket is unbounded
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+class LatencyHistogram:
+    """
+    Counts of latencies per bucket, with the total and maximum
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        """
+        :param buckets: increasing bucket upper bounds in seconds
+        """
+        self.buckets = np.asarray(buckets, dtype=np.float64)
+        self.counts = np.zeros(len(self.buckets) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def add(self, latencies):
+        """
+        :param latencies: latency or sequence of latencies in seconds
+        """
+        latencies = np.atleast_1d(np.asarray(latencies, dtype=np.float64))
+        if not len(latencies):
+            return
+        self.counts += np.bincount(np.searchsorted(self.buckets, latencies), minlength=len(self.counts))
+        self.total += float(latencies.sum())
+        self.max = max(self.max, float(latencies.max()))
+
+    def percentile(self, q):
+        """
+        :param q: percentile, 0 to 100
+        :return: upper bound of the bucket holding the percentile, the maximum for the last bucket
+        """
+        count = self.count
+        if not count:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * count))
+        return float(self.buckets[i]) if i < len(self.buckets) else self.max
+
+    def get_metrics(self):
+        """
+        :return: dictionary of summary statistics in seconds
+        """
+        count = self.count
+        return {
+            'count': count,
+            'mean': self.total / count if count else 0.0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+    def __str__(self):
+        labels = ["<=%gms" % (b * 1000) for b in self.buckets] + [">%gms" % (self.buckets[-1] * 1000)]
+        return " ".join("%s:%d" % (l, c) for l, c in zip(labels, self.counts) if c)
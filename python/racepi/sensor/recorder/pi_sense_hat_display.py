@@ -158,7 +158,25 @@ class RacePiStatusDisplay:
             self.last_heartbeat = now
             self.heartbeat_active = not self.heartbeat_active
 
-    def refresh_display(self, db_time=0, gps_time=0, imu_time=0, can_time=0, tire_time=0, recording=False):
+    def set_sensor_col(self, col_number, now, sample_time, lost):
+        """
+        Set a sensor column from its state
+
+        :param col_number: one of the globally specified column numbers
+        :param now: current time as float in seconds
+        :param sample_time: time of the last sample
+        :param lost: the sensor reader is not running
+        :return: None
+        """
+        if lost:
+            self.set_col_lost(col_number)
+        elif now - sample_time > SENSOR_DISPLAY_TIMEOUT:
+            self.set_col_init(col_number)
+        else:
+            self.set_col_ready(col_number)
+
+    def refresh_display(self, db_time=0, gps_time=0, imu_time=0, can_time=0, tire_time=0, recording=False,
+                        lost_sensors=()):
         """
         Refresh and redraw required display elements. All times floats in seconds.
 
@@ -168,6 +186,7 @@ class RacePiStatusDisplay:
         :param can_time:  time since last can bus sample
         :param tire_time: time since last tire pressure sample
         :param recording: boolean state of data recording
+        :param lost_sensors: names of sensors whose reader is down, e.g. ['can']
         :return:
         """
         now = time.time()
@@ -178,21 +197,10 @@ class RacePiStatusDisplay:
                 else:
                     self.set_col_ready(DB_COL)
             
-                if now - gps_time > SENSOR_DISPLAY_TIMEOUT:
-                    self.set_col_init(GPS_COL)
-                else:
-                    self.set_col_ready(GPS_COL)
+                self.set_sensor_col(GPS_COL, now, gps_time, 'gps' in lost_sensors)
+                self.set_sensor_col(IMU_COL, now, imu_time, 'imu' in lost_sensors)
+                self.set_sensor_col(CAN_COL, now, can_time, 'can' in lost_sensors)
 
-                if now - imu_time > SENSOR_DISPLAY_TIMEOUT:
-                    self.set_col_init(IMU_COL)
-                else:
-                    self.set_col_ready(IMU_COL)
-
-                if now - can_time > SENSOR_DISPLAY_TIMEOUT:
-                    self.set_col_init(CAN_COL)
-                else:
-                    self.set_col_ready(CAN_COL)
-                    
                 self.set_tire_state( (now-tire_time) < TIRE_DISPLAY_TIMEOUT)
 
                 self.update_time = now
@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 # Copyright 2016 Donour Sizemore
 #
 # This file is part of RacePi
@@ -17,22 +17,98 @@
 
 import numpy as np
 
+DEFAULT_CHANNELS = ('value',)
+
 
 class SampleBuffers:
     """
-    A collection of data buffers using numpy arrays
+    A ring buffer of timestamped multi-channel samples using numpy arrays
+
+    Each record holds a timestamp and one value per channel. The ring is
+    stored twice, back to back, and every write goes to both copies with
+    plain slices. Any run of up to `length` most recent records is then
+    contiguous in memory, so reads return views without copying. Samples
+    must be added in time order for the time window queries.
     """
-    def __init__(self, length):
-        self.data = np.zeros(length, dtype='f')
-        self.index = 0
+    def __init__(self, length, channels=DEFAULT_CHANNELS, dtype='f4'):
+        """
+        :param length: maximum number of records
+        :param channels: channel names
+        :param dtype: numpy type of the channel values
+        """
+        self.length = length
+        self.channels = list(channels)
+        self.dtype = np.dtype([('timestamp', 'f8')] + [(c, dtype) for c in self.channels])
+        self.data = np.zeros(2 * length, dtype=self.dtype)
+        self.index = 0  # next slot to write
+        self.count = 0  # number of valid records
+
+    def __len__(self):
+        return self.count
+
+    def __write(self, start, records):
+        # write records at start, wrapping at the end of the doubled buffer
+        first = min(len(records), 2 * self.length - start)
+        self.data[start:start + first] = records[:first]
+        if first < len(records):
+            self.data[:len(records) - first] = records[first:]
+
+    def extend_records(self, records):
+        """
+        Add records to the ring buffer
 
-    def extend(self, x):
-        """"adds array x to ring buffer"""
-        x_index = (self.index + np.arange(x.size)) % self.data.size
-        self.data[x_index] = x
-        self.index = x_index[-1] + 1
+        :param records: structured array of self.dtype, oldest first
+        """
+        records = records[-self.length:]
+        n = len(records)
+        if not n:
+            return
+        self.__write(self.index, records)
+        self.__write(self.index + self.length, records)
+        self.index = (self.index + n) % self.length
+        self.count = min(self.count + n, self.length)
+
+    def extend(self, timestamps, values):
+        """
+        Add samples to the ring buffer
+
+        :param timestamps: sample times, increasing
+        :param values: array of shape (N,) for one channel, or (N, channels)
+        """
+        values = np.asarray(values)
+        records = np.empty(len(timestamps), dtype=self.dtype)
+        records['timestamp'] = timestamps
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+        for i, c in enumerate(self.channels):
+            records[c] = values[:, i]
+        self.extend_records(records)
 
     def get(self):
-        """Returns the first-in-first-out data in the ring buffer"""
-        idx = (self.index + np.arange(self.data.size)) % self.data.size
-        return self.data[idx]
+        """
+        Returns the first-in-first-out data in the ring buffer
+
+        :return: view of all records, oldest first, valid until the next write
+        """
+        end = self.index + self.length
+        return self.data[end - self.count:end]
+
+    def window(self, start, stop=np.inf):
+        """
+        :param start: earliest timestamp, inclusive
+        :param stop: latest timestamp, exclusive
+        :return: view of the records in the time window, oldest first
+        """
+        records = self.get()
+        times = records['timestamp']
+        return records[np.searchsorted(times, start, 'left'):np.searchsorted(times, stop, 'left')]
+
+    def last(self, seconds):
+        """
+        :param seconds: length of the time window
+        :return: view of the records of the last `seconds` before the newest record
+        """
+        if not self.count:
+            return self.get()
+        newest = self.data['timestamp'][self.index + self.length - 1]
+        return self.window(newest - seconds)
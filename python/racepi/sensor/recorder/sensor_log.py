@@ -26,15 +26,28 @@ import time
 import os
 from enum import Enum
 from collections import defaultdict
+from multiprocessing.connection import wait
 
-from racepi.sensor.data_utilities import merge_and_generate_ordered_log, safe_speed_to_float
+import numpy as np
+
+from racepi.sensor.data_utilities import iter_ordered_log, safe_speed_to_float
 from racepi.racetech.writers import RaceTechnologyDL1FeedWriter
 from racepi.sensor.recorder.pi_sense_hat_display import RacePiStatusDisplay, SenseHat, RacePiHatDisplayMissingError
 from racepi.sensor.recorder.data_buffer import DataBuffer
+from racepi.sensor.recorder.db_writer import BackgroundDbWriter
+from racepi.sensor.recorder.latency import LatencyHistogram
 
 ACTIVATE_RECORDING_M_PER_S = 9.5
 MOVEMENT_THRESHOLD_M_PER_S = 2.5
 DEFAULT_DATA_BUFFER_TIME_SECONDS = 10.0
+# bound on buffered samples per source, the pre-roll of a 5khz CAN bus
+DEFAULT_DATA_BUFFER_SOURCE_CAPACITY = 50000
+# the main loop wakes when data arrives, these run on their own timers
+DISPLAY_REFRESH_SECONDS = 0.1
+STATE_UPDATE_SECONDS = 0.1
+SUPERVISOR_CHECK_SECONDS = 1.0
+# minimum time between passes, samples arriving meanwhile are handled together
+COALESCE_SECONDS = 0.002
 
 
 class LoggerState(Enum):
@@ -59,18 +72,19 @@ class SensorLogger:
     done: logging is no longer possible
     """
 
-    def __init__(self, db_handler, sensor_handlers={}, dbc_filename=None):
+    def __init__(self, db_handler, sensor_handlers={}, dbc_filename=None, supervisor=None):
         """
         Create new logger instance with specified handlers. Input and output
         handlers are required.
 
         :param db_handler: output handler for writing sensor data to a database
         :param sensor_handlers: input data handlers, these should be racepi sensor_handlers
+        :param supervisor: SensorSupervisor of supervised handlers, checked periodically
         """
 
         # pin the main logging thread to the first cpu
         os.system("taskset -p 0x01 %d" % os.getpid())
-        self.data = DataBuffer()
+        self.data = DataBuffer(DEFAULT_DATA_BUFFER_SOURCE_CAPACITY)
         self.display = None
         if SenseHat:
             try:
@@ -80,9 +94,17 @@ class SensorLogger:
                 self.display = None
             
         self.handlers = sensor_handlers
+        self.supervisor = supervisor
+        self.dropped_samples = defaultdict(int)
+        # samples dropped by full buffers, the buffer is replaced while logging
+        self.buffer_dropped_samples = defaultdict(int)
         self.db_handler = db_handler
+        self.db_writer = None
         try:
             self.db_handler.connect()
+            # all database access after connecting is done by the writer thread
+            self.db_writer = BackgroundDbWriter(self.db_handler)
+            self.db_writer.start()
         except Exception as e:
             print(e)
             print("No database handler available, recording disabled")
@@ -90,6 +112,8 @@ class SensorLogger:
 
         self.session_id = None
         self.racetech_feed_writer = RaceTechnologyDL1FeedWriter(dbc_filename)
+        # sample read to DL1 feed send, per source
+        self.feed_latency = defaultdict(LatencyHistogram)
         self.state = LoggerState.initialized
 
     def get_new_data(self):
@@ -101,7 +125,15 @@ class SensorLogger:
         new_data = defaultdict(list)
         for h in self.handlers:
             new_data[h] = self.handlers[h].get_all_data()
-            self.data.add_sample(h, new_data[h])
+            overflow = self.data.add_sample(h, new_data[h])
+            if overflow:
+                self.buffer_dropped_samples[h] += overflow
+                samples, size = self.data.get_memory_usage()[h]
+                print("%s: buffer full at %d samples (%d bytes), dropped %d samples" % (h, samples, size, overflow))
+            dropped = self.handlers[h].dropped_samples
+            if dropped > self.dropped_samples[h]:
+                print("%s: dropped %d samples" % (h, dropped - self.dropped_samples[h]))
+                self.dropped_samples[h] = dropped
         return new_data
 
     def activate_conditions(self, data):
@@ -143,8 +175,7 @@ class SensorLogger:
         """
         This function merges multiple data sources in time order
         """
-        flat_data = merge_and_generate_ordered_log(data)
-        for val in flat_data:
+        for val in iter_ordered_log(data):
             if val:
                 if val[0] == 'gps':
                     self.racetech_feed_writer.write_gps_sample(val[1], val[2])
@@ -157,6 +188,11 @@ class SensorLogger:
                         pass  # TODO log exceptions on can handling
         self.racetech_feed_writer.flush_queued_messages()
 
+        sent = time.time()
+        for source, samples in data.items():
+            if samples:
+                self.feed_latency[source].add(sent - np.array([s[0] for s in samples], dtype=np.float64))
+
     def process_new_data(self, data):
         """
         Process dictionary of new data, change recording state if necessary
@@ -169,18 +205,23 @@ class SensorLogger:
 
         # send all data to RaceCapture recorder if available
         self.write_data_rc_feed(data)
+        self.update_state(data)
 
-        if not self.db_handler:
+    def update_state(self, data):
+        """
+        Change recording state if necessary and manage recording buffers
+
+        :param data: dict of sample lists from different SensorHandlers, received since the last update
+        """
+        if not self.db_writer:
             self.data.expire_old_samples(time.time())
             return  # recording is not possible
 
-        # TODO, all of these logic should be in a separate thread
-
         # if necessary, transition state
         if self.state == LoggerState.ready:
             if self.activate_conditions(data):
                 # ready -> logging
-                self.session_id = self.db_handler.get_new_session()
+                self.session_id = self.db_writer.get_new_session()
                 print("New session: %s" % str(self.session_id))
                 self.state = LoggerState.logging
         elif self.state == LoggerState.logging:
@@ -189,11 +230,7 @@ class SensorLogger:
                 self.state = LoggerState.ready
                 # populate metadata for recently ended session
                 if self.session_id:
-                    # TODO, this session info population blocks the main thread for too
-                    # long. It needs to be in a separate thread or process to keep remote
-                    # data clients from losing their minds.
-                    #
-                    # self.db_handler.populate_session_info(self.session_id)
+                    self.db_writer.populate_session_info(self.session_id)
                     self.session_id = None
         else:
             raise RuntimeError("Invalid logger state:" + str(self.state))
@@ -204,48 +241,93 @@ class SensorLogger:
             self.data.expire_old_samples(time.time() - DEFAULT_DATA_BUFFER_TIME_SECONDS)
 
         elif self.state == LoggerState.logging:
-            # write all buffered data to the db
-            if self.db_handler:
-                self.db_handler.log_data_from_active_session(self.data, self.session_id)
-            self.data.clear()
+            # hand the buffered data to the writer thread and start a new buffer
+            self.db_writer.log_data(self.data, self.session_id)
+            self.data = DataBuffer(DEFAULT_DATA_BUFFER_SOURCE_CAPACITY)
+
+    def wait_for_data(self, timeout):
+        """
+        Block until a handler has queued data or the timeout expires
+
+        :param timeout: maximum wait in seconds
+        """
+        if timeout <= 0 or any(h.data_ready() for h in self.handlers.values()):
+            return
+        wait([h.wait_handle for h in self.handlers.values()], timeout)
+
+    def refresh_display(self, update_times):
+        if self.display:
+            self.display.refresh_display(time.time() if self.db_handler else 0,
+                                         gps_time=update_times['gps'],
+                                         imu_time=update_times['imu'],
+                                         can_time=update_times['can'],
+                                         tire_time=0,  # update_times['tpms'],
+                                         recording=(self.state == LoggerState.logging),
+                                         lost_sensors=self.supervisor.lost_sensors() if self.supervisor else ())
 
     def start(self):
         """
         Start handlers and begin recording. The function does not
         normally terminate. New sessions are created as needed.
+
+        New data is sent to the DL1 feed as soon as it arrives. State
+        transitions, display refreshes and sensor supervision run on
+        their own timers.
         """
         for h in self.handlers.values():
             h.start()
 
         update_times = defaultdict(int)
         self.state = LoggerState.ready
+        # data received since the last state update
+        state_data = defaultdict(list)
+        next_state_update = next_display_refresh = next_supervisor_check = last_pass = time.time()
 
         try:
             while True:
-                # read new data
-                new_data = self.get_new_data()
-                # process data
-                self.process_new_data(new_data)
+                self.wait_for_data(min(next_state_update, next_display_refresh, next_supervisor_check) -
+                                   time.time())
+                # let a burst from several handlers arrive before reading
+                idle = last_pass + COALESCE_SECONDS - time.time()
+                if idle > 0:
+                    time.sleep(idle)
+                last_pass = time.time()
 
-                # update display
+                new_data = self.get_new_data()
+                if any(new_data.values()):
+                    self.write_data_rc_feed(new_data)
                 for h in self.handlers:
                     if new_data[h]:
                         update_times[h] = new_data[h][-1][0]
-
-                if self.display:
-                    self.display.refresh_display(time.time() if self.db_handler else 0,
-                                                 gps_time=update_times['gps'],
-                                                 imu_time=update_times['imu'],
-                                                 can_time=update_times['can'],
-                                                 tire_time=0,  # update_times['tpms'],
-                                                 recording=(self.state == LoggerState.logging))
-
-                # there is no reason to ever poll faster than this
-                # 20hz is generally faster than you need refresh remote
-                # receivers
-                time.sleep(0.03)
+                        state_data[h].extend(new_data[h])
+
+                now = time.time()
+                if now >= next_state_update:
+                    self.update_state(state_data)
+                    state_data = defaultdict(list)
+                    next_state_update = now + STATE_UPDATE_SECONDS
+                if now >= next_display_refresh:
+                    self.refresh_display(update_times)
+                    next_display_refresh = now + DISPLAY_REFRESH_SECONDS
+                if now >= next_supervisor_check:
+                    if self.supervisor:
+                        self.supervisor.check(now)
+                    next_supervisor_check = now + SUPERVISOR_CHECK_SECONDS
 
         finally:
             self.racetech_feed_writer.close()
             for h in self.handlers.values():
                 h.stop()
+            if self.db_writer:
+                # flush pending data and close out the active session
+                if self.session_id:
+                    self.db_writer.populate_session_info(self.session_id)
+                self.db_writer.stop()
+                print("Database writer: %s" % str(self.db_writer.get_metrics()))
+            if self.supervisor:
+                print("Sensors: %s" % str(self.supervisor.get_status()))
+            print("Dropped samples: handlers %s, buffer %s" %
+                  (str(dict(self.dropped_samples)), str(dict(self.buffer_dropped_samples))))
+            print("Buffer memory: %s" % str(self.data.get_memory_usage()))
+            for source, histogram in sorted(self.feed_latency.items()):
+                print("%s feed latency: %s %s" % (source, str(histogram.get_metrics()), str(histogram)))
@@ -0,0 +1,150 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import socket
+import threading
+import time
+from multiprocessing.connection import wait
+from unittest import TestCase, main
+
+from racepi.sensor.handler.async_handler import AsyncSensorHandler
+from racepi.sensor.handler.gps import AsyncGpsSensorHandler, GPS_REQUIRED_FIELDS
+
+WAIT_TIMEOUT = 5.0
+
+
+class SocketPairHandler(AsyncSensorHandler):
+    """
+    Reads lines from one end of a socket pair
+    """
+
+    def __init__(self, sock, queue_capacity=100):
+        AsyncSensorHandler.__init__(self, queue_capacity)
+        self.sock = sock
+        self.closed = False
+
+    async def read(self):
+        self.sock.setblocking(False)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                data = await loop.sock_recv(self.sock, 64)
+                for line in data.split():
+                    self.send_sample((time.time(), line))
+        finally:
+            self.closed = True
+
+
+def wait_for_samples(handler, count):
+    samples = []
+    deadline = time.time() + WAIT_TIMEOUT
+    while len(samples) < count and time.time() < deadline:
+        if not handler.data_ready():
+            wait([handler.wait_handle], deadline - time.time())
+        samples.extend(handler.get_all_data())
+    return samples
+
+
+class AsyncSensorHandlerTests(TestCase):
+
+    def setUp(self):
+        self.sock, self.reader_sock = socket.socketpair()
+        self.h = SocketPairHandler(self.reader_sock)
+
+    def tearDown(self):
+        self.h.stop()
+        self.sock.close()
+        self.reader_sock.close()
+
+    def test_send_sample_queue(self):
+        self.assertFalse(self.h.data_ready())
+        self.assertListEqual([], self.h.get_all_data())
+        self.h.send_sample((0, 'a'))
+        self.h.send_sample((1, 'b'))
+        self.assertTrue(self.h.data_ready())
+        self.assertTrue(wait([self.h.wait_handle], 0))
+        self.assertListEqual([(0, 'a'), (1, 'b')], self.h.get_all_data())
+        self.assertFalse(wait([self.h.wait_handle], 0))
+
+    def test_queue_full_drops(self):
+        for i in range(self.h.queue_capacity + 3):
+            self.h.send_sample((i, None))
+        self.assertEqual(3, self.h.dropped_samples)
+        self.assertEqual(self.h.queue_capacity, len(self.h.get_all_data()))
+
+    def test_read_from_socket(self):
+        self.h.start()
+        self.sock.sendall(b"a\nb\n")
+        samples = wait_for_samples(self.h, 2)
+        self.assertListEqual([b'a', b'b'], [s[1] for s in samples])
+        self.sock.sendall(b"c\n")
+        self.assertListEqual([b'c'], [s[1] for s in wait_for_samples(self.h, 1)])
+
+    def test_stop_cancels_reader(self):
+        self.h.start()
+        self.h.stop()
+        deadline = time.time() + WAIT_TIMEOUT
+        while not self.h.closed and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.h.closed)
+
+    def test_close(self):
+        self.h.close()
+        self.assertTrue(self.h.wait_handle.closed)
+        self.assertTrue(self.h.pipe_out.closed)
+
+
+class AsyncGpsSensorHandlerTests(TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.commands = []
+
+    def tearDown(self):
+        self.server.close()
+
+    def serve(self, reports):
+        conn, _ = self.server.accept()
+        with conn:
+            self.commands.append(conn.recv(1024))
+            for r in reports:
+                conn.sendall((json.dumps(r) + "\n").encode())
+
+    def test_read_tpv(self):
+        tpv = {'class': 'TPV', 'time': '2019-01-01T00:00:00.000Z'}
+        tpv.update((f, 1.0) for f in GPS_REQUIRED_FIELDS if f != 'time')
+        server = threading.Thread(target=self.serve, args=([{'class': 'VERSION'}, tpv],))
+        server.start()
+
+        h = AsyncGpsSensorHandler(port=self.server.getsockname()[1])
+        h.start()
+        try:
+            samples = wait_for_samples(h, 2)
+        finally:
+            h.stop()
+        server.join()
+
+        self.assertTrue(self.commands[0].startswith(b'?WATCH='))
+        self.assertEqual('2019-01-01T00:00:00.000Z', samples[-1][1]['time'])
+        self.assertEqual(1.0, samples[-1][1]['speed'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+from unittest import TestCase, main
+
+import numpy as np
+
+from racepi.can import focus_rs_steering_angle_converter, focus_rs_tps_converter, \
+    focus_rs_rpm_converter, focus_rs_brake_pressure_converter, focus_rs_wheelspeed1_converter
+from racepi.can.data import CanFrameValueExtractor, CanFrame, can_payloads_to_array
+
+TEST_COUNT = 200
+
+
+class CanBatchDecodeTests(TestCase):
+
+    def setUp(self):
+        rand = random.Random(42)
+        self.msgs = [bytes(rand.getrandbits(8) for _ in range(8)) for _ in range(TEST_COUNT)]
+        self.frames = can_payloads_to_array(self.msgs)
+
+    def assert_matches_per_frame(self, extractor):
+        expected = [extractor.convert_frame(CanFrame('000', m)) for m in self.msgs]
+        result = extractor.convert_frames(self.frames)
+        self.assertEqual(len(expected), len(result))
+        for e, r in zip(expected, result):
+            self.assertAlmostEqual(e, r)
+
+    def test_payloads_to_array(self):
+        a = can_payloads_to_array(['deadbeef', b'\x01', bytes(range(10))])
+        self.assertEqual((3, 8), a.shape)
+        self.assertListEqual([0xde, 0xad, 0xbe, 0xef, 0, 0, 0, 0], a[0].tolist())
+        self.assertListEqual([1, 0, 0, 0, 0, 0, 0, 0], a[1].tolist())
+        self.assertListEqual(list(range(8)), a[2].tolist())
+
+    def test_empty(self):
+        self.assertEqual(0, len(focus_rs_rpm_converter.convert_frames([])))
+
+    def test_single_bits(self):
+        for i in range(64):
+            self.assert_matches_per_frame(CanFrameValueExtractor(i, 1))
+
+    def test_full_width(self):
+        result = CanFrameValueExtractor(0, 64).convert_frames(['deadbeefdeadbeef'])
+        self.assertEqual(0xdeadbeefdeadbeef, int(result[0]))
+
+    def test_focus_rs_converters(self):
+        for c in [focus_rs_steering_angle_converter, focus_rs_tps_converter, focus_rs_rpm_converter,
+                  focus_rs_brake_pressure_converter, focus_rs_wheelspeed1_converter]:
+            self.assert_matches_per_frame(c)
+
+    def test_linear_offset(self):
+        self.assert_matches_per_frame(CanFrameValueExtractor(4, 12, a=0.1, b=-3, c=-1000.0))
+
+    def test_custom_transform(self):
+        self.assert_matches_per_frame(CanFrameValueExtractor(0, 16, custom_transform=lambda v: -v))
+
+    def test_invalid_shape(self):
+        self.assertRaises(ValueError, focus_rs_rpm_converter.convert_frames, np.zeros((2, 4), dtype=np.uint8))
+        self.assertRaises(ValueError, CanFrameValueExtractor(60, 8).convert_frames, self.frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+from unittest import TestCase, main
+
+import cantools
+
+from racepi.can import CanDecodePlan
+from racepi.racetech.writers import DL1_CAN_SIGNALS
+
+DBC_FILENAME = "dbc/evora.dbc"
+TEST_COUNT = 100
+
+BIG_ENDIAN_DBC = """VERSION ""
+BS_:
+BU_:
+BO_ 512 Motorola: 8 Vector__XXX
+ SG_ Wide : 7|16@0+ (0.5,10) [0|0] "" Vector__XXX
+ SG_ Signed : 23|12@0- (1,0) [0|0] "" Vector__XXX
+ SG_ Nibble : 35|4@0+ (1,0) [0|0] "" Vector__XXX
+ SG_ Last : 63|8@0+ (1,0) [0|0] "" Vector__XXX
+"""
+
+
+class CanDecodePlanTests(TestCase):
+
+    def setUp(self):
+        self.rand = random.Random(7)
+        self.candb = cantools.database.load_file(DBC_FILENAME)
+
+    def random_payload(self, length=8):
+        return bytes(self.rand.getrandbits(8) for _ in range(length))
+
+    def assert_matches_cantools(self, candb, plan):
+        for m in candb.messages:
+            if not plan.get(m.frame_id):
+                continue
+            for _ in range(TEST_COUNT):
+                payload = self.random_payload(m.length)
+                expected = m.decode(payload, decode_choices=False)
+                result = plan.decode(m.frame_id, payload)
+                for name in result:
+                    self.assertAlmostEqual(expected[name], result[name])
+
+    def test_evora_matches_cantools(self):
+        self.assert_matches_cantools(self.candb, CanDecodePlan.from_database(self.candb))
+
+    def test_big_endian_matches_cantools(self):
+        candb = cantools.database.load_string(BIG_ENDIAN_DBC)
+        self.assert_matches_cantools(candb, CanDecodePlan.from_database(candb))
+
+    def test_consumed_signals_only(self):
+        plan = CanDecodePlan.from_dbc_file(DBC_FILENAME, ["EngineSpeed"])
+        self.assertListEqual([0x114], plan.arbitration_ids())
+        self.assertListEqual(["EngineSpeed"], list(plan.decode(0x114, bytes(6)).keys()))
+        self.assertIsNone(plan.decode(0x303, bytes(8)))
+        self.assertIsNone(plan.decode(0x402, bytes(8)))
+
+    def test_dl1_signals(self):
+        plan = CanDecodePlan.from_database(self.candb, DL1_CAN_SIGNALS)
+        self.assertSetEqual({0x85, 0x114, 0x303}, set(plan.arbitration_ids()))
+
+    def test_decode_values_in_signal_order(self):
+        decoder = CanDecodePlan.from_database(self.candb).get(0x114)
+        payload = bytes.fromhex('02c000fb0004')
+        self.assertListEqual(list(decoder.decode(payload).values()), decoder.decode_values(payload))
+        self.assertListEqual(list(decoder.decode(payload).keys()), decoder.signal_names())
+
+    def test_long_payload(self):
+        plan = CanDecodePlan.from_database(self.candb)
+        self.assertEqual(plan.decode(0x114, bytes.fromhex('02c000fb0004')),
+                         plan.decode(0x114, bytes.fromhex('02c000fb0004ffff')))
+
+    def test_decode_frames_matches_decode(self):
+        for candb in [self.candb, cantools.database.load_string(BIG_ENDIAN_DBC)]:
+            plan = CanDecodePlan.from_database(candb)
+            for arb_id in plan.arbitration_ids():
+                payloads = [self.random_payload() for _ in range(TEST_COUNT)]
+                batch = plan.get(arb_id).decode_frames(payloads)
+                for i, p in enumerate(payloads):
+                    for name, value in plan.decode(arb_id, p).items():
+                        self.assertAlmostEqual(value, batch[name][i])
+
+    def test_get_channels(self):
+        plan = CanDecodePlan.from_database(self.candb)
+        channels = plan.get_channels({'rpm': 'EngineSpeed', 'steering': 'SteeringAngle', 'gear': 'Gear'})
+        self.assertSetEqual({'rpm', 'steering'}, set(channels.keys()))
+        arbitration_id, converter = channels['rpm']
+        self.assertEqual(0x114, arbitration_id)
+        payloads = [bytes.fromhex('02c000fb0004'), bytes.fromhex('10000000000000')]
+        self.assertListEqual([plan.decode(0x114, p)['EngineSpeed'] for p in payloads],
+                             converter.convert_frames(payloads).tolist())
+
+    def test_choices_not_decoded(self):
+        candb = cantools.database.load_string(BIG_ENDIAN_DBC + 'VAL_ 512 Nibble 3 "Third" 0 "Neutral" ;\n')
+        payload = bytes.fromhex('0000000003000000')
+        self.assertEqual('Third', str(candb.decode_message(512, payload)['Nibble']))
+        self.assertEqual(3, CanDecodePlan.from_database(candb).decode(512, payload)['Nibble'])
+
+
+if __name__ == "__main__":
+    main()
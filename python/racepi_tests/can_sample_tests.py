@@ -0,0 +1,85 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import pickle
+from unittest import TestCase, main
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from racepi.can.data import CanSample, CanFrame, can_payload_bytes
+from racepi.database.objects import Base, Session, CANData
+
+
+class CanSampleTests(TestCase):
+
+    def test_from_hex_string(self):
+        s = CanSample.from_hex_string(1.0, "085deadbeef")
+        self.assertEqual(0x085, s.arbitration_id)
+        self.assertEqual(4, s.dlc)
+        self.assertEqual(b'\xde\xad\xbe\xef', s.payload)
+
+    def test_from_hex_string_invalid(self):
+        self.assertRaises(ValueError, CanSample.from_hex_string, 1.0, None)
+        self.assertRaises(ValueError, CanSample.from_hex_string, 1.0, "085")
+        self.assertRaises(ValueError, CanSample.from_hex_string, 1.0, "085dea")
+
+    def test_pickle(self):
+        s = CanSample(1.0, 0x7ff, 8, bytes(range(8)))
+        self.assertEqual(s, pickle.loads(pickle.dumps(s)))
+        s = CanSample(1.0, 0x18db33f1, 8, bytes(range(8)), True)
+        self.assertTrue(pickle.loads(pickle.dumps(s)).extended)
+
+    def test_no_dict(self):
+        s = CanSample(1.0, 0x10, 0, b'')
+        self.assertRaises(AttributeError, setattr, s, 'other', 1)
+
+    def test_can_payload_bytes(self):
+        self.assertEqual(b'\xde\xad', can_payload_bytes("dead"))
+        self.assertEqual(b'\xde\xad', can_payload_bytes(b'\xde\xad'))
+        self.assertEqual(b'\xde\xad', can_payload_bytes(bytearray(b'\xde\xad')))
+
+    def test_can_frame_from_bytes(self):
+        self.assertEqual(CanFrame('000', 'deadbeef').payload, CanFrame('000', b'\xde\xad\xbe\xef').payload)
+
+
+class CanPayloadColumnTests(TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine)()
+        s = Session()
+        s.id = "session"
+        self.db.add(s)
+        self.db.commit()
+
+    def test_blob_round_trip(self):
+        v = CANData(session_id="session", timestamp=1.0, arbitration_id=0x10, rtr=0, msg=b'\x00\xff')
+        self.db.add(v)
+        self.db.commit()
+        self.db.expunge_all()
+        self.assertEqual(b'\x00\xff', self.db.query(CANData).one().msg)
+
+    def test_legacy_hex_text(self):
+        self.db.execute("insert into can_data (session_id, timestamp, arbitration_id, rtr, msg) "
+                        "values ('session', 1.0, 16, 0, '00ff')")
+        self.db.commit()
+        self.assertEqual(b'\x00\xff', self.db.query(CANData).one().msg)
+
+
+if __name__ == "__main__":
+    main()
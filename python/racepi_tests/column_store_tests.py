@@ -0,0 +1,139 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase, main
+
+import numpy as np
+
+from racepi.can.data import CanSample, CANFD_PAYLOAD_WIDTH
+from racepi.database.column_store import *
+from racepi.sensor.recorder.data_buffer import DataBuffer
+
+TEST_COUNT = 10
+GPS_SAMPLE = {'time': "2019-01-01T00:00:00.000Z", 'lat': "12.34", 'lon': "45.67", 'alt': "12.345",
+              'speed': "12.34", 'track': "300.0", 'epx': 1.0, 'epy': 2.0, 'epv': None}
+IMU_SAMPLE = {'fusionPose': (1, 2, 3), 'accel': (4, 5, 6), 'gyro': (7, 8, 9)}
+
+
+class ColumnStoreTests(TestCase):
+
+    def setUp(self):
+        self.store_path = tempfile.mkdtemp()
+        self.h = ColumnStoreHandler(self.store_path, chunk_samples=25)
+        self.h.connect()
+        self.session_id = self.h.get_new_session()
+
+    def tearDown(self):
+        shutil.rmtree(self.store_path)
+
+    def get_buffer(self, start=0):
+        data = DataBuffer()
+        times = [float(i) for i in range(start, start + TEST_COUNT)]
+        data.add_sample('gps', [(t, dict(GPS_SAMPLE)) for t in times])
+        data.add_sample('imu', [(t, IMU_SAMPLE) for t in times])
+        data.add_sample('can', [(t, CanSample(t, 0x85, 4, bytes.fromhex("DEADBEEF"))) for t in times])
+        return data
+
+    def test_log_and_read(self):
+        for i in range(3):
+            self.h.log_data_from_active_session(self.get_buffer(i * TEST_COUNT), self.session_id)
+        self.h.populate_session_info(self.session_id)
+
+        r = ColumnStoreReader(self.store_path)
+        gps = r.read_sensor(self.session_id, 'gps', ['timestamp', 'speed', 'epv'])
+        self.assertListEqual([float(i) for i in range(3 * TEST_COUNT)], gps['timestamp'].tolist())
+        self.assertTrue(np.allclose(12.34, gps['speed']))
+        self.assertTrue(np.isnan(gps['epv']).all())
+        self.assertListEqual([9.0] * 3 * TEST_COUNT, r.read_column(self.session_id, 'imu', 'z_gyro').tolist())
+        can = r.read_sensor(self.session_id, 'can')
+        self.assertEqual((3 * TEST_COUNT, CANFD_PAYLOAD_WIDTH), can['payload'].shape)
+        self.assertEqual(bytes.fromhex("DEADBEEF00000000"), can['payload'][0].tobytes()[:8])
+        self.assertListEqual([4] * 3 * TEST_COUNT, can['dlc'].tolist())
+        self.assertListEqual([0x85] * 3 * TEST_COUNT, can['arbitration_id'].tolist())
+        self.assertListEqual([0] * 3 * TEST_COUNT, can['extended'].tolist())
+
+    def test_fd_and_extended_frames(self):
+        data = DataBuffer()
+        payload = bytes(range(CANFD_PAYLOAD_WIDTH))
+        data.add_sample('can', [(1.0, CanSample(1.0, 0x18db33f1, CANFD_PAYLOAD_WIDTH, payload, True)),
+                                (2.0, CanSample(2.0, 0x85, 2, b'\x01\x02')),
+                                (3.0, CanSample(3.0, 0x85, 0, b''))])
+        self.h.log_data_from_active_session(data, self.session_id)
+        self.h.populate_session_info(self.session_id)
+
+        can = ColumnStoreReader(self.store_path).read_sensor(self.session_id, 'can')
+        self.assertListEqual([1.0, 2.0], can['timestamp'].tolist())
+        self.assertListEqual([0x18db33f1, 0x85], can['arbitration_id'].tolist())
+        self.assertListEqual([1, 0], can['extended'].tolist())
+        self.assertListEqual([CANFD_PAYLOAD_WIDTH, 2], can['dlc'].tolist())
+        # FD payloads are stored whole
+        self.assertEqual(payload, can['payload'][0].tobytes())
+        self.assertEqual(b'\x01\x02', can['payload'][1].tobytes()[:can['dlc'][1]])
+
+    def test_version_mismatch(self):
+        with open(os.path.join(self.store_path, CATALOG_FILE), 'w') as f:
+            f.write('{"version": 1, "sessions": {}}')
+        self.assertRaises(ValueError, ColumnStoreReader, self.store_path)
+
+    def test_chunked_writes(self):
+        self.h.log_data_from_active_session(self.get_buffer(), self.session_id)
+        path = os.path.join(self.store_path, self.session_id, column_file_name('imu', 'x_accel'))
+        self.assertFalse(os.path.exists(path))
+        self.h.log_data_from_active_session(self.get_buffer(TEST_COUNT), self.session_id)
+        self.h.log_data_from_active_session(self.get_buffer(2 * TEST_COUNT), self.session_id)
+        # the third write fills a chunk
+        self.assertEqual(3 * TEST_COUNT, len(read_column_file(path, '<f8')))
+
+    def test_truncated_chunk_ignored(self):
+        self.h.log_data_from_active_session(self.get_buffer(), self.session_id)
+        self.h.populate_session_info(self.session_id)
+        path = os.path.join(self.store_path, self.session_id, column_file_name('gps', 'timestamp'))
+        with open(path, "ab") as f:
+            f.write(CHUNK_HEADER.pack(TEST_COUNT, 100) + b"partial")
+        self.assertEqual(TEST_COUNT, len(read_column_file(path, '<f8')))
+
+    def test_catalog(self):
+        self.h.log_data_from_active_session(self.get_buffer(), self.session_id)
+        empty_session = self.h.get_new_session()
+        self.h.populate_session_info(self.session_id)
+        self.h.populate_session_info(empty_session)
+
+        sessions = ColumnStoreReader(self.store_path).get_sessions()
+        self.assertIn("Created by RacePi", sessions[self.session_id]["description"])
+        info = sessions[self.session_id]["session_info"]
+        self.assertEqual(3 * TEST_COUNT, info["num_data_samples"])
+        self.assertEqual(TEST_COUNT - 1, info["duration"])
+        self.assertAlmostEqual(12.34, info["max_speed"])
+        self.assertIsNone(sessions[empty_session]["session_info"])
+        self.assertEqual(0, len(ColumnStoreReader(self.store_path).read_column(empty_session, 'can', 'payload')))
+
+    def test_reconnect_keeps_catalog(self):
+        h = ColumnStoreHandler(self.store_path)
+        h.connect()
+        self.assertIn(self.session_id, h.catalog["sessions"])
+        self.assertRaises(ValueError, h.log_data_from_active_session, self.get_buffer(), "unknown")
+
+    def test_not_connected(self):
+        h = ColumnStoreHandler(self.store_path)
+        self.assertRaises(RuntimeError, h.get_new_session)
+        self.assertRaises(RuntimeWarning, h.log_data_from_active_session, self.get_buffer(), self.session_id)
+
+
+if __name__ == "__main__":
+    main()
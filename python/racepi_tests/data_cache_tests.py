@@ -0,0 +1,133 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+import tempfile
+from unittest import TestCase, main
+
+import numpy as np
+
+from racepi.database.data_cache import *
+
+
+class SessionDataCacheTests(TestCase):
+
+    def setUp(self):
+        self.calls = 0
+
+    def compute(self, size=1000):
+        def f():
+            self.calls += 1
+            return np.zeros(size)
+        return f
+
+    def test_hit_after_miss(self):
+        cache = SessionDataCache()
+        a = cache.get('s1', 'gps', (), self.compute())
+        b = cache.get('s1', 'gps', (), self.compute())
+        self.assertIs(a, b)
+        self.assertEqual(1, self.calls)
+        metrics = cache.get_metrics()
+        self.assertEqual(1, metrics['hits'])
+        self.assertEqual(1, metrics['misses'])
+
+    def test_key_includes_params(self):
+        cache = SessionDataCache()
+        cache.get('s1', 'speed', {'width': 100, 'method': 'lttb'}, self.compute())
+        cache.get('s1', 'speed', {'method': 'lttb', 'width': 100}, self.compute())
+        cache.get('s1', 'speed', {'width': 200, 'method': 'lttb'}, self.compute())
+        cache.get('s2', 'speed', {'width': 200, 'method': 'lttb'}, self.compute())
+        self.assertEqual(3, self.calls)
+
+    def test_lookup_without_compute(self):
+        cache = SessionDataCache()
+        self.assertIsNone(cache.get('s1', 'gps'))
+
+    def test_evicts_by_size(self):
+        cache = SessionDataCache(max_bytes=estimate_size(np.zeros(1000)) * 2)
+        cache.get('s1', 'a', (), self.compute())
+        cache.get('s1', 'b', (), self.compute())
+        cache.get('s1', 'a', (), self.compute())  # a is now the most recent
+        cache.get('s1', 'c', (), self.compute())
+        self.assertIsNotNone(cache.get('s1', 'a'))
+        self.assertIsNone(cache.get('s1', 'b'))
+        self.assertEqual(1, cache.get_metrics()['evictions'])
+        self.assertLessEqual(cache.get_metrics()['bytes'], cache.max_bytes)
+
+    def test_value_larger_than_cache_not_kept(self):
+        cache = SessionDataCache(max_bytes=1000)
+        cache.get('s1', 'a', (), self.compute(10000))
+        self.assertEqual(0, cache.get_metrics()['entries'])
+        self.assertEqual(0, cache.get_metrics()['bytes'])
+
+    def test_estimate_size(self):
+        self.assertGreaterEqual(estimate_size(np.zeros(1000)), 8000)
+        self.assertGreater(estimate_size([{'x': 1.0}] * 100), estimate_size([{'x': 1.0}] * 10))
+
+    def test_validate_invalidates_changed_session(self):
+        cache = SessionDataCache()
+        self.assertTrue(cache.validate('s1', (10.0, 5)))
+        self.assertTrue(cache.validate('s2', (10.0, 5)))
+        cache.get('s1', 'gps', (), self.compute())
+        cache.get('s2', 'gps', (), self.compute())
+        self.assertTrue(cache.validate('s1', (10.0, 5)))
+        self.assertIsNotNone(cache.get('s1', 'gps'))
+
+        self.assertFalse(cache.validate('s1', (11.0, 6)))
+        self.assertIsNone(cache.get('s1', 'gps'))
+        self.assertIsNotNone(cache.get('s2', 'gps'))
+        self.assertEqual(cache.get_metrics()['bytes'], estimate_size(np.zeros(1000)))
+
+
+class PersistentSessionDataCacheTests(TestCase):
+
+    def setUp(self):
+        self.persist_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.persist_dir)
+
+    def test_entries_survive_restart(self):
+        cache = SessionDataCache(persist_dir=self.persist_dir)
+        cache.validate('s1', 1)
+        cache.get('s1', 'gps', (100,), lambda: np.arange(10))
+
+        cache = SessionDataCache(persist_dir=self.persist_dir)
+        cache.validate('s1', 1)
+        value = cache.get('s1', 'gps', (100,))
+        np.testing.assert_array_equal(np.arange(10), value)
+        self.assertEqual(1, cache.get_metrics()['disk_hits'])
+
+    def test_stale_entries_ignored(self):
+        cache = SessionDataCache(persist_dir=self.persist_dir)
+        cache.validate('s1', 1)
+        cache.get('s1', 'gps', (), lambda: np.arange(10))
+
+        cache = SessionDataCache(persist_dir=self.persist_dir)
+        cache.validate('s1', 2)
+        self.assertIsNone(cache.get('s1', 'gps'))
+
+    def test_invalidate_removes_files(self):
+        cache = SessionDataCache(persist_dir=self.persist_dir)
+        cache.get('s1', 'gps', (), lambda: np.arange(10))
+        cache.invalidate('s1')
+
+        cache = SessionDataCache(persist_dir=self.persist_dir)
+        self.assertIsNone(cache.get('s1', 'gps'))
+
+
+if __name__ == "__main__":
+    main()
@@ -16,8 +16,11 @@
 from collections import defaultdict
 from unittest import TestCase, main
 
+import numpy as np
+
 from racepi.sensor.data_utilities import TimeToDistanceConverter, \
-    merge_and_generate_ordered_log, oversteer_coefficient
+    merge_and_generate_ordered_log, iter_ordered_log, oversteer_coefficient, \
+    lttb_downsample, minmax_downsample
 
 
 class TimeToDistanceConverterTest(TestCase):
@@ -54,6 +57,74 @@ class TimeToDistanceConverterTest(TestCase):
         for i in range(len(trace)):
             self.assertAlmostEqual(trace[i], result[i])
 
+    def test_two_samples(self):
+        c = TimeToDistanceConverter([(0.0, 2.0), (1.0, 2.0)])
+        self.assertEqual([(1.0, 2.0, 1.0, 2.0)], c.distance_samples)
+        self.assertEqual([1.0], list(c.generate_distance_trace([0.5])))
+
+    def test_extrapolation(self):
+        c = TimeToDistanceConverter([(10.0, 1.0), (11.0, 2.0), (12.0, 3.0)])
+        result = c.generate_distance_trace([9.0, 10.5, 11.5, 13.0])
+        self.assertEqual([-2.0, 1.0, 3.5, 8.0], list(result))
+
+    def test_interpolate_speed(self):
+        c = TimeToDistanceConverter([(0.0, 0.0), (2.0, 2.0), (4.0, 2.0)], interpolate_speed=True)
+        self.assertEqual([0.0, 2.0, 6.0], list(c.distances))
+        self.assertEqual([1.0, 4.0], list(c.generate_distance_trace([1.0, 3.0])))
+
+    def test_from_arrays(self):
+        times = np.arange(0.0, 10.0, 0.5)
+        c = TimeToDistanceConverter.from_arrays(times, np.ones(len(times)))
+        result = c.generate_distance_trace(np.arange(0.0, 9.0, 0.1))
+        self.assertIsInstance(result, np.ndarray)
+        self.assertTrue(np.allclose(np.arange(0.0, 9.0, 0.1), result))
+
+    def test_zero_interval(self):
+        c = TimeToDistanceConverter([(0.0, 1.0), (1.0, 1.0), (1.0, 1.0)])
+        # no speed over a zero length interval, distance holds
+        self.assertEqual([1.0, 1.0], list(c.generate_distance_trace([1.0, 2.0])))
+
+
+class DownsampleTests(TestCase):
+
+    def setUp(self):
+        self.x = np.arange(10000) / 100.0
+        self.y = np.sin(self.x)
+        # single sample spike, e.g. a brake pressure peak
+        self.y[5001] = 10.0
+
+    def test_lttb(self):
+        x, y = lttb_downsample(self.x, self.y, 500)
+        self.assertEqual(500, len(x))
+        self.assertEqual(self.x[0], x[0])
+        self.assertEqual(self.x[-1], x[-1])
+        self.assertTrue(np.all(np.diff(x) > 0))
+        self.assertIn(10.0, y)
+        # every point is an original sample
+        self.assertTrue(np.array_equal(np.sin(x[y != 10.0]), y[y != 10.0]))
+
+    def test_lttb_short_series(self):
+        x, y = lttb_downsample([0.0, 1.0], [1.0, 2.0], 100)
+        self.assertListEqual([0.0, 1.0], x.tolist())
+        x, y = lttb_downsample(self.x, self.y, 2)
+        self.assertEqual(len(self.x), len(x))
+
+    def test_minmax(self):
+        x, y = minmax_downsample(self.x, self.y, 100)
+        self.assertEqual(200, len(x))
+        self.assertTrue(np.all(np.diff(x) > 0))
+        self.assertEqual(10.0, y.max())
+        self.assertAlmostEqual(self.y.min(), y.min())
+        # each bucket of 100 samples keeps its extremes
+        self.assertTrue(np.allclose(self.y[:100].min(), y[:2].min()))
+        self.assertTrue(np.allclose(self.y[:100].max(), y[:2].max()))
+
+    def test_minmax_uneven_buckets(self):
+        x, y = minmax_downsample(np.arange(7.0), np.array([1.0, 5.0, 2.0, 2.0, 0.0, 3.0, 3.0]), 3)
+        self.assertListEqual([0.0, 1.0, 2.0, 3.0, 4.0, 6.0], x.tolist())
+        x, y = minmax_downsample(np.arange(4.0), np.arange(4.0), 2)
+        self.assertEqual(4, len(x))
+
 
 class OtherTests(TestCase):
 
@@ -87,6 +158,26 @@ class OtherTests(TestCase):
         self.assertEqual(res[4][1], 20)
         self.assertEqual(res[5][1], 30)
 
+    def test_iter_ordered_log_generators(self):
+        data = {"k": ((t, "a") for t in [1, 4, 5]), "k2": ((t, "b") for t in [2, 3, 6])}
+        res = list(iter_ordered_log(data))
+        self.assertListEqual([1, 2, 3, 4, 5, 6], [r[1] for r in res])
+        self.assertListEqual(["k", "k2", "k2", "k", "k", "k2"], [r[0] for r in res])
+        self.assertEqual(("k", 1, "a"), res[0])
+
+    def test_iter_ordered_log_is_lazy(self):
+        def endless():
+            t = 0
+            while True:
+                yield t, None
+                t += 1
+        res = iter_ordered_log({"k": endless(), "k2": [(0.5, None)]})
+        self.assertListEqual([0, 0.5, 1], [next(res)[1] for _ in range(3)])
+
+    def test_iter_ordered_log_equal_times_keep_source_order(self):
+        data = {"k": [(1, "a")], "k2": [(1, "b")]}
+        self.assertListEqual(["k", "k2"], [r[0] for r in iter_ordered_log(data)])
+
     def test_oversteer_coefficient_zero_velocity(self):
         self.assertAlmostEqual(-1.0, oversteer_coefficient(1, 1, 0.0, 1), 6)
         self.assertAlmostEqual(-2.0, oversteer_coefficient(2, 2, 0.0, 2), 6)
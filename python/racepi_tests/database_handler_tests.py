@@ -19,6 +19,7 @@ from unittest import TestCase
 from racepi_database_handler import *
 from database.db_handler import DbHandler
 from uuid import UUID
+from racepi.can.data import CanSample
 
 TEST_DB_LOCATION = "testdata/test.db"
 
@@ -61,7 +62,7 @@ class DatabaseHandlerTest(TestCase):
         s = self.h.get_new_session()
         self.assertEqual(0,
                          len(self.h.db_session.query(CANData).filter(CANData.session_id == s).all()))
-        data = "010DEADBEEF"
+        data = CanSample(123.45, 0x010, 4, bytes.fromhex("DEADBEEF"))
         data = [(123.45, data)]
         self.h.insert_can_updates(data, s)
         self.assertEqual(1,
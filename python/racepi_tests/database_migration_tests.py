@@ -0,0 +1,89 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import sqlite3
+from unittest import TestCase, main
+
+from racepi.database.migrations import *
+
+# tables as created by the 2016 schema, before versioning
+LEGACY_SCHEMA = """
+CREATE TABLE sessions (id BLOB UNIQUE PRIMARY KEY NOT NULL, description TEXT);
+CREATE TABLE session_info (session_id BLOB UNIQUE PRIMARY KEY NOT NULL, start_time_utc DATETIME NOT NULL,
+    duration DOUBLE, max_speed DOUBLE, num_data_samples INTEGER);
+CREATE TABLE gps_data (session_id BLOB NOT NULL, timestamp DATETIME NOT NULL, time VARCHAR,
+    lat DOUBLE, lon DOUBLE, speed DOUBLE, track DOUBLE, epx DOUBLE, epy DOUBLE, epv DOUBLE);
+CREATE TABLE can_data (session_id BLOB NOT NULL, timestamp DATETIME NOT NULL,
+    arbitration_id integer NOT NULL, rtr integer NOT NULL, msg BLOB NOT NULL);
+"""
+
+
+class DatabaseMigrationTests(TestCase):
+
+    def setUp(self):
+        self.db = sqlite3.connect(":memory:")
+        self.db.executescript(LEGACY_SCHEMA)
+        self.db.execute("INSERT INTO sessions VALUES ('s1', '')")
+        self.db.executemany("INSERT INTO gps_data (session_id, timestamp, speed) VALUES (?, ?, ?)",
+                            [('s1', 1.0, 10.0), ('s1', 2.0, 20.0), ('s1', 2.0, 20.0)])
+        self.db.executemany("INSERT INTO can_data VALUES (?, ?, ?, 0, ?)",
+                            [('s1', 1.0, 0x85, b'\x01'), ('s1', 1.0, 0x114, b'\x02')])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_upgrade_legacy_database(self):
+        self.assertEqual(0, get_schema_version(self.db))
+        self.assertListEqual(list(range(1, SCHEMA_VERSION + 1)), upgrade_database(self.db))
+        self.assertEqual(SCHEMA_VERSION, get_schema_version(self.db))
+        self.assertIn('alt', get_table_columns(self.db, 'gps_data'))
+        self.assertIn('z_gyro', get_table_columns(self.db, 'imu_data'))
+        self.assertIn('lf_pressure', get_table_columns(self.db, 'tire_data'))
+        self.assertIn('distance', get_table_columns(self.db, 'session_info'))
+
+    def test_data_kept_and_duplicates_dropped(self):
+        upgrade_database(self.db)
+        self.assertListEqual([(1.0, 10.0), (2.0, 20.0)],
+                             self.db.execute("SELECT timestamp, speed FROM gps_data").fetchall())
+        self.assertEqual(2, self.db.execute("SELECT COUNT(*) FROM can_data").fetchone()[0])
+
+    def test_keys_enforced(self):
+        upgrade_database(self.db)
+        self.assertRaises(sqlite3.IntegrityError, self.db.execute,
+                          "INSERT INTO can_data VALUES ('s1', 1.0, 133, 0, x'01')")
+        plan = self.db.execute("EXPLAIN QUERY PLAN SELECT timestamp, msg FROM can_data "
+                               "WHERE session_id='s1' AND arbitration_id=133").fetchall()
+        self.assertIn("PRIMARY KEY", str(plan))
+
+    def test_without_rowid_optional(self):
+        upgrade_database(self.db, without_rowid=False)
+        sql = self.db.execute("SELECT sql FROM sqlite_master WHERE name='can_data'").fetchone()[0]
+        self.assertNotIn("WITHOUT ROWID", sql)
+        upgraded = sqlite3.connect(":memory:")
+        upgrade_database(upgraded)
+        sql = upgraded.execute("SELECT sql FROM sqlite_master WHERE name='can_data'").fetchone()[0]
+        self.assertIn("WITHOUT ROWID", sql)
+        upgraded.close()
+
+    def test_upgrade_current_database(self):
+        upgrade_database(self.db)
+        self.assertListEqual([], upgrade_database(self.db))
+
+
+if __name__ == "__main__":
+    main()
@@ -68,3 +68,37 @@ class DataBufferTests(TestCase):
         self.assertEqual(0, len(self.twenty_samples.get_sensor_data('one')))
         self.assertEqual(0, len(self.twenty_samples.get_sensor_data('two')))
         self.assertRaises(ValueError, self.twenty_samples.get_sensor_data, "nosource")
+
+    def test_expire_keeps_order(self):
+        self.twenty_samples.expire_old_samples(TEST_COUNT - 2)
+        self.assertListEqual([TEST_COUNT - 2, TEST_COUNT - 1],
+                             [s[0] for s in self.twenty_samples.get_sensor_data('one')])
+
+    def test_source_capacity(self):
+        b = DataBuffer(source_capacity=4)
+        b.add_sample('one', [(i, 'data') for i in range(TEST_COUNT)])
+        b.add_sample('one', [(TEST_COUNT, 'data')])
+        self.assertListEqual(list(range(TEST_COUNT - 3, TEST_COUNT + 1)),
+                             [s[0] for s in b.get_sensor_data('one')])
+        self.assertEqual(TEST_COUNT - 3, b.dropped_samples['one'])
+
+    def test_source_capacity_per_source(self):
+        b = DataBuffer(source_capacity={'one': 2})
+        b.add_sample('one', [(i, 'data') for i in range(TEST_COUNT)])
+        b.add_sample('two', [(i, 'data') for i in range(TEST_COUNT)])
+        self.assertEqual(2, len(b.get_sensor_data('one')))
+        self.assertEqual(TEST_COUNT, len(b.get_sensor_data('two')))
+        self.assertEqual(0, b.dropped_samples['two'])
+
+    def test_sample_count(self):
+        self.assertEqual(0, self.b.get_sample_count())
+        self.assertEqual(2 * TEST_COUNT, self.twenty_samples.get_sample_count())
+
+    def test_memory_usage(self):
+        usage = self.twenty_samples.get_memory_usage()
+        self.assertSetEqual({'one', 'two'}, set(usage.keys()))
+        count, size = usage['one']
+        self.assertEqual(TEST_COUNT, count)
+        self.assertGreater(size, 0)
+        self.twenty_samples.clear()
+        self.assertDictEqual({}, self.twenty_samples.get_memory_usage())
@@ -0,0 +1,114 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import tempfile
+from unittest import TestCase, main
+
+from racepi.can.data import CanSample
+from racepi.database.db_handler import DbHandler
+from racepi.database.objects import *
+from racepi.sensor.recorder.data_buffer import DataBuffer
+
+TEST_COUNT = 10
+GPS_SAMPLE = {'time': "2019-01-01T00:00:00.000Z", 'lat': "12.34", 'lon': "45.67", 'alt': "12.345",
+              'speed': "12.34", 'track': "300.0", 'epx': 1.0, 'epy': 2.0, 'epv': 3.0}
+IMU_SAMPLE = {'fusionPose': (1, 2, 3), 'accel': (4, 5, 6), 'gyro': (7, 8, 9)}
+
+
+class BulkInsertTests(TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.h = DbHandler(self.db_path)
+        self.h.connect()
+        Base.metadata.create_all(self.h.db_session.get_bind())
+        self.session_id = self.h.get_new_session()
+
+    def tearDown(self):
+        self.h.db_session.close()
+        os.remove(self.db_path)
+
+    def get_buffer(self):
+        data = DataBuffer()
+        data.add_sample('gps', [(float(i), dict(GPS_SAMPLE)) for i in range(TEST_COUNT)])
+        data.add_sample('imu', [(float(i), IMU_SAMPLE) for i in range(TEST_COUNT)])
+        data.add_sample('can', [(float(i), CanSample(float(i), 0x85, 4, bytes.fromhex("DEADBEEF")))
+                                for i in range(TEST_COUNT)])
+        return data
+
+    def test_insert_all_updates(self):
+        self.assertEqual(3 * TEST_COUNT, self.h.insert_all_updates(self.get_buffer(), self.session_id))
+        q = self.h.db_session.query
+        self.assertEqual(TEST_COUNT, q(GPSData).filter(GPSData.session_id == self.session_id).count())
+        self.assertEqual(TEST_COUNT, q(IMUData).filter(IMUData.session_id == self.session_id).count())
+        self.assertEqual(TEST_COUNT, q(CANData).filter(CANData.session_id == self.session_id).count())
+
+    def test_rows_match_orm(self):
+        self.h.insert_all_updates(self.get_buffer(), self.session_id)
+        gps = self.h.db_session.query(GPSData).order_by(GPSData.timestamp).first()
+        self.assertEqual(12.34, gps.speed)
+        self.assertEqual(3.0, gps.epv)
+        imu = self.h.db_session.query(IMUData).order_by(IMUData.timestamp).first()
+        self.assertEqual((1, 2, 3, 4, 5, 6, 7, 8, 9), (imu.r, imu.p, imu.y, imu.x_accel, imu.y_accel,
+                                                       imu.z_accel, imu.x_gyro, imu.y_gyro, imu.z_gyro))
+        can = self.h.db_session.query(CANData).order_by(CANData.timestamp).first()
+        self.assertEqual(0x85, can.arbitration_id)
+        self.assertEqual(bytes.fromhex("DEADBEEF"), can.msg)
+
+    def test_invalid_gps_skipped(self):
+        data = DataBuffer()
+        data.add_sample('gps', [(1.0, {'speed': 'n/a'}), (2.0, dict(GPS_SAMPLE))])
+        self.assertEqual(1, self.h.insert_all_updates(data, self.session_id))
+
+    def test_invalid_imu_skipped(self):
+        data = self.get_buffer()
+        data.add_sample('imu', [(20.0, {'accel': (4, 5, 6), 'gyro': (7, 8, 9)}),
+                                (21.0, {'fusionPose': (1, 2), 'accel': (4, 5, 6), 'gyro': (7, 8, 9)}),
+                                (22.0, {'fusionPose': (1, 2, 'x'), 'accel': (4, 5, 6), 'gyro': (7, 8, 9)}),
+                                None])
+        self.assertEqual(3 * TEST_COUNT, self.h.insert_all_updates(data, self.session_id))
+        self.assertEqual(TEST_COUNT, self.h.db_session.query(IMUData).count())
+        self.assertEqual(TEST_COUNT, self.h.db_session.query(GPSData).count())
+
+    def test_repeated_samples_ignored(self):
+        data = self.get_buffer()
+        self.h.insert_all_updates(data, self.session_id)
+        self.h.insert_all_updates(data, self.session_id)
+        self.assertEqual(TEST_COUNT, self.h.db_session.query(GPSData).count())
+        self.assertEqual(TEST_COUNT, self.h.db_session.query(CANData).count())
+
+    def test_same_timestamp_different_can_ids(self):
+        data = DataBuffer()
+        data.add_sample('can', [(1.0, CanSample(1.0, 0x85, 1, b'\x01')),
+                                (1.0, CanSample(1.0, 0x114, 1, b'\x02'))])
+        self.assertEqual(2, self.h.insert_all_updates(data, self.session_id))
+        self.assertEqual(2, self.h.db_session.query(CANData).count())
+
+    def test_failed_insert_rolled_back(self):
+        self.h.db_session.execute("DROP TABLE can_data")
+        self.assertRaises(Exception, self.h.insert_all_updates, self.get_buffer(), self.session_id)
+        self.assertEqual(0, self.h.db_session.query(GPSData).count())
+
+    def test_log_data_from_active_session(self):
+        self.h.log_data_from_active_session(self.get_buffer(), self.session_id)
+        self.assertEqual(TEST_COUNT, self.h.db_session.query(CANData).count())
+
+
+if __name__ == "__main__":
+    main()
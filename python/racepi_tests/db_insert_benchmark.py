@@ -0,0 +1,111 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure DbHandler insert throughput, in rows per second, for the
+per-row ORM path and the bulk executemany path, and for the column
+store. Each write is one SensorLogger loop iteration worth of data.
+
+Run on the target, with the database on the SD card:
+
+    python db_insert_benchmark.py /external/racepi_data/benchmark.db
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from racepi.can.data import CanSample
+from racepi.database.column_store import ColumnStoreHandler
+from racepi.database.db_handler import DbHandler
+from racepi.database.objects import Base
+from racepi.sensor.recorder.data_buffer import DataBuffer
+
+DEFAULT_DB_FILE = "insert_benchmark.db"
+DEFAULT_ITERATIONS = 300
+# samples per 30ms logger iteration
+GPS_PER_ITERATION = 1
+IMU_PER_ITERATION = 3
+CAN_PER_ITERATION = 30
+
+GPS_SAMPLE = {'time': "2019-01-01T00:00:00.000Z", 'lat': "12.34", 'lon': "45.67", 'alt': "12.345",
+              'speed': "12.34", 'track': "300.0", 'epx': 1.0, 'epy': 2.0, 'epv': 3.0}
+IMU_SAMPLE = {'fusionPose': (0.1, 0.2, 0.3), 'accel': (0.0, 0.0, 1.0), 'gyro': (0.01, 0.02, 0.03)}
+CAN_PAYLOAD = bytes.fromhex("0000ffff00000000")
+
+
+def generate_buffers(iterations, start):
+    t = start
+    buffers = []
+    for _ in range(iterations):
+        data = DataBuffer()
+        for source, count, make in [('gps', GPS_PER_ITERATION, lambda t: dict(GPS_SAMPLE)),
+                                    ('imu', IMU_PER_ITERATION, lambda t: IMU_SAMPLE),
+                                    ('can', CAN_PER_ITERATION, lambda t: CanSample(t, 0x85, 8, CAN_PAYLOAD))]:
+            for i in range(count):
+                ts = t + i * 1e-4
+                data.add_sample(source, [(ts, make(ts))])
+        buffers.append(data)
+        t += 0.03
+    return buffers
+
+
+def measure(db_handler, buffers):
+    session_id = db_handler.get_new_session()
+    rows = len(buffers) * (GPS_PER_ITERATION + IMU_PER_ITERATION + CAN_PER_ITERATION)
+    start = time.time()
+    for data in buffers:
+        db_handler.log_data_from_active_session(data, session_id)
+    db_handler.populate_session_info(session_id)
+    return rows / (time.time() - start)
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_FILE
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ITERATIONS
+    if os.path.exists(db_file):
+        raise IOError("Refusing to overwrite existing database: " + db_file)
+
+    h = DbHandler(db_file)
+    h.connect()
+    Base.metadata.create_all(h.db_session.get_bind())
+    try:
+        h.bulk_insert = False
+        before = measure(h, generate_buffers(iterations, 0.0))
+        print("orm:     %10.0f rows/s" % before)
+        h.bulk_insert = True
+        after = measure(h, generate_buffers(iterations, 1e6))
+        print("bulk:    %10.0f rows/s" % after)
+        print("speedup: %10.1fx" % (after / before))
+        print("sqlite:  %10d bytes" % os.path.getsize(db_file))
+    finally:
+        h.db_session.close()
+        os.remove(db_file)
+
+    store_path = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(db_file)))
+    try:
+        h = ColumnStoreHandler(store_path)
+        h.connect()
+        print("column:  %10.0f rows/s" % measure(h, generate_buffers(iterations, 0.0)))
+        print("column:  %10d bytes" % directory_size(store_path))
+    finally:
+        shutil.rmtree(store_path)
@@ -0,0 +1,135 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+from queue import Full
+from threading import Event, Timer
+from unittest import TestCase, main
+
+from racepi.sensor.recorder.data_buffer import DataBuffer
+from racepi.sensor.recorder.db_writer import BackgroundDbWriter
+
+TEST_COUNT = 10
+
+
+class RecordingDbHandler:
+    """Stand-in database handler that records calls"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = Event()
+        self.release.set()
+
+    def get_new_session(self, session_id=None):
+        self.calls.append(('session', session_id))
+        return session_id
+
+    def log_data_from_active_session(self, data, session_id):
+        self.release.wait()
+        self.calls.append(('log', data, session_id))
+
+    def populate_session_info(self, session_id):
+        if not session_id:
+            raise RuntimeWarning("no session")
+        self.calls.append(('info', session_id))
+
+
+class BackgroundDbWriterTests(TestCase):
+
+    def setUp(self):
+        self.h = RecordingDbHandler()
+        self.w = BackgroundDbWriter(self.h, max_queue_size=2)
+        self.w.start()
+
+    def tearDown(self):
+        self.h.release.set()
+        self.w.stop(1)
+
+    def test_get_new_session(self):
+        session_id = self.w.get_new_session()
+        self.assertTrue(session_id)
+        self.w.stop()
+        self.assertEqual(('session', session_id), self.h.calls[0])
+
+    def test_jobs_in_order_and_flushed_on_stop(self):
+        for i in range(TEST_COUNT):
+            self.w.log_data(i, "session")
+        self.w.populate_session_info("session")
+        self.w.stop()
+        self.assertListEqual([c[1] for c in self.h.calls[:-1]], list(range(TEST_COUNT)))
+        self.assertEqual(('info', 'session'), self.h.calls[-1])
+        self.assertEqual(TEST_COUNT + 1, self.w.get_metrics()['jobs_completed'])
+
+    def test_failed_job(self):
+        f = self.w.populate_session_info(None)
+        self.assertRaises(RuntimeWarning, f.result, 1)
+        self.assertEqual(1, self.w.get_metrics()['jobs_failed'])
+
+    def test_backpressure(self):
+        self.h.release.clear()
+        self.w.log_data(0, "session")
+        time.sleep(0.05)  # the worker is now blocked on the first job
+        self.w.log_data(1, "session")
+        self.w.log_data(2, "session")
+        self.assertEqual(0, self.w.get_metrics()['blocked_submits'])
+        Timer(0.1, self.h.release.set).start()
+        self.w.log_data(3, "session")  # queue is full, blocks until released
+        metrics = self.w.get_metrics()
+        self.assertEqual(1, metrics['blocked_submits'])
+        self.assertGreater(metrics['blocked_time'], 0.05)
+        self.assertEqual(2, metrics['max_queue_depth'])
+        self.w.stop()
+        self.assertEqual(4, len(self.h.calls))
+
+    def test_full_queue_drops_job(self):
+        self.w.max_submit_wait = 0.05
+        self.h.release.clear()
+        self.w.log_data(0, "session")
+        time.sleep(0.05)  # the worker is now blocked on the first job
+        self.w.log_data(1, "session")
+        self.w.log_data(2, "session")
+        data = DataBuffer()
+        data.add_sample('gps', [(1.0, {}), (2.0, {})])
+        data.add_sample('imu', [(1.0, {})])
+        f = self.w.log_data(data, "session")
+        self.assertRaises(Full, f.result, 0)
+        metrics = self.w.get_metrics()
+        self.assertEqual(1, metrics['dropped_jobs'])
+        self.assertEqual(3, metrics['dropped_samples'])
+        self.assertEqual(3, metrics['jobs_submitted'])
+        self.h.release.set()
+        self.w.stop()
+        self.assertListEqual([0, 1, 2], [c[1] for c in self.h.calls])
+
+    def test_full_queue_does_not_drop_session_jobs(self):
+        self.w.max_submit_wait = 0.01
+        self.h.release.clear()
+        self.w.log_data(0, "session")
+        time.sleep(0.05)  # the worker is now blocked on the first job
+        self.w.log_data(1, "session")
+        self.w.log_data(2, "session")
+        Timer(0.1, self.h.release.set).start()
+        session_id = self.w.get_new_session()  # queue is full, blocks until released
+        self.w.populate_session_info(session_id)
+        self.w.stop()
+        metrics = self.w.get_metrics()
+        self.assertEqual(0, metrics['dropped_jobs'])
+        self.assertGreater(metrics['blocked_time'], 0.05)
+        self.assertEqual([('session', session_id), ('info', session_id)], self.h.calls[-2:])
+
+
+if __name__ == "__main__":
+    main()
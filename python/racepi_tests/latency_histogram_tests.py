@@ -0,0 +1,53 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase, main
+
+from racepi.sensor.recorder.latency import LatencyHistogram
+
+
+class LatencyHistogramTests(TestCase):
+
+    def setUp(self):
+        self.h = LatencyHistogram(buckets=(0.01, 0.1))
+
+    def test_empty(self):
+        self.assertEqual(0, self.h.count)
+        self.assertEqual({'count': 0, 'mean': 0.0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}, self.h.get_metrics())
+        self.assertEqual("", str(self.h))
+
+    def test_buckets(self):
+        self.h.add([0.005, 0.01, 0.05, 2.0])
+        self.h.add(0.02)
+        self.assertListEqual([2, 2, 1], self.h.counts.tolist())
+        self.assertEqual(5, self.h.count)
+        self.assertEqual(2.0, self.h.max)
+        self.assertAlmostEqual(2.085 / 5, self.h.get_metrics()['mean'])
+        self.assertEqual("<=10ms:2 <=100ms:2 >100ms:1", str(self.h))
+
+    def test_percentile(self):
+        self.h.add([0.001] * 98 + [0.05, 0.5])
+        self.assertEqual(0.01, self.h.percentile(50))
+        self.assertEqual(0.1, self.h.percentile(99))
+        self.assertEqual(0.5, self.h.percentile(100))
+
+    def test_add_empty(self):
+        self.h.add([])
+        self.assertEqual(0, self.h.count)
+
+
+if __name__ == "__main__":
+    main()
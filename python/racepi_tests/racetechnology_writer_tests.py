@@ -17,6 +17,7 @@
 from unittest import TestCase, main
 
 from racepi.racetech.writers import *
+from racepi.can.data import CanSample
 
 DBC_FILENAME = "dbc/evora.dbc"
 
@@ -50,6 +51,15 @@ class RaceCaptureWriterTests(TestCase):
         self.writer.send_steering_angle(-CLIP_STEERING_ANGLE+1e-4)
         self.assertEqual(2, len(self.writer.pending_messages))
 
+    def test_write_can_sample_engine(self):
+        # EngineSpeed, AcceleratorPosition and BrakePedal from the ECU frame
+        self.writer.write_can_sample(1.0, CanSample(1.0, 0x114, 6, bytes.fromhex('02c000fb0004')))
+        self.assertTrue(self.writer.pending_messages)
+
+    def test_write_can_sample_unknown_id(self):
+        self.writer.write_can_sample(1.0, CanSample(1.0, 0x7ff, 8, bytes(8)))
+        self.assertFalse(self.writer.pending_messages)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,79 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from unittest import TestCase, main
+
+import numpy as np
+
+from racepi.sensor.recorder.samplebuffers import SampleBuffers
+
+TEST_LENGTH = 8
+
+
+class SampleBuffersTests(TestCase):
+
+    def setUp(self):
+        self.b = SampleBuffers(TEST_LENGTH, channels=['x', 'y'])
+
+    def add(self, start, stop):
+        t = np.arange(start, stop, dtype='f8')
+        self.b.extend(t, np.stack([t * 10, t * 100], axis=1))
+
+    def test_empty(self):
+        self.assertEqual(0, len(self.b))
+        self.assertEqual(0, len(self.b.get()))
+        self.assertEqual(0, len(self.b.last(1.0)))
+
+    def test_single_channel(self):
+        b = SampleBuffers(TEST_LENGTH)
+        b.extend([1.0, 2.0], [3.0, 4.0])
+        self.assertListEqual([3.0, 4.0], b.get()['value'].tolist())
+
+    def test_extend_get(self):
+        self.add(0, 5)
+        data = self.b.get()
+        self.assertListEqual([0, 1, 2, 3, 4], data['timestamp'].tolist())
+        self.assertListEqual([0, 10, 20, 30, 40], data['x'].tolist())
+        self.assertListEqual([0, 100, 200, 300, 400], data['y'].tolist())
+
+    def test_wrap_around(self):
+        for start in range(0, 30, 3):
+            self.add(start, start + 3)
+            data = self.b.get()
+            expected = list(range(max(0, start + 3 - TEST_LENGTH), start + 3))
+            self.assertListEqual(expected, data['timestamp'].tolist())
+            self.assertListEqual([v * 10 for v in expected], data['x'].tolist())
+
+    def test_extend_longer_than_buffer(self):
+        self.add(0, 3 * TEST_LENGTH + 1)
+        self.assertListEqual(list(range(2 * TEST_LENGTH + 1, 3 * TEST_LENGTH + 1)),
+                             self.b.get()['timestamp'].tolist())
+
+    def test_reads_are_views(self):
+        self.add(0, TEST_LENGTH + 3)
+        self.assertTrue(np.shares_memory(self.b.get(), self.b.data))
+        self.assertTrue(np.shares_memory(self.b.last(2.0), self.b.data))
+
+    def test_time_windows(self):
+        self.add(0, TEST_LENGTH + 3)
+        self.assertListEqual([8.0, 9.0, 10.0], self.b.last(2.0)['timestamp'].tolist())
+        self.assertListEqual([5.0, 6.0], self.b.window(4.5, 7.0)['timestamp'].tolist())
+        self.assertEqual(0, len(self.b.window(20.0, 30.0)))
+
+
+if __name__ == "__main__":
+    main()
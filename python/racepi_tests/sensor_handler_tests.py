@@ -0,0 +1,88 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+from multiprocessing.connection import wait
+from unittest import TestCase, main
+
+from racepi.sensor.handler.sensor_handler import SensorHandler
+
+TEST_COUNT = 10
+
+
+class SensorHandlerBatchTests(TestCase):
+
+    def setUp(self):
+        # producer and consumer share this process, the read function is never started
+        self.h = SensorHandler(None, batch_size=4, batch_latency=60.0)
+
+    def test_get_all_data_empty(self):
+        self.assertListEqual([], self.h.get_all_data())
+        self.assertListEqual([], self.h.get_batch())
+
+    def test_send_sample_holds_partial_batch(self):
+        self.h.send_sample((0, 'data'))
+        self.assertListEqual([], self.h.get_all_data())
+        self.h.flush_samples()
+        self.assertListEqual([(0, 'data')], self.h.get_all_data())
+
+    def test_send_sample_full_batches(self):
+        for i in range(TEST_COUNT):
+            self.h.send_sample((i, 'data'))
+        self.assertEqual(4, len(self.h.get_batch()))
+        self.assertEqual(4, len(self.h.get_batch()))
+        self.assertListEqual([], self.h.get_batch())
+        self.h.flush_samples()
+        self.assertListEqual([(8, 'data'), (9, 'data')], self.h.get_batch())
+
+    def test_get_all_data_ordered(self):
+        for i in range(TEST_COUNT):
+            self.h.send_sample((i, 'data'))
+        self.h.flush_samples()
+        self.assertListEqual(list(range(TEST_COUNT)), [s[0] for s in self.h.get_all_data()])
+
+    def test_send_sample_latency(self):
+        h = SensorHandler(None, batch_size=100, batch_latency=0.0)
+        h.send_sample((0, 'data'))
+        self.assertListEqual([(0, 'data')], h.get_all_data())
+
+    def test_flush_expired_samples(self):
+        self.h.send_sample((0, 'data'))
+        self.h.flush_expired_samples()
+        self.assertListEqual([], self.h.get_all_data())
+        self.h.batch_latency = 0.0
+        self.h.flush_expired_samples()
+        self.assertListEqual([(0, 'data')], self.h.get_all_data())
+
+    def test_data_ready(self):
+        self.assertFalse(self.h.data_ready())
+        self.h.send_sample((0, 'data'))
+        self.assertFalse(self.h.data_ready())
+        self.h.flush_samples()
+        self.assertTrue(self.h.data_ready())
+        self.assertTrue(wait([self.h.wait_handle], 0))
+        self.h.get_all_data()
+        self.assertFalse(self.h.data_ready())
+        self.assertFalse(wait([self.h.wait_handle], 0))
+
+    def test_close(self):
+        self.h.close()
+        self.assertTrue(self.h.pipe_in.closed)
+        self.assertTrue(self.h.pipe_out.closed)
+        self.assertIsNone(self.h.doneEvent)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,11 @@
 # You should have received a copy of the GNU General Public License
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
 from unittest import TestCase
+
+from racepi.sensor.handler.sensor_handler import SensorHandler
+from racepi.sensor.recorder.data_buffer import DataBuffer
 from racepi.sensor.recorder.sensor_log import SensorLogger, LoggerState, \
     MOVEMENT_THRESHOLD_M_PER_S, ACTIVATE_RECORDING_M_PER_S
 
@@ -127,3 +131,35 @@ class SensorLoggerTests(TestCase):
         samples.insert(0, (0, {'speed': 0}))
         self.assertTrue(self.sl.deactivate_conditions(data))
 
+
+    def test_write_data_rc_feed_records_latency(self):
+        now = time.time()
+        self.sl.write_data_rc_feed({'empty': [], 'test': [(now - 0.5, None), (now - 0.1, None)]})
+        self.assertNotIn('empty', self.sl.feed_latency)
+        metrics = self.sl.feed_latency['test'].get_metrics()
+        self.assertEqual(2, metrics['count'])
+        self.assertGreaterEqual(metrics['max'], 0.5)
+
+    def test_wait_for_data_wakes_on_data(self):
+        h = SensorHandler(None, batch_size=1)
+        self.sl.handlers = {'test': h}
+        start = time.time()
+        self.sl.wait_for_data(0.05)
+        self.assertGreaterEqual(time.time() - start, 0.04)
+
+        h.send_sample((0, 'data'))
+        start = time.time()
+        self.sl.wait_for_data(10.0)
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual({'test': [(0, 'data')]}, dict(self.sl.get_new_data()))
+
+    def test_buffer_drops_accumulate_across_buffers(self):
+        h = SensorHandler(None, batch_size=TEST_COUNT)
+        self.sl.handlers = {'test': h}
+        for _ in range(2):
+            # the logger replaces its buffer on every state update while logging
+            self.sl.data = DataBuffer(4)
+            for i in range(TEST_COUNT):
+                h.send_sample((i, 'data'))
+            self.sl.get_new_data()
+        self.assertEqual(2 * (TEST_COUNT - 4), self.sl.buffer_dropped_samples['test'])
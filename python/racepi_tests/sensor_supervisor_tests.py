@@ -0,0 +1,212 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+from multiprocessing.connection import wait
+from unittest import TestCase, main
+
+from racepi.sensor.handler.sensor_handler import SensorHandler
+from racepi.sensor.handler.supervisor import *
+
+
+class FakeHandler:
+
+    def __init__(self):
+        self.alive = False
+        self.stopped = False
+        self.closed = False
+        self.data = []
+        self.dropped_samples = 0
+        self.wait_handle = None
+
+    def start(self):
+        self.alive = True
+
+    def stop(self):
+        self.alive = False
+        self.stopped = True
+
+    def close(self):
+        self.closed = True
+
+    def is_alive(self):
+        return self.alive
+
+    def data_ready(self):
+        return bool(self.data)
+
+    def get_all_data(self):
+        data, self.data = self.data, []
+        return data
+
+
+class SupervisedSensorHandlerTests(TestCase):
+
+    def setUp(self):
+        self.created = []
+        self.fail_start = False
+        self.s = SupervisedSensorHandler('can', self.factory, stall_timeout=5.0, backoff=1.0, max_backoff=4.0)
+
+    def factory(self):
+        if self.fail_start:
+            raise OSError("no device")
+        h = FakeHandler()
+        self.created.append(h)
+        return h
+
+    def test_start(self):
+        self.s.start()
+        self.assertEqual(1, len(self.created))
+        self.assertTrue(self.created[0].alive)
+        self.assertEqual(SensorHealth.starting, self.s.health)
+
+    def test_health_from_samples(self):
+        self.s.start()
+        t = time.time()
+        self.created[0].data = [(t, 'a'), (t, 'b')]
+        self.assertTrue(self.s.data_ready())
+        self.assertEqual(2, len(self.s.get_all_data()))
+        self.assertEqual(SensorHealth.ok, self.s.check(t + 1.0))
+        self.assertEqual(SensorHealth.stalled, self.s.check(t + 10.0))
+
+    def test_stalled_without_samples(self):
+        self.s.start()
+        t = time.time()
+        self.assertEqual(SensorHealth.starting, self.s.check(t + 1.0))
+        self.assertEqual(SensorHealth.stalled, self.s.check(t + 10.0))
+
+    def test_restart_with_backoff(self):
+        self.s.start()
+        t = time.time()
+        self.created[0].alive = False
+        self.assertEqual(SensorHealth.down, self.s.check(t))
+        self.assertTrue(self.created[0].stopped)
+        self.assertTrue(self.created[0].closed)
+
+        # first restart after the initial backoff
+        self.s.check(t + 0.5)
+        self.assertEqual(1, len(self.created))
+        self.assertEqual(SensorHealth.starting, self.s.check(t + 1.0))
+        self.assertEqual(2, len(self.created))
+        self.assertEqual(1, self.s.restarts)
+
+        # the next delay doubles
+        self.created[1].alive = False
+        self.s.check(t + 1.0)
+        self.s.check(t + 2.5)
+        self.assertEqual(2, len(self.created))
+        self.s.check(t + 3.0)
+        self.assertEqual(3, len(self.created))
+
+    def test_backoff_limit(self):
+        self.fail_start = True
+        self.s.start()
+        t = time.time()
+        for _ in range(10):
+            t = self.s.next_restart
+            self.s.check(t)
+        self.assertEqual(4.0, self.s.next_restart - t)
+        self.assertEqual(SensorHealth.down, self.s.health)
+        self.assertEqual(10, self.s.restarts)
+
+        self.fail_start = False
+        self.s.check(self.s.next_restart)
+        self.assertEqual(SensorHealth.starting, self.s.health)
+
+    def test_backoff_reset_when_healthy(self):
+        self.s.start()
+        self.s.backoff = 4.0
+        self.s.check(self.s.started_at + HEALTHY_RESET_SECONDS)
+        self.assertEqual(1.0, self.s.backoff)
+
+    def test_samples_of_exited_handler_kept(self):
+        self.s.start()
+        self.created[0].data = [(1.0, 'a')]
+        self.created[0].dropped_samples = 3
+        self.created[0].alive = False
+        self.s.check()
+        self.assertEqual(3, self.s.dropped_samples)
+        self.assertTrue(self.s.data_ready())
+        self.assertEqual([(1.0, 'a')], self.s.get_all_data())
+
+    def test_stop_closes_handler(self):
+        self.s.start()
+        self.s.stop()
+        self.assertTrue(self.created[0].stopped)
+        self.assertTrue(self.created[0].closed)
+        self.assertIsNone(self.s.handler)
+
+    def test_idle_wait_handle(self):
+        self.assertFalse(self.s.data_ready())
+        self.assertFalse(wait([self.s.wait_handle], 0))
+
+    def test_sample_rate(self):
+        self.s.start()
+        self.s.check(self.s.rate_time + 1.0)
+        self.created[0].data = [(0, None)] * 20
+        self.s.get_all_data()
+        self.s.check(self.s.rate_time + 2.0)
+        self.assertAlmostEqual(10.0, self.s.sample_rate)
+        self.assertEqual({'health': 'ok', 'restarts': 0, 'sample_rate': 10.0}, self.s.get_status())
+
+
+class SensorSupervisorTests(TestCase):
+
+    def test_lost_sensors(self):
+        handlers = {}
+
+        def factory(name):
+            def create():
+                handlers[name] = FakeHandler()
+                return handlers[name]
+            return create
+
+        supervisor = SensorSupervisor()
+        gps = supervisor.supervise('gps', factory('gps'))
+        supervisor.supervise('can', factory('can'), backoff=10.0)
+        for s in supervisor.sensors.values():
+            s.start()
+        self.assertListEqual([], supervisor.lost_sensors())
+
+        handlers['can'].alive = False
+        supervisor.check()
+        self.assertListEqual(['can'], supervisor.lost_sensors())
+        self.assertEqual('down', supervisor.get_status()['can']['health'])
+        self.assertIs(gps, supervisor.sensors['gps'])
+
+
+def exit_immediately():
+    pass
+
+
+class ProcessSupervisionTests(TestCase):
+
+    def test_exited_process_restarted(self):
+        s = SupervisedSensorHandler('test', lambda: SensorHandler(exit_immediately), backoff=0.0)
+        s.start()
+        first = s.handler
+        first.process.join(5)
+        self.assertEqual(SensorHealth.down, s.check())
+        self.assertTrue(first.pipe_in.closed)
+        self.assertTrue(first.pipe_out.closed)
+        s.check()
+        self.assertIsNot(first, s.handler)
+        self.assertEqual(1, s.restarts)
+        s.stop()
+
+
+if __name__ == "__main__":
+    main()
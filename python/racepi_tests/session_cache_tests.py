@@ -0,0 +1,177 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase, main
+
+import numpy as np
+
+from racepi.can import focus_rs_rpm_converter
+from racepi.database.migrations import upgrade_database
+from racepi.database.session_cache import *
+
+
+class SessionCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.db = sqlite3.connect(":memory:")
+        upgrade_database(self.db)
+        self.db.execute("INSERT INTO sessions VALUES ('s1', '')")
+        self.db.executemany("INSERT INTO gps_data (session_id, timestamp, speed, lat, lon) VALUES (?, ?, ?, ?, ?)",
+                            [('s1', float(t), 2.0, 35.0, -86.0) for t in range(10)])
+        self.db.executemany("INSERT INTO imu_data (session_id, timestamp, x_accel) VALUES (?, ?, ?)",
+                            [('s1', t / 10.0, t / 100.0) for t in range(100)])
+        # rpm is bits 36-48, 2 rpm per bit
+        self.db.executemany("INSERT INTO can_data VALUES ('s1', ?, 144, 0, ?)",
+                            [(1.0, bytes.fromhex('0000000001f40000')), (2.0, bytes.fromhex('0000000003e80000'))])
+        self.db.execute("INSERT INTO can_data VALUES ('s1', 1.5, 145, 0, x'01')")
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_write_and_load(self):
+        self.assertFalse(is_session_cached(self.cache_dir, 's1'))
+        write_session_cache(self.db, 's1', self.cache_dir, {'rpm': (144, focus_rs_rpm_converter)})
+        self.assertTrue(is_session_cached(self.cache_dir, 's1'))
+
+        cache = SessionCache.open(self.cache_dir, 's1')
+        self.assertEqual('s1', cache.session_id)
+        self.assertListEqual(['can.rpm', 'gps', 'imu'], sorted(cache.channels()))
+        gps = cache.get('gps')
+        self.assertIsInstance(gps['speed'], np.memmap)
+        self.assertListEqual(list(range(10)), gps['timestamp'].tolist())
+        self.assertTrue(np.allclose(2.0 * np.arange(10), gps['distance']))
+        imu = cache.get('imu', ['timestamp', 'x_accel', 'distance'])
+        self.assertEqual(100, len(imu['x_accel']))
+        self.assertAlmostEqual(0.99, imu['x_accel'][-1])
+        self.assertAlmostEqual(19.8, imu['distance'][-1])
+        self.assertTrue(np.isnan(cache.get_column('imu', 'x_gyro')).all())
+        rpm = cache.get('can.rpm')
+        self.assertListEqual([1000.0, 2000.0], rpm['value'].tolist())
+        self.assertListEqual([2.0, 4.0], rpm['distance'].tolist())
+
+    def test_dataframe(self):
+        write_session_cache(self.db, 's1', self.cache_dir)
+        df = SessionCache.open(self.cache_dir, 's1').to_dataframe('gps', ['speed', 'distance'])
+        self.assertListEqual(['speed', 'distance'], list(df.columns))
+        self.assertEqual('timestamp', df.index.name)
+        self.assertEqual(10, len(df))
+
+    def test_empty_channels(self):
+        write_session_cache(self.db, 'missing', self.cache_dir)
+        cache = SessionCache.open(self.cache_dir, 'missing')
+        self.assertEqual(0, len(cache.get_column('gps', 'speed')))
+        self.assertEqual(0, len(cache.get_column('can.tps', 'value')))
+        self.assertRaises(KeyError, cache.get_column, 'gps', 'rpm')
+
+    def test_rebuild_replaces_cache(self):
+        path = write_session_cache(self.db, 's1', self.cache_dir)
+        self.db.execute("INSERT INTO gps_data (session_id, timestamp, speed) VALUES ('s1', 10.0, 2.0)")
+        write_session_cache(self.db, 's1', self.cache_dir)
+        self.assertEqual(11, len(SessionCache(path).get_column('gps', 'timestamp')))
+        self.assertListEqual(['s1'], os.listdir(self.cache_dir))
+
+    def test_get_session_cache_builds_once(self):
+        cache = get_session_cache(self.db, 's1', self.cache_dir)
+        created = cache.manifest['created']
+        self.assertEqual(created, get_session_cache(self.db, 's1', self.cache_dir).manifest['created'])
+
+    def test_get_session_cache_rebuilds_changed_session(self):
+        cache = get_session_cache(self.db, 's1', self.cache_dir)
+        self.assertEqual(10, cache.length('gps'))
+        # session still being recorded
+        self.db.execute("INSERT INTO gps_data (session_id, timestamp, speed) VALUES ('s1', 10.0, 2.0)")
+        self.db.execute("INSERT INTO can_data VALUES ('s1', 3.0, 145, 0, x'02')")
+        self.assertFalse(is_session_cached(self.cache_dir, 's1', session_fingerprint(self.db, 's1')))
+        self.assertTrue(is_session_cached(self.cache_dir, 's1'))
+        cache = get_session_cache(self.db, 's1', self.cache_dir)
+        self.assertEqual(11, cache.length('gps'))
+        self.assertTrue(is_session_cached(self.cache_dir, 's1', session_fingerprint(self.db, 's1')))
+
+    def test_get_session_cache_rebuilds_other_can_channels(self):
+        cache = get_session_cache(self.db, 's1', self.cache_dir)
+        self.assertIn('can.tps', cache.channels())
+        channels = {'rpm': (144, focus_rs_rpm_converter)}
+        self.assertFalse(is_session_cached(self.cache_dir, 's1', can_channels=channels))
+        cache = get_session_cache(self.db, 's1', self.cache_dir, channels)
+        self.assertListEqual(['can.rpm', 'gps', 'imu'], sorted(cache.channels()))
+        self.assertTrue(is_session_cached(self.cache_dir, 's1', can_channels=channels))
+
+    def test_session_fingerprint(self):
+        fingerprint = session_fingerprint(self.db, 's1')
+        self.assertEqual([10, 9.0], fingerprint['gps_data'])
+        self.assertEqual([3, 2.0], fingerprint['can_data'])
+        self.assertEqual([0, None], session_fingerprint(self.db, 'missing')['imu_data'])
+
+    def test_aggregate_level(self):
+        level = aggregate_level({'timestamp': np.arange(10.0), 'v': np.arange(10.0)}, 4)
+        self.assertListEqual([0.0, 4.0, 8.0], level['timestamp'].tolist())
+        self.assertListEqual([0.0, 4.0, 8.0], level['v_min'].tolist())
+        self.assertListEqual([3.0, 7.0, 9.0], level['v_max'].tolist())
+        self.assertListEqual([1.5, 5.5, 8.5], level['v_mean'].tolist())
+        self.assertEqual(0, len(aggregate_level({'timestamp': np.zeros(0), 'v': np.zeros(0)}, 4)['v_mean']))
+
+    def test_pyramid_levels(self):
+        write_session_cache(self.db, 's1', self.cache_dir)
+        cache = SessionCache.open(self.cache_dir, 's1')
+        self.assertListEqual([1] + list(PYRAMID_LEVELS), cache.levels('imu'))
+        self.assertEqual(13, cache.length('imu', 8))
+        self.assertIn('x_accel_max', cache.columns('imu', 8))
+        x_accel = cache.get_column('imu', 'x_accel_max', 8)
+        self.assertAlmostEqual(0.07, x_accel[0])
+        self.assertAlmostEqual(0.99, x_accel[-1])
+        self.assertEqual(1, cache.length('imu', 512))
+        self.assertRaises(KeyError, cache.get_column, 'imu', 'x_accel', 8)
+        self.assertRaises(KeyError, cache.length, 'imu', 2)
+
+    def test_select_level(self):
+        write_session_cache(self.db, 's1', self.cache_dir)
+        cache = SessionCache.open(self.cache_dir, 's1')
+        self.assertEqual(1, cache.select_level('imu'))
+        self.assertEqual(1, cache.select_level('imu', max_points=1000))
+        self.assertEqual(64, cache.select_level('imu', max_points=10))
+        self.assertEqual(512, cache.select_level('imu', max_points=1))
+        # narrow ranges are counted at the coarsest level, 512 samples
+        self.assertEqual(64, cache.select_level('imu', 2.0, 3.0, max_points=10))
+
+    def test_get_range(self):
+        write_session_cache(self.db, 's1', self.cache_dir)
+        cache = SessionCache.open(self.cache_dir, 's1')
+        level, data = cache.get_range('imu', 2.0, 3.0, columns=['timestamp', 'x_accel'])
+        self.assertEqual(1, level)
+        self.assertListEqual([2.0 + i / 10.0 for i in range(11)], [round(t, 1) for t in data['timestamp']])
+        level, data = cache.get_range('imu', 2.0, 3.0, max_points=100, columns=['timestamp', 'x_accel_mean'])
+        self.assertEqual(8, level)
+        # the bucket holding start is included
+        self.assertListEqual([1.6, 2.4], [round(t, 1) for t in data['timestamp']])
+
+    def test_version_mismatch(self):
+        path = write_session_cache(self.db, 's1', self.cache_dir)
+        with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+            f.write('{"version": 0}')
+        self.assertFalse(is_session_cached(self.cache_dir, 's1'))
+        self.assertRaises(ValueError, SessionCache, path)
+        self.assertRaises(ValueError, SessionCache.open, self.cache_dir, 'missing')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+import csv
+import io
+import sqlite3
+from unittest import TestCase, main
+
+import cantools
+
+from racepi.can import CanDecodePlan
+from racepi.database.export import *
+from racepi.database.migrations import upgrade_database
+
+TEST_DBC = """VERSION ""
+BS_:
+BU_:
+BO_ 133 Engine: 8 Vector__XXX
+ SG_ RPM : 7|16@0+ (1,0) [0|0] "" Vector__XXX
+"""
+
+
+class SessionExportTests(TestCase):
+
+    def setUp(self):
+        self.db = sqlite3.connect(":memory:")
+        upgrade_database(self.db)
+        self.db.execute("INSERT INTO sessions VALUES ('s1', '')")
+        self.db.execute("INSERT INTO sessions VALUES ('s2', '')")
+        self.db.executemany("INSERT INTO gps_data (session_id, timestamp, speed) VALUES (?, ?, ?)",
+                            [('s1', 1.0, 10.0), ('s1', 3.0, 11.0), ('s2', 2.0, 99.0)])
+        self.db.executemany("INSERT INTO imu_data (session_id, timestamp, x_accel) VALUES (?, ?, ?)",
+                            [('s1', t / 2.0, 0.5) for t in range(8)])
+        self.db.executemany("INSERT INTO can_data VALUES ('s1', ?, ?, 0, ?)",
+                            [(2.25, 0x85, bytes.fromhex('0bb8')), (1.25, 0x114, b'\x01'),
+                             (0.25, 0x85, bytes.fromhex('03e8'))])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_samples_time_ordered(self):
+        samples = list(iter_session_samples(self.db, 's1'))
+        times = [s[1] for s in samples]
+        self.assertEqual(sorted(times), times)
+        self.assertEqual(13, len(samples))
+        # equal timestamps keep table order, gps first
+        self.assertListEqual(['imu', 'can', 'imu', 'gps', 'imu'], [s[0] for s in samples[:5]])
+        self.assertEqual(0x114, [s for s in samples if s[0] == 'can'][1][2][0])
+
+    def test_session_exists(self):
+        self.assertTrue(session_exists(self.db, 's2'))
+        self.assertFalse(session_exists(self.db, 's3'))
+
+    def test_csv(self):
+        text = "".join(SessionExporter().iter_csv(self.db, 's1'))
+        rows = list(csv.reader(io.StringIO(text)))
+        self.assertEqual('#timestamp', rows[0][0])
+        header = rows[0]
+        self.assertEqual(14, len(rows))
+        self.assertEqual('CAN', rows[2][header.index('type')])
+        self.assertEqual('03e8', rows[2][header.index('msg')])
+        self.assertEqual('133', rows[2][header.index('arbitration_id')])
+        self.assertEqual('', rows[2][header.index('speed')])
+        self.assertEqual('GPS', rows[4][header.index('type')])
+        self.assertEqual('10.0', rows[4][header.index('speed')])
+
+    def test_csv_chunks(self):
+        exporter = SessionExporter()
+        chunks = list(exporter.iter_csv(self.db, 's1', chunk_rows=4))
+        self.assertEqual(4, len(chunks))
+        self.assertEqual("".join(exporter.iter_csv(self.db, 's1')), "".join(chunks))
+        f = io.StringIO()
+        self.assertEqual(1, exporter.write_csv(self.db, 's2', f))
+        self.assertIn('99.0', f.getvalue())
+
+    def test_decoded_signals(self):
+        plan = CanDecodePlan.from_database(cantools.database.load_string(TEST_DBC, 'dbc'))
+        exporter = SessionExporter(plan)
+        self.assertEqual('RPM', exporter.column_names()[-1])
+        rows = [r for r in exporter.iter_rows(self.db, 's1') if r[1] == 'CAN']
+        self.assertListEqual([1000, None, 3000], [r[-1] for r in rows])
+
+    def test_legacy_hex_payloads(self):
+        self.db.execute("INSERT INTO can_data VALUES ('s2', 1.0, 133, 0, '07d0')")
+        plan = CanDecodePlan.from_database(cantools.database.load_string(TEST_DBC, 'dbc'))
+        rows = [r for r in SessionExporter(plan).iter_rows(self.db, 's2') if r[1] == 'CAN']
+        self.assertEqual(bytes.fromhex('07d0'), rows[0][-2])
+        self.assertEqual(2000, rows[0][-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import tempfile
+from unittest import TestCase, main
+
+from racepi.database.db_handler import DbHandler
+from racepi.database.objects import *
+from racepi.database.session_statistics import SessionStatistics
+from racepi.sensor.recorder.data_buffer import DataBuffer
+
+GPS_SAMPLE = {'time': "2019-01-01T00:00:00.000Z", 'lat': "12.34", 'lon': "45.67", 'alt': "12.345",
+              'speed': "10.0", 'track': "300.0", 'epx': 1.0, 'epy': 2.0, 'epv': 3.0}
+IMU_SAMPLE = {'fusionPose': (1, 2, 3), 'accel': (4, 5, 6), 'gyro': (7, 8, 9)}
+
+
+class SessionStatisticsTests(TestCase):
+
+    def test_empty(self):
+        s = SessionStatistics("session")
+        self.assertEqual(0, s.num_data_samples)
+        self.assertEqual(0.0, s.duration)
+        self.assertFalse(s.is_complete())
+
+    def test_gps_fixes(self):
+        s = SessionStatistics("session")
+        for t, v in [(1.0, 10.0), (2.0, 20.0), (2.0, 50.0), (4.0, 5.0)]:
+            s.add_gps_fix(t, v)
+        self.assertEqual(3, s.gps_fixes)
+        self.assertEqual(1.0, s.start_time)
+        self.assertEqual(3.0, s.duration)
+        self.assertEqual(20.0, s.max_speed)
+        self.assertEqual(20.0 + 10.0, s.distance)
+        self.assertTrue(s.is_complete())
+
+    def test_sample_counts(self):
+        s = SessionStatistics("session")
+        s.add_samples('imu', 3)
+        s.add_samples('can', 4)
+        s.add_samples('imu', 1)
+        self.assertEqual(4, s.sample_counts['imu'])
+        self.assertEqual(8, s.num_data_samples)
+
+
+class LoggedSessionInfoTests(TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.h = DbHandler(self.db_path)
+        self.h.connect()
+        Base.metadata.create_all(self.h.db_session.get_bind())
+        self.session_id = self.h.get_new_session()
+
+    def tearDown(self):
+        self.h.db_session.close()
+        os.remove(self.db_path)
+
+    def log_seconds(self, start, stop):
+        data = DataBuffer()
+        data.add_sample('gps', [(float(t), dict(GPS_SAMPLE)) for t in range(start, stop)])
+        data.add_sample('imu', [(float(t), IMU_SAMPLE) for t in range(start, stop)])
+        data.add_sample('can', [])
+        self.h.log_data_from_active_session(data, self.session_id)
+
+    def check_session_info(self):
+        self.log_seconds(0, 5)
+        self.log_seconds(5, 10)
+        self.h.populate_session_info(self.session_id)
+        si = self.h.db_session.query(SessionInfo).one()
+        self.assertEqual(20, si.num_data_samples)
+        self.assertEqual(0.0, si.start_time_utc)
+        self.assertEqual(9.0, si.duration)
+        self.assertEqual(10.0, si.max_speed)
+        self.assertEqual(90.0, si.distance)
+        self.assertNotIn(self.session_id, self.h.session_statistics)
+
+    def test_bulk_insert(self):
+        self.check_session_info()
+
+    def test_orm_insert(self):
+        self.h.bulk_insert = False
+        self.check_session_info()
+
+    def test_short_session_has_no_info(self):
+        self.log_seconds(0, 2)
+        self.h.populate_session_info(self.session_id)
+        self.assertEqual(0, self.h.db_session.query(SessionInfo).count())
+
+    def test_session_read_back(self):
+        self.log_seconds(0, 10)
+        # e.g. a session logged before a restart
+        self.h.session_statistics.clear()
+        self.h.populate_session_info(self.session_id)
+        si = self.h.db_session.query(SessionInfo).one()
+        self.assertEqual(20, si.num_data_samples)
+        self.assertEqual(9.0, si.duration)
+
+
+if __name__ == "__main__":
+    main()
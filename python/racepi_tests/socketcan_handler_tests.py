@@ -0,0 +1,203 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import socket
+import struct
+import time
+from unittest import TestCase, main, skipUnless
+
+from racepi.sensor.handler.socketcan import *
+
+
+class SocketCanFrameTests(TestCase):
+
+    def test_standard_frame(self):
+        data = struct.pack(CAN_MESSAGE_FMT, 0x085, 8, bytes(range(8)))
+        s = unpack_can_frame(1.0, data)
+        self.assertEqual(0x085, s.arbitration_id)
+        self.assertFalse(s.extended)
+        self.assertEqual(8, s.dlc)
+        self.assertEqual(bytes(range(8)), s.payload)
+
+    def test_short_frame_payload_cut_to_dlc(self):
+        data = struct.pack(CAN_MESSAGE_FMT, 0x303, 3, b'\x01\x02\x03\xff\xff')
+        s = unpack_can_frame(1.0, data)
+        self.assertEqual(3, s.dlc)
+        self.assertEqual(b'\x01\x02\x03', s.payload)
+
+    def test_extended_frame_flag_kept(self):
+        data = struct.pack(CAN_MESSAGE_FMT, CAN_EFF_FLAG | 0x18DAF110, 2, b'\x01\x02')
+        s = unpack_can_frame(1.0, data)
+        self.assertEqual(0x18DAF110, s.arbitration_id)
+        self.assertTrue(s.extended)
+
+    def test_extended_frame_with_standard_id_value(self):
+        standard = unpack_can_frame(1.0, struct.pack(CAN_MESSAGE_FMT, 0x085, 1, b'\x01'))
+        extended = unpack_can_frame(1.0, struct.pack(CAN_MESSAGE_FMT, CAN_EFF_FLAG | 0x085, 1, b'\x01'))
+        self.assertEqual(standard.arbitration_id, extended.arbitration_id)
+        self.assertNotEqual(standard, extended)
+
+    def test_fd_frame(self):
+        data = struct.pack(CANFD_MESSAGE_FMT, CAN_EFF_FLAG | 0x18DAF110, 48, bytes(range(64)))
+        self.assertEqual(72, len(data))
+        s = unpack_can_frame(1.0, data)
+        self.assertEqual(0x18DAF110, s.arbitration_id)
+        self.assertTrue(s.extended)
+        self.assertEqual(48, s.dlc)
+        self.assertEqual(bytes(range(48)), s.payload)
+
+
+class FakeSocket:
+
+    def __init__(self):
+        self.options = []
+
+    def setsockopt(self, *args):
+        self.options.append(args)
+
+
+class CanFilterTests(TestCase):
+
+    def test_standard_id(self):
+        can_id, mask = can_id_filter(0x085)
+        self.assertEqual(0x085, can_id)
+        # extended and remote frames with the same low bits do not match
+        self.assertEqual(CAN_SFF_MASK | CAN_EFF_FLAG | CAN_RTR_FLAG, mask)
+        self.assertNotEqual(can_id & mask, (CAN_EFF_FLAG | 0x085) & mask)
+        self.assertNotEqual(can_id & mask, 0x185 & mask)
+
+    def test_extended_id(self):
+        can_id, mask = can_id_filter(0x18DAF110)
+        self.assertEqual(CAN_EFF_FLAG | 0x18DAF110, can_id)
+        self.assertEqual(CAN_EFF_MASK | CAN_EFF_FLAG | CAN_RTR_FLAG, mask)
+        self.assertNotEqual(can_id & mask, 0x110 & mask)
+
+    def test_explicit_mask(self):
+        self.assertEqual((0x400, 0x700), can_id_filter((0x400, 0x700)))
+
+    def test_set_filters(self):
+        sock = FakeSocket()
+        set_can_id_filters(sock, [0x085, 0x18DAF110])
+        level, option, data = sock.options[0]
+        self.assertEqual(socket.SOL_CAN_RAW, level)
+        self.assertEqual(socket.CAN_RAW_FILTER, option)
+        self.assertEqual(can_id_filter(0x085) + can_id_filter(0x18DAF110), struct.unpack("=4I", data))
+
+    def test_no_filters_receives_all(self):
+        # an empty filter list would make the kernel drop every frame
+        sock = FakeSocket()
+        set_can_id_filters(sock, [])
+        self.assertListEqual([], sock.options)
+
+
+
+class CanFrameBatchReaderTests(TestCase):
+
+    def setUp(self):
+        # a datagram socket pair stands in for a CAN_RAW socket
+        self.sender, self.receiver = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.reader = CanFrameBatchReader(self.receiver, batch_size=4)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def send_frames(self, count):
+        for i in range(count):
+            self.sender.send(struct.pack(CAN_MESSAGE_FMT, 0x100 + i, 2, bytes([i, i])))
+
+    def test_read_empty(self):
+        self.assertListEqual([], self.reader.read_samples())
+
+    def test_read_pending_frames(self):
+        before = time.time()
+        self.send_frames(3)
+        samples = self.reader.read_samples()
+        self.assertEqual([0x100, 0x101, 0x102], [s[1].arbitration_id for s in samples])
+        self.assertEqual(bytes([2, 2]), samples[2][1].payload)
+        for t, sample in samples:
+            self.assertEqual(t, sample.timestamp)
+            self.assertAlmostEqual(before, t, delta=1.0)
+        self.assertListEqual([], self.reader.read_samples())
+
+    def test_kernel_timestamps(self):
+        self.assertTrue(self.reader.kernel_timestamps)
+        self.send_frames(1)
+        time.sleep(0.05)
+        t, _ = self.reader.read_samples()[0]
+        # stamped on receipt, not when read
+        self.assertLess(t, time.time() - 0.04)
+
+    def test_read_limited_to_batch(self):
+        self.send_frames(6)
+        self.assertEqual(4, len(self.reader.read_samples()))
+        self.assertEqual([0x104, 0x105], [s[1].arbitration_id for s in self.reader.read_samples()])
+
+    def test_fd_frames(self):
+        reader = CanFrameBatchReader(self.receiver, batch_size=4, fd_frames=True)
+        self.sender.send(struct.pack(CAN_MESSAGE_FMT, 0x085, 2, b'\x01\x02'))
+        self.sender.send(struct.pack(CANFD_MESSAGE_FMT, CAN_EFF_FLAG | 0x18DAF110, 64, bytes(range(64))))
+        self.sender.send(struct.pack(CAN_MESSAGE_FMT, 0x086, 1, b'\x03'))
+        samples = [s[1] for s in reader.read_samples()]
+        self.assertEqual([0x085, 0x18DAF110, 0x086], [s.arbitration_id for s in samples])
+        self.assertEqual([False, True, False], [s.extended for s in samples])
+        self.assertEqual([b'\x01\x02', bytes(range(64)), b'\x03'], [s.payload for s in samples])
+
+    def test_short_datagram_skipped(self):
+        self.sender.send(b'\x01\x02')
+        self.send_frames(1)
+        samples = self.reader.read_samples()
+        self.assertEqual([0x100], [s[1].arbitration_id for s in samples])
+
+
+class SocketCanSensorHandlerTests(TestCase):
+
+    def test_close_releases_socket(self):
+        # skip opening a device, a socket pair stands in for the CAN socket
+        h = SocketCanSensorHandler.__new__(SocketCanSensorHandler)
+        SensorHandler.__init__(h, None)
+        sock, other = socket.socketpair()
+        h.cansocket = sock
+        h.close()
+        other.close()
+        self.assertIsNone(h.cansocket)
+        self.assertEqual(-1, sock.fileno())
+        self.assertTrue(h.pipe_in.closed)
+
+
+@skipUnless(os.path.exists("/sys/class/net/vcan0"), "vcan0 interface not available")
+class VirtualCanBatchReaderTests(TestCase):
+
+    def test_read_vcan(self):
+        receiver = open_can_socket("vcan0", [0x085])
+        sender = open_can_socket("vcan0", [])
+        try:
+            reader = CanFrameBatchReader(receiver)
+            for i in range(10):
+                sender.send(struct.pack(CAN_MESSAGE_FMT, 0x085, 8, bytes(range(8))))
+            time.sleep(0.05)
+            samples = reader.read_samples()
+            self.assertEqual(10, len(samples))
+            self.assertEqual(bytes(range(8)), samples[0][1].payload)
+        finally:
+            receiver.close()
+            sender.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from unittest import TestCase, main
+
+from racepi.sensor.handler.stn11xx import STNHandler
+
+
+class FakeSerialPort:
+    """Serial port that returns queued bytes, and nothing once empty"""
+
+    def __init__(self, data):
+        self.data = bytearray(data)
+        self.timeout = None
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    @property
+    def in_waiting(self):
+        return len(self.data)
+
+    def read(self, size=1):
+        if not self.data:
+            if self.timeout is None:
+                raise RuntimeError("blocking read on empty port")
+            return b''
+        result = bytes(self.data[:size])
+        del self.data[:size]
+        return result
+
+
+class STNHandlerReadlineTests(TestCase):
+
+    def setUp(self):
+        # skip device initialisation
+        self.stn = STNHandler.__new__(STNHandler)
+
+    def test_readline(self):
+        self.stn.port = FakeSerialPort(b'>0850000ffff00000000\r')
+        self.assertEqual('0850000ffff00000000', self.stn.readline())
+
+    def test_readline_timeout(self):
+        self.stn.port = FakeSerialPort(b'')
+        self.assertIsNone(self.stn.readline(timeout=0.01))
+        self.assertIsNone(self.stn.port.timeout)
+
+    def test_readline_timeout_with_data(self):
+        self.stn.port = FakeSerialPort(b'1140000\r3030000\r')
+        self.assertEqual('1140000', self.stn.readline(timeout=0.01))
+        self.assertEqual('3030000', self.stn.readline(timeout=0.01))
+
+    def test_close(self):
+        port = self.stn.port = FakeSerialPort(b'')
+        self.stn.close()
+        self.assertFalse(port.is_open)
+        self.assertIsNone(self.stn.port)
+        self.stn.close()
+
+
+if __name__ == "__main__":
+    main()
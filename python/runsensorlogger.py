@@ -20,13 +20,16 @@ import os
 
 from racepi.sensor.data_utilities import uptime_helper
 from racepi.sensor.recorder.sensor_log import SensorLogger
+from racepi.database.column_store import ColumnStoreHandler
 from racepi.database.db_handler import DbHandler
-from racepi.sensor.handler.gps import GpsSensorHandler
+from racepi.sensor.handler.gps import AsyncGpsSensorHandler
 from racepi.sensor.handler.pi_sense_hat_imu import RpiImuSensorHandler
 from racepi.sensor.handler.stn11xx_can import STN11XXCanSensorHandler
+from racepi.sensor.handler.supervisor import SensorSupervisor
 
 # TODO: move the DB filename to a config file in /etc
 DEFAULT_SQLITE_FILE = '/external/racepi_data/test.db'
+DEFAULT_COLUMN_STORE_DIR = '/external/racepi_data/column_store'
 # TODO: make recorded can ids configurable
 FORD_FOCUS_RS_CAN_IDS  = [0x010, 0x070, 0x080, 0x090, 0x190, 0x130, 0x213, 0x420]
 LOTUS_EVORA_S1_CAN_IDS = [0x085, 0x114, 0x303]
@@ -43,25 +46,33 @@ if __name__ == "__main__":
     while float(uptime_helper()) < 10.0:
         time.sleep(1)
 
-    if len(sys.argv) < 2:
-        dbfile = DEFAULT_SQLITE_FILE
+    # log to a column store instead of sqlite with --column-store
+    args = sys.argv[1:]
+    column_store = "--column-store" in args
+    args = [a for a in args if a != "--column-store"]
+    if not args:
+        dbfile = DEFAULT_COLUMN_STORE_DIR if column_store else DEFAULT_SQLITE_FILE
     else:
-        dbfile = sys.argv[1]
+        dbfile = args[0]
 
     print(UNDERLINE+"Starting RacePi Sensor Logger"+ENDCOLOR)
 
     print("Opening Sensor Handlers")
+    # socket based sensors are read by coroutines in this process,
+    # blocking drivers each run in their own process. Handlers are
+    # recreated when their reader exits, e.g. on a loose USB cable
+    supervisor = SensorSupervisor()
     handlers = {
-        'gps': GpsSensorHandler(),
-        'imu': RpiImuSensorHandler(),
-        # 'can': SocketCanSensorHandler(can_filters=ACTIVE_CAN_IDS),
-        'can': STN11XXCanSensorHandler(ACTIVE_CAN_IDS),
-        # 'tpms': LightSpeedTPMSSensorHandler(),
+        'gps': supervisor.supervise('gps', AsyncGpsSensorHandler),
+        'imu': supervisor.supervise('imu', RpiImuSensorHandler),
+        # 'can': supervisor.supervise('can', lambda: AsyncSocketCanSensorHandler(can_filters=ACTIVE_CAN_IDS)),
+        'can': supervisor.supervise('can', lambda: STN11XXCanSensorHandler(ACTIVE_CAN_IDS)),
+        # 'tpms': supervisor.supervise('tpms', AsyncLightSpeedTPMSSensorHandler),
     }
 
     print("Opening Database: %s" % dbfile)
     # TODO: look at opening DB as needed
     # to avoid corruption of tables
-    db_handler = DbHandler(dbfile)
-    sl = SensorLogger(db_handler, handlers, DBC_FILENAME)
+    db_handler = ColumnStoreHandler(dbfile) if column_store else DbHandler(dbfile)
+    sl = SensorLogger(db_handler, handlers, DBC_FILENAME, supervisor)
     sl.start()
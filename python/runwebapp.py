@@ -17,9 +17,11 @@
 # along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy import create_engine
-from racepi_webapp import app
+from racepi_webapp import app, session_data_cache
 
 DEFAULT_SQLITE_FILE = '/external/racepi_data/test.db'
+DEFAULT_SESSION_CACHE_DIR = '/external/racepi_data/session_cache'
+DEFAULT_DATA_CACHE_DIR = '/external/racepi_data/webapp_cache'
 #DEFAULT_SQLITE_FILE = '/home/donour/houston.db'
 
 if __name__ == "__main__":   
@@ -31,6 +33,13 @@ if __name__ == "__main__":
         dbfile = sys.argv[1]
 
     app.db = create_engine("sqlite:///"+dbfile)
+    app.session_cache_dir = DEFAULT_SESSION_CACHE_DIR
+    # keep query results and plot series across restarts
+    session_data_cache.persist_dir = DEFAULT_DATA_CACHE_DIR
+    # optional DBC file, decodes CAN signals in plots, the session cache and exports
+    if len(sys.argv) > 2:
+        from racepi.can.decode_plan import CanDecodePlan
+        app.can_decode_plan = CanDecodePlan.from_dbc_file(sys.argv[2])
     # FIXME: disabling debugging causes 100% cpu usage, notifier?
     app.run(host='0.0.0.0', debug=True, threaded=True)
 
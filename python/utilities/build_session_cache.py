@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Materialise recorded sessions into the columnar session cache used by
+the analysis apps. Run after a recording, sessions that are already
+cached are skipped unless --rebuild is given.
+
+Usage: build_session_cache.py [--rebuild] <sqlite db filename> <cache dir> [session id ...]
+"""
+
+import sqlite3
+import sys
+import time
+
+from racepi.database.session_cache import is_session_cached, session_fingerprint, write_session_cache
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    rebuild = "--rebuild" in args
+    args = [a for a in args if a != "--rebuild"]
+    if len(args) < 2:
+        print("Usage: %s [--rebuild] <sqlite db filename> <cache dir> [session id ...]" % sys.argv[0])
+        sys.exit(1)
+
+    dbfile, cache_dir, session_ids = args[0], args[1], args[2:]
+    db = sqlite3.connect(dbfile)
+    try:
+        if not session_ids:
+            session_ids = [r[0] for r in db.execute("SELECT session_id FROM session_info ORDER BY start_time_utc")]
+        for session_id in session_ids:
+            if not rebuild and is_session_cached(cache_dir, session_id, session_fingerprint(db, session_id)):
+                continue
+            start = time.time()
+            path = write_session_cache(db, session_id, cache_dir)
+            print("%s: cached in %.1fs" % (path, time.time() - start))
+    finally:
+        db.close()
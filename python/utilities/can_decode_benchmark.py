@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compare per-frame and batch CAN signal decoding over a simulated
+1 hour session of a 100hz arbitration id.
+"""
+
+import os
+import sys
+import time
+
+from racepi.can import focus_rs_rpm_converter
+from racepi.can.data import CanFrame, can_payloads_to_array
+
+SESSION_SECONDS = 3600
+FRAME_RATE_HZ = 100
+
+
+def per_frame(msgs):
+    return [focus_rs_rpm_converter.convert_frame(CanFrame('090', m)) for m in msgs]
+
+
+def batch(msgs):
+    return focus_rs_rpm_converter.convert_frames(can_payloads_to_array(msgs))
+
+
+def timed(name, func, msgs):
+    start = time.time()
+    result = func(msgs)
+    elapsed = time.time() - start
+    print("%-10s %8.3fs  %10.0f frames/s" % (name, elapsed, len(msgs) / elapsed))
+    return result, elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else SESSION_SECONDS * FRAME_RATE_HZ
+    # payloads as stored in the can_data table
+    msgs = [os.urandom(8) for _ in range(count)]
+    print("decoding %d frames" % count)
+    slow, before = timed("per-frame", per_frame, msgs)
+    fast, after = timed("batch", batch, msgs)
+    if list(fast) != slow:
+        raise RuntimeError("decoded values differ")
+    print("speedup:   %8.1fx" % (before / after))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Time the analysis queries against a legacy (version 0) database and
+again after upgrading it to the current schema. The database is filled
+with simulated sessions.
+
+Usage: database_query_benchmark.py [sessions] [session seconds]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from racepi.database.migrations import TELEMETRY_TABLES, SESSION_TABLES, create_telemetry_table_sql, \
+    upgrade_database
+
+DEFAULT_SESSIONS = 10
+DEFAULT_SESSION_SECONDS = 300
+GPS_RATE_HZ = 10
+IMU_RATE_HZ = 100
+CAN_IDS = [0x085, 0x114, 0x303]
+CAN_RATE_HZ = 100
+QUERY_REPEAT = 5
+
+QUERIES = [
+    ("gps by session", "SELECT timestamp, speed, track, lat, lon FROM gps_data WHERE session_id=?", ()),
+    ("imu by session", "SELECT timestamp, x_accel, y_accel, z_accel FROM imu_data WHERE session_id=?", ()),
+    ("can by session and id", "SELECT timestamp, msg FROM can_data WHERE session_id=? AND arbitration_id=?",
+     (CAN_IDS[1],)),
+    ("session info counts", "SELECT (SELECT COUNT(*) FROM imu_data WHERE session_id=?1), "
+                            "(SELECT COUNT(*) FROM can_data WHERE session_id=?1)", ()),
+]
+
+
+def create_legacy_database(filename, sessions, seconds):
+    db = sqlite3.connect(filename)
+    for name, columns in SESSION_TABLES:
+        db.execute("CREATE TABLE %s (%s)" % (name, columns))
+    for name, columns, _ in TELEMETRY_TABLES:
+        db.execute(create_telemetry_table_sql(name, columns))
+    for s in range(sessions):
+        session_id = "session-%d" % s
+        start = s * seconds * 2.0
+        db.execute("INSERT INTO sessions VALUES (?, '')", (session_id,))
+        db.executemany("INSERT INTO gps_data (session_id, timestamp, speed) VALUES (?, ?, 30.0)",
+                       [(session_id, start + i / GPS_RATE_HZ) for i in range(seconds * GPS_RATE_HZ)])
+        db.executemany("INSERT INTO imu_data (session_id, timestamp, x_accel) VALUES (?, ?, 0.1)",
+                       [(session_id, start + i / IMU_RATE_HZ) for i in range(seconds * IMU_RATE_HZ)])
+        db.executemany("INSERT INTO can_data VALUES (?, ?, ?, 0, x'0000ffff00000000')",
+                       [(session_id, start + i / CAN_RATE_HZ, arb_id)
+                        for i in range(seconds * CAN_RATE_HZ) for arb_id in CAN_IDS])
+        db.commit()
+    return db
+
+
+def measure(db, sessions):
+    results = []
+    for name, query, args in QUERIES:
+        start = time.time()
+        for _ in range(QUERY_REPEAT):
+            for s in range(sessions):
+                db.execute(query, ("session-%d" % s,) + args).fetchall()
+        results.append((name, (time.time() - start) / (QUERY_REPEAT * sessions)))
+    return results
+
+
+if __name__ == "__main__":
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SESSIONS
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SESSION_SECONDS
+
+    fd, dbfile = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.remove(dbfile)
+    try:
+        db = create_legacy_database(dbfile, sessions, seconds)
+        before = measure(db, sessions)
+        upgrade_database(db)
+        after = measure(db, sessions)
+        db.close()
+        print("%-24s %12s %12s %8s" % ("query", "legacy (ms)", "keyed (ms)", "speedup"))
+        for (name, b), (_, a) in zip(before, after):
+            print("%-24s %12.2f %12.2f %7.1fx" % (name, b * 1000, a * 1000, b / a))
+    finally:
+        os.remove(dbfile)
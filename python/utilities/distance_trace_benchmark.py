@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compare the loop based time to distance conversion with
+TimeToDistanceConverter over a simulated 10hz GPS track and a 1M sample
+IMU trace.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from racepi.sensor.data_utilities import TimeToDistanceConverter
+
+GPS_RATE_HZ = 10
+IMU_RATE_HZ = 100
+
+
+def loop_distance_trace(speed_data, time_trace):
+    """ the previous implementation, integration and lookup in python """
+    distance_samples = []
+    t_last = speed_data[0][0]
+    total_distance = 0.0
+    for t, v in speed_data[1:]:
+        t_delta = t - t_last
+        t_last = t
+        d_delta = t_delta * v
+        total_distance = total_distance + d_delta
+        distance_samples.append((t, total_distance, t_delta, d_delta))
+
+    result = []
+    dist_iter = iter(distance_samples)
+    last_dist = next(dist_iter)
+    next_dist = next(dist_iter)
+    for sample in time_trace:
+        try:
+            while next_dist[0] < sample:
+                last_dist = next_dist
+                next_dist = next(dist_iter)
+        except StopIteration:
+            pass
+        if next_dist[2] > 1e-4:
+            result.append((sample - last_dist[0]) / next_dist[2] * next_dist[3] + last_dist[1])
+        else:
+            result.append(0.0)
+    return result
+
+
+def numpy_distance_trace(speed_data, time_trace):
+    return TimeToDistanceConverter(speed_data).generate_distance_trace(time_trace)
+
+
+def timed(name, func, *args):
+    start = time.time()
+    result = func(*args)
+    elapsed = time.time() - start
+    print("%-10s %8.3fs" % (name, elapsed))
+    return result, elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    duration = count / IMU_RATE_HZ
+    gps_times = np.arange(0.0, duration, 1.0 / GPS_RATE_HZ)
+    gps_speeds = 30.0 + 10.0 * np.sin(gps_times / 20.0)
+    speed_data = list(zip(gps_times.tolist(), gps_speeds.tolist()))
+    imu_times = np.linspace(0.0, duration, count, endpoint=False)
+
+    print("%d gps fixes, %d imu samples" % (len(speed_data), count))
+    slow, before = timed("loop", loop_distance_trace, speed_data, imu_times.tolist())
+    fast, after = timed("numpy", numpy_distance_trace, speed_data, imu_times)
+    # the loop extrapolates back from the second fix, compare after it
+    second_fix = IMU_RATE_HZ // GPS_RATE_HZ
+    if not np.allclose(np.asarray(slow)[second_fix:], fast[second_fix:]):
+        raise RuntimeError("distance traces differ")
+    print("speedup:   %8.1fx" % (before / after))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Export one recorded session as CSV or Parquet, streaming the rows in
+time order. Parquet export requires pyarrow.
+
+Usage: export_session.py [--parquet] [--dbc <dbc file>] <sqlite db filename> <session id> <output file or ->
+"""
+
+import sqlite3
+import sys
+
+from racepi.can.decode_plan import CanDecodePlan
+from racepi.database.export import SessionExporter, session_exists
+
+USAGE = "Usage: %s [--parquet] [--dbc <dbc file>] <sqlite db filename> <session id> <output file or ->"
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    parquet = "--parquet" in args
+    args = [a for a in args if a != "--parquet"]
+    dbc_filename = None
+    if "--dbc" in args:
+        i = args.index("--dbc")
+        dbc_filename = args[i + 1] if i + 1 < len(args) else None
+        args = args[:i] + args[i + 2:]
+    if len(args) != 3 or ("--dbc" in sys.argv and not dbc_filename):
+        print(USAGE % sys.argv[0])
+        sys.exit(1)
+    dbfile, session_id, output = args
+
+    exporter = SessionExporter(CanDecodePlan.from_dbc_file(dbc_filename) if dbc_filename else None)
+    db = sqlite3.connect(dbfile)
+    try:
+        if not session_exists(db, session_id):
+            print("Unknown session: %s" % session_id, file=sys.stderr)
+            sys.exit(1)
+        if parquet:
+            rows = exporter.write_parquet(db, session_id, output)
+            print("%s: %d rows" % (output, rows))
+        elif output == "-":
+            exporter.write_csv(db, session_id, sys.stdout)
+        else:
+            with open(output, "w", newline='') as f:
+                exporter.write_csv(db, session_id, f)
+    finally:
+        db.close()
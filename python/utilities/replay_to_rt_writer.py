@@ -26,12 +26,14 @@ import time
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from racepi.can.data import CanSample
 from racepi.racetech.writers import RaceTechnologyDL1FeedWriter
-from racepi_database_handler import Base, SessionInfo, GPSData, IMUData, CANData
-from racepi.sensor.data_utilities import merge_and_generate_ordered_log
+from racepi.database import Base, SessionInfo, GPSData, IMUData, CANData
+from racepi.sensor.data_utilities import iter_ordered_log
 
 
 BLUETOOTH_CLIENT_WAIT_SECONDS = 0.1
+REPLAY_BATCH_SIZE = 1000
 
 
 def replay(db_file, session_id):
@@ -53,22 +55,21 @@ def replay(db_file, session_id):
             continue  # skip if different session_id specified
 
         data = {}
-        # load all data for session
-        gps_data = s.query(GPSData).filter(GPSData.session_id == si.session_id).all()
-        imu_data = s.query(IMUData).filter(IMUData.session_id == si.session_id).all()
-        can_data = s.query(CANData).filter(CANData.session_id == si.session_id).all()
+        # stream the session in time order, without loading it
+        gps_data = s.query(GPSData.timestamp, GPSData.speed, GPSData.lat, GPSData.lon, GPSData.alt).\
+            filter(GPSData.session_id == si.session_id).order_by(GPSData.timestamp).yield_per(REPLAY_BATCH_SIZE)
+        imu_data = s.query(IMUData.timestamp, IMUData.x_accel, IMUData.y_accel, IMUData.z_accel).\
+            filter(IMUData.session_id == si.session_id).order_by(IMUData.timestamp).yield_per(REPLAY_BATCH_SIZE)
+        can_data = s.query(CANData.timestamp, CANData.arbitration_id, CANData.msg).\
+            filter(CANData.session_id == si.session_id).order_by(CANData.timestamp).yield_per(REPLAY_BATCH_SIZE)
 
         # construct replay messages
-        data['gps'] = [(x.timestamp, {'speed': x.speed, 'lat': x.lat, 'lon': x.lon, 'alt': x.alt})
-                       for x in gps_data]
-        data['imu'] = [(x.timestamp, {'accel': (x.x_accel, x.y_accel, x.z_accel)})
-                       for x in imu_data]
-        data['can'] = [(x.timestamp, "%03x%s" % (x.arbitration_id, x.msg))
-                       for x in can_data]
+        data['gps'] = ((t, {'speed': speed, 'lat': lat, 'lon': lon, 'alt': alt})
+                       for t, speed, lat, lon, alt in gps_data)
+        data['imu'] = ((t, {'accel': (x, y, z)}) for t, x, y, z in imu_data)
+        data['can'] = ((t, CanSample(t, arb_id, len(msg), msg)) for t, arb_id, msg in can_data)
 
-        flat_data = merge_and_generate_ordered_log(data)
-
-        for val in flat_data:
+        for val in iter_ordered_log(data):
             if val:
                 if val[0] == 'gps':
                     writer.write_gps_sample(val[1], val[2])
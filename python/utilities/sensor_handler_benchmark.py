@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measure SensorHandler throughput, in samples per second, for
+per-sample pipe sends and for batched sends.
+"""
+
+import sys
+import time
+
+from racepi.sensor.handler.sensor_handler import SensorHandler
+
+DEFAULT_SAMPLE_COUNT = 200000
+CAN_SAMPLE = "0850000ffff00000000"
+
+
+class UnbatchedProducer(SensorHandler):
+    """Reproduces the original one-send-per-sample transport"""
+
+    def __init__(self, count):
+        SensorHandler.__init__(self, self.__produce)
+        self.count = count
+
+    def __produce(self):
+        for _ in range(self.count):
+            self.pipe_out.send((time.time(), CAN_SAMPLE))
+
+    def get_all_data(self):
+        data = []
+        while self.pipe_in.poll():
+            data.append(self.pipe_in.recv())
+        return data
+
+
+class BatchedProducer(SensorHandler):
+
+    def __init__(self, count):
+        SensorHandler.__init__(self, self.__produce)
+        self.count = count
+
+    def __produce(self):
+        for _ in range(self.count):
+            self.send_sample((time.time(), CAN_SAMPLE))
+        self.flush_samples()
+
+
+def measure(handler, count):
+    received = 0
+    start = time.time()
+    handler.start()
+    while received < count:
+        data = handler.get_all_data()
+        if data:
+            received += len(data)
+        else:
+            time.sleep(0.001)
+    elapsed = time.time() - start
+    handler.stop()
+    return count / elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SAMPLE_COUNT
+    before = measure(UnbatchedProducer(count), count)
+    print("unbatched: %10.0f samples/s" % before)
+    after = measure(BatchedProducer(count), count)
+    print("batched:   %10.0f samples/s" % after)
+    print("speedup:   %10.1fx" % (after / before))
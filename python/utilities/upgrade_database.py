@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# Copyright 2019 Donour Sizemore
+#
+# This file is part of RacePi
+#
+# RacePi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+#
+# RacePi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with RacePi.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Upgrade a RacePi sqlite file in place to the current schema. Stop the
+sensor logger first. Each schema version is applied in one transaction.
+
+Usage: upgrade_database.py [--keep-rowid] <sqlite db filename> ...
+"""
+
+import sqlite3
+import sys
+
+from racepi.database.migrations import SCHEMA_VERSION, get_schema_version, upgrade_database
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    without_rowid = "--keep-rowid" not in args
+    filenames = [a for a in args if a != "--keep-rowid"]
+    if not filenames:
+        print("Usage: %s [--keep-rowid] <sqlite db filename> ..." % sys.argv[0])
+        sys.exit(1)
+
+    for dbfile in filenames:
+        db = sqlite3.connect(dbfile)
+        try:
+            print("%s: schema version %d" % (dbfile, get_schema_version(db)))
+            for version in upgrade_database(db, without_rowid):
+                print("%s: upgraded to version %d" % (dbfile, version))
+            print("%s: schema version %d (current %d)" % (dbfile, get_schema_version(db), SCHEMA_VERSION))
+            db.execute("VACUUM")
+        finally:
+            db.close()
@@ -24,7 +24,8 @@ CREATE TABLE can_data
 	timestamp DATETIME NOT NULL,
 	arbitration_id integer NOT NULL, -- base (11bit) or extended (29bit)
 	rtr integer NOT NULL,            -- 0 for data frames, 1 for data requests
-	msg BLOB NOT NULL,               -- data payload, string of 8 hexidecimal bytes	
+	msg BLOB NOT NULL,               -- data payload, raw bytes (older files: string of hexidecimal bytes)
+	PRIMARY KEY(session_id, arbitration_id, timestamp),
 	FOREIGN KEY(session_id) REFERENCES sessions(id)
-);COMMIT;
+) WITHOUT ROWID;COMMIT;
 --============================================================================
@@ -31,6 +31,7 @@ CREATE TABLE gps_data
 	epy DOUBLE,
 	epv DOUBLE,
     alt DOUBLE,
+	PRIMARY KEY(session_id, timestamp),
 	FOREIGN KEY(session_id) REFERENCES sessions(id)
-);COMMIT;
+) WITHOUT ROWID;COMMIT;
 --============================================================================
\ No newline at end of file
@@ -31,6 +31,7 @@ CREATE TABLE imu_data
 	x_gyro DOUBLE,
 	y_gyro DOUBLE,	
 	z_gyro DOUBLE,
+	PRIMARY KEY(session_id, timestamp),
 	FOREIGN KEY(session_id) REFERENCES sessions(id)
-);COMMIT;
+) WITHOUT ROWID;COMMIT;
 --============================================================================
@@ -27,6 +27,7 @@ CREATE TABLE session_info
 	duration DOUBLE,
 	max_speed DOUBLE,
 	num_data_samples INTEGER,
+	distance DOUBLE,          -- meters, integrated from GPS speed
 	FOREIGN KEY(session_id) REFERENCES sessions(id)
 );COMMIT;
 --============================================================================
\ No newline at end of file
@@ -38,6 +38,7 @@ CREATE TABLE tire_data
 	rr_sensor_battery integer,
 
 
+	PRIMARY KEY(session_id, timestamp),
 	FOREIGN KEY(session_id) REFERENCES sessions(id)
-);COMMIT;
+) WITHOUT ROWID;COMMIT;
 --============================================================================